@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# on-disk cache of stylesheets, images and fonts fetched while rendering pages to PDF
+# see https://github.com/deftio/simple-py-crawlbot
+
+import os
+import json
+import hashlib
+from pathlib import Path
+
+CACHED_SCHEMES = ("http://", "https://")
+
+class AssetCache:
+    """A WeasyPrint url_fetcher that keeps every remote asset it fetches.
+
+    Crawled pages from one site mostly link the same stylesheets, images and fonts, so each is
+    fetched once and then served from memory (within a process) or from cache_dir (across
+    processes and runs). Only http(s) URLs are cached; file: and data: URLs go straight to the
+    wrapped fetcher. Failed fetches are remembered for the rest of the process so a missing
+    asset does not cost a round trip per page. With offline set the network is never used:
+    assets missing from the cache fail, and WeasyPrint renders the page without them.
+    Entries do not expire; delete cache_dir to refetch everything.
+    """
+
+    def __init__(self, fetcher, cache_dir=None, offline=False):
+        self.fetcher = fetcher
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.offline = offline
+        self.memory = {}
+        self.failed = {}
+        self.hits = 0
+        self.fetches = 0
+
+    def _entry(self, url):
+        digest = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return self.cache_dir / digest[:2] / digest
+
+    def _load(self, url):
+        if not self.cache_dir:
+            return None
+        entry = self._entry(url)
+        try:
+            with open(f"{entry}.json", 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(f"{entry}.body", 'rb') as f:
+                body = f.read()
+        except (OSError, ValueError):
+            return None
+        return dict(meta, string=body)
+
+    def _store(self, url, result):
+        if not self.cache_dir:
+            return
+        entry = self._entry(url)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Body first, metadata last: an entry only counts once its .json exists
+        for suffix, data in ((".body", result["string"]),
+                             (".json", json.dumps({k: v for k, v in result.items() if k != "string"}).encode('utf-8'))):
+            tmp_file = f"{entry}{suffix}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_file, f"{entry}{suffix}")
+
+    def __call__(self, url, *args, **kwargs):
+        if not url.startswith(CACHED_SCHEMES):
+            return self.fetcher(url, *args, **kwargs)
+        if url in self.memory:
+            self.hits += 1
+            return dict(self.memory[url])
+        if url in self.failed:
+            raise self.failed[url]
+        result = self._load(url)
+        if result is not None:
+            self.hits += 1
+        elif self.offline:
+            self.failed[url] = ValueError(f"Not in the asset cache (offline): {url}")
+            raise self.failed[url]
+        else:
+            try:
+                fetched = self.fetcher(url, *args, **kwargs)
+            except Exception as e:
+                self.failed[url] = e
+                raise
+            self.fetches += 1
+            if "file_obj" in fetched:
+                with fetched.pop("file_obj") as file_obj:
+                    fetched["string"] = file_obj.read()
+            if isinstance(fetched.get("string"), str):
+                fetched["string"] = fetched["string"].encode(fetched.get("encoding") or 'utf-8')
+                fetched["encoding"] = fetched.get("encoding") or 'utf-8'
+            result = {k: v for k, v in fetched.items() if k == "string" or isinstance(v, (str, int, float, bool, type(None)))}
+            self._store(url, result)
+        self.memory[url] = result
+        return dict(result)
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+# offline crawl benchmark: serves a synthetic site locally and measures the crawlers against it
+# see https://github.com/deftio/simple-py-crawlbot
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TARGETS = ("crawler", "spycrawl")
+
+WORDS = ("crawl index render parse clean write page link site frontier queue browser "
+         "document section content heading paragraph archive summary metric latency").split()
+
+class SyntheticSite:
+    """A deterministic generated website: the same settings always produce the same pages and links."""
+
+    def __init__(self, pages=100, fanout=5, page_kb=20, js_ratio=0.1, slow_ratio=0.05, slow_delay=0.5, seed=1234):
+        self.pages = pages
+        self.fanout = fanout
+        self.page_kb = page_kb
+        self.js_ratio = js_ratio
+        self.slow_ratio = slow_ratio
+        self.slow_delay = slow_delay
+        self.seed = seed
+
+    def config(self):
+        return {
+            'pages': self.pages,
+            'fanout': self.fanout,
+            'page_kb': self.page_kb,
+            'js_ratio': self.js_ratio,
+            'slow_ratio': self.slow_ratio,
+            'slow_delay': self.slow_delay,
+            'seed': self.seed
+        }
+
+    def _rng(self, n):
+        return random.Random(self.seed * 1000003 + n)
+
+    def is_js(self, n):
+        return n != 0 and self._rng(n).random() < self.js_ratio
+
+    def is_slow(self, n):
+        rng = self._rng(n)
+        rng.random()
+        return n != 0 and rng.random() < self.slow_ratio
+
+    def links(self, n):
+        """Outgoing links of page n; the n+1 link keeps every page reachable from the start page."""
+        rng = self._rng(n)
+        targets = {(n + 1) % self.pages}
+        targets.update(rng.randrange(self.pages) for _ in range(self.fanout - 1))
+        targets.discard(n)
+        return sorted(targets)
+
+    def render(self, n):
+        rng = self._rng(n)
+        paragraphs = []
+        size = 0
+        while size < self.page_kb * 1024:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(80))
+            paragraphs.append(f"<p>{paragraph}</p>")
+            size += len(paragraph) + 7
+        links = "".join(f'<li><a href="/page/{target}.html">Page {target}</a></li>' for target in self.links(n))
+
+        if self.is_js(n):
+            # Links only exist after the script runs, so a crawler must render the page to find them
+            body = (f'<div id="app"></div><script>document.getElementById("app").innerHTML = '
+                    f'{json.dumps("<ul>" + links + "</ul>")};</script>')
+        else:
+            body = f"<ul>{links}</ul>"
+        return (f"<!DOCTYPE html><html><head><title>Synthetic page {n}</title>"
+                f"<style>body {{ font-family: sans-serif; }}</style></head>"
+                f"<body><h1>Synthetic page {n}</h1>{body}{''.join(paragraphs)}</body></html>")
+
+def make_handler(site):
+    class SyntheticSiteHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path in ('/', '/index.html'):
+                n = 0
+            elif path.startswith('/page/') and path.endswith('.html'):
+                try:
+                    n = int(path[len('/page/'):-len('.html')])
+                except ValueError:
+                    n = -1
+            else:
+                n = -1
+            if not 0 <= n < site.pages:
+                self.send_error(404)
+                return
+            if site.is_slow(n):
+                time.sleep(site.slow_delay)
+            body = site.render(n).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return SyntheticSiteHandler
+
+def serve_site(site, host='127.0.0.1', port=0):
+    """Start serving the synthetic site in a background thread and return the server."""
+    server = ThreadingHTTPServer((host, port), make_handler(site))
+    thread = threading.Thread(target=server.serve_forever, name="synthetic-site", daemon=True)
+    thread.start()
+    return server
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """Nearest-rank percentiles of a list of numbers, plus the max."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+    result = {}
+    for point in points:
+        rank = max(1, -(-point * len(ordered) // 100))
+        result[f"p{point}"] = round(ordered[rank - 1], 4)
+    result['max'] = round(ordered[-1], 4)
+    return result
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its waited-for children (ru_maxrss is KB on Linux, bytes on macOS)."""
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return {
+        'self': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        'children': round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)
+    }
+
+def run_target(target, url, output_dir, max_links, clean):
+    """Crawl the served site with one crawler implementation and return its measurements."""
+    start = time.perf_counter()
+    if target == 'crawler':
+        import crawler
+        pages = crawler.crawl_site(url, output_dir, False, clean, max_links)
+    else:
+        import spycrawl
+        session = spycrawl.crawl_manager.create_session(url)
+        pages = spycrawl.crawl_site(url, output_dir, False, clean, max_links, session.id)['pages']
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for page in pages:
+        for stage, seconds in page.get('timings', {}).items():
+            stages.setdefault(stage, []).append(seconds)
+    total_bytes = sum(os.path.getsize(page['file_path']) for page in pages if os.path.exists(page['file_path']))
+    return {
+        'target': target,
+        'pages': len(pages),
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(len(pages) / elapsed, 3) if elapsed else None,
+        'bytes_written': total_bytes,
+        'latency': percentiles(stages.get('total', [])),
+        'stages_p50': {stage: percentiles(values)['p50'] for stage, values in stages.items() if stage != 'total'},
+        'peak_rss_mb': peak_rss_mb()
+    }
+
+def run_isolated(target, url, max_links, clean):
+    """Run one target in a fresh interpreter so peak RSS is not shared between targets."""
+    with tempfile.TemporaryDirectory(prefix='spycrawl-bench-') as workdir:
+        command = [sys.executable, os.path.abspath(__file__), '--run-one', target, '--url', url,
+                   '--output_dir', os.path.join(workdir, 'output')]
+        if max_links:
+            command += ['--max_links', str(max_links)]
+        if clean:
+            command.append('--clean')
+        # Run from the temp dir so spycrawl's logs and crawls.db do not touch the working tree
+        completed = subprocess.run(command, cwd=workdir, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(f"Benchmark of {target} failed:\n{completed.stderr[-2000:]}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(previous, current):
+    """Print pages/sec and p50 latency against an earlier result file."""
+    before = {result['target']: result for result in previous.get('results', [])}
+    for result in current['results']:
+        old = before.get(result['target'])
+        if not old:
+            continue
+        for key, new_value, old_value in (
+            ('pages/sec', result['pages_per_sec'], old['pages_per_sec']),
+            ('p50 latency', result['latency'].get('p50'), old['latency'].get('p50')),
+        ):
+            if new_value and old_value:
+                change = (new_value - old_value) / old_value * 100
+                print(f"{result['target']:>9} {key:>12}: {old_value} -> {new_value} ({change:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crawlers against a local synthetic site.")
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS), help="Crawler implementations to benchmark")
+    parser.add_argument('--pages', type=int, default=100, help="Number of pages in the synthetic site")
+    parser.add_argument('--fanout', type=int, default=5, help="Links per page")
+    parser.add_argument('--page_kb', type=int, default=20, help="Approximate size of each page in KB")
+    parser.add_argument('--js_ratio', type=float, default=0.1, help="Fraction of pages whose links are rendered by JavaScript")
+    parser.add_argument('--slow_ratio', type=float, default=0.05, help="Fraction of pages served with an artificial delay")
+    parser.add_argument('--slow_delay', type=float, default=0.5, help="Delay in seconds for slow pages")
+    parser.add_argument('--seed', type=int, default=1234, help="Seed for the generated site")
+    parser.add_argument('--max_links', type=int, help="Maximum number of links to crawl, crawls the whole site if omitted")
+    parser.add_argument('--clean', action='store_true', help="Clean HTML while crawling")
+    parser.add_argument('--results_dir', default='benchmark_results', help="Directory where JSON results are saved")
+    parser.add_argument('--compare', help="Earlier result file to compare against")
+    parser.add_argument('--serve', action='store_true', help="Only serve the synthetic site until interrupted")
+    # Internal: run a single target in this process and print its result as JSON
+    parser.add_argument('--run-one', choices=TARGETS, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    parser.add_argument('--output_dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        result = run_target(args.run_one, args.url, args.output_dir, args.max_links, args.clean)
+        print(json.dumps(result))
+        return
+
+    site = SyntheticSite(args.pages, args.fanout, args.page_kb, args.js_ratio, args.slow_ratio, args.slow_delay, args.seed)
+    server = serve_site(site)
+    url = f"http://127.0.0.1:{server.server_address[1]}/"
+
+    if args.serve:
+        print(f"Serving synthetic site at {url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    report = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'site': site.config(),
+        'max_links': args.max_links,
+        'clean': args.clean,
+        'results': []
+    }
+    try:
+        for target in args.targets:
+            print(f"Benchmarking {target} against {url} ...")
+            result = run_isolated(target, url, args.max_links, args.clean)
+            report['results'].append(result)
+            print(f"  {result['pages']} pages in {result['seconds']}s ({result['pages_per_sec']} pages/sec), "
+                  f"p50 {result['latency'].get('p50')}s, p99 {result['latency'].get('p99')}s, "
+                  f"peak RSS {result['peak_rss_mb']['self']} MB (+{result['peak_rss_mb']['children']} MB children)")
+    finally:
+        server.shutdown()
+
+    results_dir = Path(args.results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    results_file = results_dir / f"crawl-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    results_file.write_text(json.dumps(report, indent=2), encoding='utf-8')
+    print(f"Results saved to {results_file}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(json.load(f), report)
+
+if __name__ == "__main__":
+    main()
@@ -4,11 +4,21 @@
 
 import os
 import sys
+import codecs
+import time
 import logging
 from pathlib import Path
-import yaml
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from html.parser import HTMLParser
 from bs4 import BeautifulSoup, NavigableString, Comment
+from bs4.builder import HTMLTreeBuilder
+from bs4.dammit import EntitySubstitution
 import argparse
+from structured_io import (OUTPUT_FORMATS, CORPUS_FILENAME, JsonLinesWriter, check_format, copy_jsonl_records,
+                           output_path_for, write_structured)
+from manifest import Manifest
+from segment_store import find_sources, open_source
 
 # Configure logging
 def setup_logging():
@@ -42,6 +52,12 @@ def setup_logging():
 # Initialize logging
 logger = setup_logging()
 
+EXTRACTORS = ("soup", "stream")
+SKIPPED_TAGS = ("script", "style", "link")
+STREAM_CHUNK_SIZE = 64 * 1024
+# Elements html.parser closes at their start tag (<br>, <img>, ...), as BeautifulSoup does
+EMPTY_ELEMENT_TAGS = frozenset(HTMLTreeBuilder.empty_element_tags)
+
 def clean_html(html_content):
     """Remove script and style elements from HTML."""
     soup = BeautifulSoup(html_content, 'html.parser')
@@ -92,59 +108,329 @@ def extract_text(element):
 
     return None  # If there's no text and no significant children, return None
 
+def _flatten_strings(items):
+    """Yield every string in a nested list of extracted text, in document order."""
+    stack = [iter(items)]
+    while stack:
+        for item in stack[-1]:
+            if isinstance(item, list):
+                stack.append(iter(item))
+                break
+            yield item
+        else:
+            stack.pop()
+
+class _TextTreeParser(HTMLParser):
+    """Builds extract_text's nested text from html.parser events, the way BeautifulSoup's
+    html.parser tree builder would build the tree, keeping only the open elements' text."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.stack = [("[document]", [])]
+        self.data = []
+        # Void elements closed at their start tag, counted by name; a later explicit end tag for one is ignored
+        self.closed_empty = Counter()
+
+    def _add(self, text):
+        text = clean_text(text)
+        if text and should_include_text(text):
+            self.stack[-1][1].append(text)
+
+    def _end_data(self):
+        if self.data:
+            self._add("".join(self.data))
+            self.data = []
+
+    def _pop(self):
+        name, items = self.stack.pop()
+        if name in SKIPPED_TAGS:
+            result = None
+        elif name == "span":
+            result = " ".join(_flatten_strings(items)) if items else None
+        elif len(items) == 1 and isinstance(items[0], str):
+            result = items[0]
+        else:
+            result = items
+        if result:
+            self.stack[-1][1].append(result)
+
+    def handle_starttag(self, name, attrs, empty_element=True):
+        self._end_data()
+        self.stack.append((name, []))
+        if empty_element and name in EMPTY_ELEMENT_TAGS:
+            self._pop()
+            self.closed_empty[name] += 1
+
+    def handle_startendtag(self, name, attrs):
+        self.handle_starttag(name, attrs, empty_element=False)
+        self.handle_endtag(name)
+
+    def handle_endtag(self, name):
+        if self.closed_empty[name]:
+            self.closed_empty[name] -= 1
+            return
+        self._end_data()
+        # Close every element up to the most recent open one of that name; ignore a stray end tag
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth][0] == name:
+                while len(self.stack) > depth:
+                    self._pop()
+                break
+
+    def handle_data(self, data):
+        self.data.append(data)
+
+    def handle_charref(self, name):
+        code = int(name.lstrip("xX"), 16) if name[:1] in "xX" else int(name)
+        data = None
+        if code < 256:
+            # Pages often mean Windows-1252 when they write e.g. &#147;
+            try:
+                data = bytes([code]).decode("windows-1252")
+            except UnicodeDecodeError:
+                pass
+        if not data:
+            try:
+                data = chr(code)
+            except (ValueError, OverflowError):
+                pass
+        self.handle_data(data or "\N{REPLACEMENT CHARACTER}")
+
+    def handle_entityref(self, name):
+        character = EntitySubstitution.HTML_ENTITY_TO_CHARACTER.get(name)
+        self.handle_data(character if character is not None else f"&{name}")
+
+    def _handle_string(self, text):
+        # Comments, the doctype and other declarations are strings of their own
+        self._end_data()
+        self._add(text)
+
+    def handle_comment(self, data):
+        self._handle_string(data)
+
+    def handle_decl(self, data):
+        self._handle_string(data[len("DOCTYPE "):])
+
+    def unknown_decl(self, data):
+        self._handle_string(data[len("CDATA["):] if data.upper().startswith("CDATA[") else data)
+
+    def handle_pi(self, data):
+        self._handle_string(data)
+
+    def result(self):
+        self._end_data()
+        while len(self.stack) > 1:
+            self._pop()
+        items = self.stack[0][1]
+        if len(items) == 1 and isinstance(items[0], str):
+            return items[0]
+        return items
+
+def extract_text_streaming(source):
+    """Extract the same nested text as extract_text(clean_html(...)), without building a DOM.
+
+    The file is decoded and fed to html.parser in chunks, and its elements are nested and closed
+    exactly as BeautifulSoup's html.parser tree builder would, so the output matches the soup
+    extractor's. Each element is reduced to its text as soon as it ends, so memory stays
+    proportional to the output rather than the page, and there is no recursion to exhaust on
+    deeply nested markup. (One difference: a span holding several blocks is joined into one
+    string here, where extract_text fails.) `source` is a filename or binary file object.
+    """
+    f = source if hasattr(source, 'read') else open(source, 'rb')
+    try:
+        decoder = codecs.getincrementaldecoder('utf-8')()
+        parser = _TextTreeParser()
+        while True:
+            chunk = f.read(STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            parser.feed(decoder.decode(chunk))
+        parser.feed(decoder.decode(b"", final=True))
+        parser.close()
+    finally:
+        if f is not source:
+            f.close()
+    return parser.result()
+
 def read_html_file(filepath):
-    """Read an HTML file and return its content."""
-    with open(filepath, 'r', encoding='utf-8') as file:
-        html_content = file.read()
+    """Read an HTML file (or a page stored in a segment store) and return its content."""
+    with open_source(filepath) as file:
+        html_content = file.read().decode('utf-8')
     return html_content
 
 def write_yaml(data, output_filepath):
-    """Write data to a YAML file."""
-    with open(output_filepath, 'w', encoding='utf-8') as file:
-        yaml.dump(data, file, allow_unicode=True, default_flow_style=False)
+    """Write data to a YAML file (with libyaml's C emitter when available)."""
+    write_structured(data, output_filepath, "yaml")
+
+def extract_html_file(html_file, extractor="soup"):
+    """Extract the nested text of one HTML file with the selected extractor."""
+    if extractor == "stream":
+        with open_source(html_file) as source:
+            return extract_text_streaming(source)
+    html_content = read_html_file(html_file)
+    soup = clean_html(html_content)
+    return extract_text(soup)
+
+def process_html_file(html_file, output_dir, extractor="soup", output_format="yaml"):
+    """Convert one HTML file to a structured file. Returns the output path, or None if the page has no text."""
+    logger.info(f"Processing file: {html_file}")
+    text_tree = extract_html_file(html_file, extractor)
+    if not text_tree:
+        return None
+    output_path = output_path_for(html_file, output_dir, output_format)
+    write_structured(text_tree, output_path, output_format)
+    logger.info(f"Processed {html_file} to {output_path}")
+    return output_path
+
+def process_html_chunk(html_files, output_dir, extractor="soup", output_format="yaml"):
+    """Process a chunk of files, returning (file, output_path, error, content) for each instead of raising.
+
+    For the jsonl corpus format nothing is written here; the extracted content is returned so a
+    single writer in the parent process can append it. This is the unit of work sent to pool
+    workers, so it must stay a module-level function.
+    """
+    results = []
+    for html_file in html_files:
+        try:
+            if output_format == "jsonl":
+                logger.info(f"Processing file: {html_file}")
+                text_tree = extract_html_file(html_file, extractor)
+                results.append((str(html_file), None, None, text_tree or None))
+            else:
+                results.append((str(html_file), process_html_file(html_file, output_dir, extractor, output_format), None, None))
+        except Exception as e:
+            logger.error(f"Error processing file {html_file}: {str(e)}")
+            results.append((str(html_file), None, f"{type(e).__name__}: {e}", None))
+    return results
+
+def summarize_results(results, elapsed, max_errors=100):
+    """Roll per-file outcomes up into counts, error types and the first few failures."""
+    failures = [(html_file, error) for html_file, _, error, _ in results if error]
+    return {
+        "total": len(results),
+        "processed": sum(1 for _, output_path, error, _ in results if output_path and not error),
+        "empty": sum(1 for _, output_path, error, _ in results if not output_path and not error),
+        "failed": len(failures),
+        "error_types": dict(Counter(error.split(':', 1)[0] for _, error in failures)),
+        "errors": [{"file": html_file, "error": error} for html_file, error in failures[:max_errors]],
+        "seconds": round(elapsed, 3)
+    }
+
+def process_html_files(input_dir, output_dir, workers=1, chunk_size=64, extractor="soup", output_format="yaml", force=False):
+    """Process all HTML files in the specified directory, converting them to structured text files.
 
-def process_html_files(input_dir, output_dir):
-    """Process all HTML files in the specified directory, converting them to structured YAML files."""
+    With workers > 1 the files are split into chunks of chunk_size and parsed in a process pool;
+    workers <= 0 uses every CPU. extractor selects BeautifulSoup ("soup") or the bounded-memory
+    streaming extractor ("stream"), which writes the same output. output_format is yaml, json or msgpack (one file per page) or
+    jsonl (a single corpus.jsonl). A manifest in output_dir lets unchanged files be skipped and
+    outputs of deleted files be removed on the next run; force reprocesses everything.
+    input_dir may also be a segment store written by the crawlers (see segment_store.py).
+    Returns a summary of processed, skipped, removed, empty and failed files.
+    """
     try:
         logger.info(f"Starting HTML processing from {input_dir} to {output_dir}")
+        started = time.perf_counter()
+        
+        if extractor not in EXTRACTORS:
+            raise ValueError(f"Unknown extractor '{extractor}', expected one of: {', '.join(EXTRACTORS)}")
+        check_format(output_format)
         
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
         logger.info(f"Created output directory: {output_dir}")
         
         input_path = Path(input_dir)
-        html_files = list(input_path.glob("**/*.html"))
+        html_files = find_sources(input_path, ".html")
         logger.info(f"Found {len(html_files)} HTML files to process")
         
-        for html_file in html_files:
-            try:
-                logger.info(f"Processing file: {html_file}")
-                
-                html_path = html_file
-                output_path = os.path.join(output_dir, html_file.name)
-                html_content = read_html_file(html_path)
-                soup = clean_html(html_content)
-                text_tree = extract_text(soup)
-                if text_tree:
-                    write_yaml(text_tree, output_path)
-                    logger.info(f"Processed {html_file} to {output_path}")
-                
-            except Exception as e:
-                logger.error(f"Error processing file {html_file}: {str(e)}")
-                continue
+        if workers is not None and workers <= 0:
+            workers = os.cpu_count() or 1
+        chunk_size = max(1, chunk_size)
+        
+        manifest = Manifest(output_dir, "clean", {
+            "input_dir": str(input_path.resolve()),
+            "extractor": extractor,
+            "output_format": output_format
+        }, force)
+        corpus_path = Path(output_dir) / CORPUS_FILENAME
+        if output_format == "jsonl" and not corpus_path.exists():
+            manifest.entries = {}
+        sources = {str(html_file.relative_to(input_path)): html_file for html_file in html_files}
+        removed = manifest.prune(sources)
+        pending = [html_file for key, html_file in sources.items() if not manifest.is_current(key, html_file)]
+        skipped = len(html_files) - len(pending)
+        if skipped or removed:
+            logger.info(f"Skipping {skipped} unchanged files, removed outputs of {len(removed)} deleted files")
+        html_files = pending
+        
+        corpus = None
+        if output_format == "jsonl" and (html_files or removed):
+            # Rewrite the corpus: keep records of unchanged pages, then append the re-extracted ones
+            corpus = JsonLinesWriter(corpus_path.with_name(CORPUS_FILENAME + ".tmp"))
+            pending_sources = {str(html_file.relative_to(input_path)) for html_file in html_files}
+            copy_jsonl_records(corpus_path, corpus, set(sources) - pending_sources)
+        results = []
+        
+        def collect(chunk_results):
+            for html_file, output_path, error, content in chunk_results:
+                key = str(Path(html_file).relative_to(input_path))
+                if corpus and content:
+                    corpus.write(key, content)
+                    output_path = str(corpus_path)
+                if error:
+                    manifest.forget(key)
+                else:
+                    manifest.record(key, html_file, [output_path] if output_path and not corpus else [])
+                results.append((html_file, output_path, error, None))
+        
+        try:
+            if not workers or workers == 1 or len(html_files) <= chunk_size:
+                collect(process_html_chunk(html_files, output_dir, extractor, output_format))
+            else:
+                logger.info(f"Processing in {workers} worker processes, {chunk_size} files per chunk")
+                chunks = [html_files[i:i + chunk_size] for i in range(0, len(html_files), chunk_size)]
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(process_html_chunk, chunk, output_dir, extractor, output_format): chunk
+                               for chunk in chunks}
+                    for future in as_completed(futures):
+                        try:
+                            collect(future.result())
+                        except Exception as e:
+                            # A worker died (e.g. killed by the OS); count the whole chunk as failed
+                            logger.error(f"Worker failed on a chunk of {len(futures[future])} files: {str(e)}")
+                            collect((str(html_file), None, f"{type(e).__name__}: {e}", None) for html_file in futures[future])
+        finally:
+            if corpus:
+                corpus.close()
+                os.replace(corpus.filename, corpus_path)
+            manifest.save()
         
-        logger.info("HTML processing completed")
+        summary = summarize_results(results, time.perf_counter() - started)
+        summary["skipped"] = skipped
+        summary["removed"] = len(removed)
+        logger.info(f"HTML processing completed: {summary['processed']} processed, {summary['skipped']} unchanged, "
+                    f"{summary['empty']} empty, {summary['failed']} failed in {summary['seconds']}s")
+        return summary
         
     except Exception as e:
         logger.error(f"Error in process_html_files: {str(e)}")
         raise
 
 def main():
-    parser = argparse.ArgumentParser(description="Convert HTML files to structured YAML preserving cleaned text.")
+    parser = argparse.ArgumentParser(description="Convert HTML files to structured YAML (or JSON, JSON Lines, MessagePack) preserving cleaned text.")
     parser.add_argument('-input_dir', help="Directory containing HTML files to process.")
-    parser.add_argument('-output_dir', help="Directory where YAML files will be stored.")
+    parser.add_argument('-output_dir', help="Directory where the structured files will be stored.")
+    parser.add_argument('-format', dest='output_format', choices=OUTPUT_FORMATS, default="yaml", help="Output format (default yaml; jsonl writes a single corpus.jsonl).")
+    parser.add_argument('-force', action='store_true', help="Reprocess every file, ignoring the manifest of previous runs.")
+    parser.add_argument('-workers', type=int, default=1, help="Worker processes to parse with (0 = all CPUs, default 1).")
+    parser.add_argument('-chunk_size', type=int, default=64, help="Files sent to a worker at a time.")
+    parser.add_argument('-extractor', choices=EXTRACTORS, default="soup", help="Text extractor: BeautifulSoup tree (soup) or bounded-memory streaming with the same output (stream).")
     args = parser.parse_args()
-    process_html_files(args.input_dir, args.output_dir)
+    summary = process_html_files(args.input_dir, args.output_dir, args.workers, args.chunk_size, args.extractor, args.output_format, args.force)
+    print(f"{summary['processed']} processed, {summary['skipped']} unchanged, {summary['removed']} removed, "
+          f"{summary['empty']} empty, {summary['failed']} failed")
+    for failure in summary['errors']:
+        print(f"  FAILED {failure['file']}: {failure['error']}")
 
 if __name__ == '__main__':
     main()
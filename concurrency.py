@@ -0,0 +1,329 @@
+#!/usr/bin/env python3
+# AIMD concurrency control for crawling with several browsers at once
+# see https://github.com/deftio/simple-py-crawlbot
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import ExitStack
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+# Rough resident size of one headless Chrome; no browser is added unless this much memory is free
+BROWSER_MB = 300
+# Returned by next_url() to end the crawl (page limit reached, crawl stopped)
+STOP = object()
+# Returned by next_url() when nothing can be fetched now but work is due later (a retry, a paused host)
+WAIT = object()
+# Passed to done() as the error of a URL that admit() refused
+SKIP = object()
+
+def load_per_cpu():
+    """1-minute load average per CPU, or None where the platform has no load average."""
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return None
+
+def free_memory_mb():
+    """MemAvailable from /proc/meminfo in MB, or None if it cannot be read (not Linux)."""
+    try:
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+class AimdController:
+    """Additive-increase / multiplicative-decrease limits on how many pages are fetched at once.
+
+    Each host has a limit and the crawl has a global one; a page is fetched only while both
+    have room. Every `interval` seconds a host with at least min_samples finished pages is
+    judged on them: if the error rate is at most max_error_rate and the median latency is within
+    latency_factor of the host's baseline, its limit grows by one (up to max_per_host); otherwise
+    it is multiplied by `decrease`. The baseline is the best median seen, raised by
+    baseline_drift per window, so a site that has become slower for good is not held at one page
+    forever. The global limit never exceeds what the hosts together allow; it grows by one
+    while it is what holds the crawl back and the machine has headroom, and is multiplied by
+    `decrease` when the load average per CPU exceeds cpu_limit or free memory drops below
+    min_free_mb, so browsers are not started until the box swaps. A new browser also needs
+    BROWSER_MB of free memory on top of min_free_mb. All limits start at min_workers and stay
+    between min_workers and max_workers. Every change is kept in history (newest last).
+    """
+
+    def __init__(self, max_workers=1, min_workers=1, max_per_host=None, interval=5.0, min_samples=3,
+                 latency_factor=2.0, baseline_drift=0.1, max_error_rate=0.1, decrease=0.5, cpu_limit=0.9,
+                 min_free_mb=1024, history_size=200):
+        if max_workers < 1 or not 1 <= min_workers <= max_workers:
+            raise ValueError(f"Invalid worker counts: min_workers={min_workers}, max_workers={max_workers}")
+        self.max_workers = max_workers
+        self.min_workers = min_workers
+        self.max_per_host = max_per_host or max_workers
+        self.interval = interval
+        self.min_samples = min_samples
+        self.latency_factor = latency_factor
+        self.baseline_drift = baseline_drift
+        self.max_error_rate = max_error_rate
+        self.decrease = decrease
+        self.cpu_limit = cpu_limit
+        self.min_free_mb = min_free_mb
+        self.limit = min_workers
+        self.host_limits = {}
+        self.active = {}
+        self.samples = {}
+        self.baseline = {}
+        self.history = deque(maxlen=history_size)
+        self.worker_errors = []
+        self.changes = 0
+        self.start = time.monotonic()
+        self.last_adjust = self.start
+        self.condition = threading.Condition()
+
+    def _host_limit(self, host):
+        return self.host_limits.setdefault(host, min(self.min_workers, self.max_per_host))
+
+    def try_acquire(self, host):
+        """Take a page slot on host if it has room; False if it is at its limit."""
+        with self.condition:
+            if self.active.get(host, 0) >= self._host_limit(host):
+                return False
+            self.active[host] = self.active.get(host, 0) + 1
+            return True
+
+    def cancel(self, host):
+        """Give back a slot taken for a page that was not fetched after all; records no sample."""
+        with self.condition:
+            self.active[host] -= 1
+            self.condition.notify_all()
+
+    def release(self, host, latency, ok):
+        """Record a finished page (its latency in seconds, and whether it succeeded) and adjust the limits when due."""
+        with self.condition:
+            self.active[host] -= 1
+            self.samples.setdefault(host, []).append((latency, ok))
+            now = time.monotonic()
+            if now - self.last_adjust >= self.interval:
+                self._adjust(now)
+            self.condition.notify_all()
+
+    def worker_failed(self, index, error):
+        """Record a crawl worker that stopped (e.g. its browser would not start); the others carry on."""
+        with self.condition:
+            self.worker_errors.append({"worker": index, "error": f"{type(error).__name__}: {error}"})
+            self.changes += 1
+
+    def _record(self, now, target, previous, limit, reason, **measurements):
+        entry = {"seconds": round(now - self.start, 1), "target": target, "previous": previous, "limit": limit,
+                 "reason": reason}
+        entry.update({name: value for name, value in measurements.items() if value is not None})
+        self.history.append(entry)
+        self.changes += 1
+        logger.info(f"Concurrency for {target}: {previous} -> {limit} ({reason})")
+
+    def _shrink(self, limit):
+        return max(self.min_workers, int(limit * self.decrease))
+
+    def _adjust(self, now):
+        self.last_adjust = now
+        for host, samples in self.samples.items():
+            if len(samples) < self.min_samples:
+                continue
+            self.samples[host] = []
+            latencies = sorted(latency for latency, _ in samples)
+            median = latencies[len(latencies) // 2]
+            error_rate = sum(1 for _, ok in samples if not ok) / len(samples)
+            baseline = min(self.baseline.get(host, median), median)
+            self.baseline[host] = baseline * (1 + self.baseline_drift)
+            previous = self._host_limit(host)
+            if error_rate > self.max_error_rate:
+                limit, reason = self._shrink(previous), "errors"
+            elif median > baseline * self.latency_factor:
+                limit, reason = self._shrink(previous), "latency"
+            else:
+                limit, reason = min(previous + 1, self.max_per_host), "healthy"
+            if limit != previous:
+                self.host_limits[host] = limit
+                self._record(now, host, previous, limit, reason, latency_ms=round(median * 1000),
+                             error_rate=round(error_rate, 3))
+
+        load, free_mb = load_per_cpu(), free_memory_mb()
+        previous = self.limit
+        host_capacity = max(self.min_workers, sum(self.host_limits.values()))
+        if previous > host_capacity:
+            limit, reason = host_capacity, "hosts"
+        elif load is not None and load > self.cpu_limit:
+            limit, reason = self._shrink(previous), "cpu"
+        elif free_mb is not None and free_mb < self.min_free_mb:
+            limit, reason = self._shrink(previous), "memory"
+        elif previous < host_capacity and (free_mb is None or free_mb >= self.min_free_mb + BROWSER_MB):
+            # The hosts could take more pages than the global limit allows
+            limit, reason = min(previous + 1, self.max_workers), "headroom"
+        else:
+            limit = previous
+        if limit != previous:
+            self.limit = limit
+            self._record(now, "global", previous, limit, reason, load_per_cpu=load and round(load, 2),
+                         free_mb=free_mb)
+
+    def summary(self):
+        with self.condition:
+            return {
+                "limit": self.limit,
+                "max_workers": self.max_workers,
+                "host_limits": dict(self.host_limits),
+                "active": sum(self.active.values()),
+                "worker_errors": list(self.worker_errors),
+                "history": list(self.history)
+            }
+
+class WorkerPool:
+    """Fetch pages on up to controller.max_workers browsers at once, as many as its limit allows.
+
+    Worker 0 uses the caller's driver in the calling thread (so with one worker nothing runs in
+    another thread, and profilers see the whole crawl); the others are threads that open their
+    own browser with open_browser(), a context manager yielding a driver, the first time the
+    limit lets them work. Worker n only takes a page while n is below the global limit.
+
+    run() takes three callables. next_url() returns the next URL, None if nothing is queued at
+    the moment, WAIT if nothing can be fetched yet but something will be later, or STOP.
+    fetch(driver, url) renders and saves one page and returns its page record (None if it
+    failed) and its links; it runs without the lock, so it must take `lock` itself around
+    anything that touches shared state. done(url, page, links, error) records the outcome and
+    queues the links; error is the exception fetch raised, or None. next_url and done are
+    called holding the lock, so they must not wait on the network. The optional admit(url)
+    runs in the worker without the lock just before the page is fetched (e.g. a HEAD check); a
+    URL it refuses goes to done() with error SKIP, and one it raises on with that exception.
+
+    A URL is only handed to a worker once its host has a free slot. A URL whose host is at its
+    limit is held back (up to max_deferred of them) while workers take URLs of other hosts, so
+    no worker sits idle behind a busy host. The crawl ends at STOP, or when nothing is queued,
+    held back or in flight. A worker thread that fails is recorded with
+    controller.worker_failed() and the others carry on; run() raises if worker 0 fails.
+    """
+
+    def __init__(self, controller, open_browser):
+        self.controller = controller
+        self.open_browser = open_browser
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.in_flight = 0
+        self.stopping = False
+        self.errors = []
+        self.deferred = {}
+        self.max_deferred = 4 * controller.max_workers
+
+    def _take_deferred(self):
+        for host, urls in self.deferred.items():
+            if self.controller.try_acquire(host):
+                url = urls.popleft()
+                if not urls:
+                    del self.deferred[host]
+                return url
+        return None
+
+    def _next(self, index, next_url):
+        """The next URL for worker index, with a slot on its host taken; None when the crawl ends."""
+        with self.changed:
+            while not self.stopping:
+                if index < self.controller.limit:
+                    url = self._take_deferred()
+                    if url is not None:
+                        self.in_flight += 1
+                        return url
+                    if sum(len(urls) for urls in self.deferred.values()) < self.max_deferred:
+                        url = next_url()
+                        if url is STOP:
+                            break
+                        if url is not None and url is not WAIT:
+                            host = urlsplit(url).netloc
+                            if self.controller.try_acquire(host):
+                                self.in_flight += 1
+                                return url
+                            # Its host is at its limit: hold the URL back and try another
+                            self.deferred.setdefault(host, deque()).append(url)
+                            continue
+                        if url is None and not self.in_flight and not self.deferred:
+                            break
+                # Woken when a page finishes; the timeout picks up limit changes
+                self.changed.wait(timeout=1.0)
+            self.stopping = True
+            self.changed.notify_all()
+            return None
+
+    def _turn(self, index):
+        """Wait until worker index may work; False if the crawl ends first."""
+        with self.changed:
+            while not self.stopping and index >= self.controller.limit:
+                self.changed.wait(timeout=1.0)
+            return not self.stopping
+
+    def _work(self, index, driver, next_url, fetch, done, admit):
+        with ExitStack() as stack:
+            while True:
+                if driver is None:
+                    # Started before the worker takes a URL, so a browser that fails to start loses no page
+                    if not self._turn(index):
+                        return
+                    driver = stack.enter_context(self.open_browser())
+                url = self._next(index, next_url)
+                if url is None:
+                    return
+                page, links, error = None, (), None
+                host = urlsplit(url).netloc
+                try:
+                    try:
+                        admitted = not admit or admit(url)
+                    except Exception as e:
+                        # Recorded like a failed fetch; the host slot is still given back
+                        admitted, error = False, e
+                    if not admitted:
+                        self.controller.cancel(host)
+                        if error is None:
+                            error = SKIP
+                        continue
+                    started = time.monotonic()
+                    try:
+                        page, links = fetch(driver, url)
+                    except Exception as e:
+                        error = e
+                    finally:
+                        # The navigation time when the page has one, not the fixed render wait
+                        latency = time.monotonic() - started
+                        if page and 'fetch' in page.get('timings', {}):
+                            latency = page['timings']['fetch']
+                        self.controller.release(host, latency, page is not None)
+                finally:
+                    with self.changed:
+                        self.in_flight -= 1
+                        done(url, page, links, error)
+                        self.changed.notify_all()
+
+    def _thread(self, index, next_url, fetch, done, admit):
+        try:
+            self._work(index, None, next_url, fetch, done, admit)
+        except Exception as e:
+            logger.error(f"Crawl worker {index} failed: {e}")
+            self.controller.worker_failed(index, e)
+            with self.changed:
+                self.errors.append(e)
+                self.changed.notify_all()
+
+    def run(self, driver, next_url, fetch, done, admit=None):
+        threads = [threading.Thread(target=self._thread, args=(index, next_url, fetch, done, admit),
+                                    name=f"crawl-worker-{index}", daemon=True)
+                   for index in range(1, self.controller.max_workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            self._work(0, driver, next_url, fetch, done, admit)
+        finally:
+            with self.changed:
+                self.stopping = True
+                self.changed.notify_all()
+            for thread in threads:
+                thread.join()
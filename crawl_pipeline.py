@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# clean -> structured output -> PDF stages that process each crawled page as soon as it is saved
+# see https://github.com/deftio/simple-py-crawlbot
+
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+from clean_and_strip import EXTRACTORS, clean_html, extract_html_file, read_html_file
+from structured_io import write_structured
+from merge_docs_into_pdf import pdf_path_for, stream_merge_pdfs, write_html_pdf
+from segment_store import source_url
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_FORMATS = ("yaml", "json", "msgpack")
+
+# Tells a stage worker that nothing more is coming
+_DONE = object()
+
+def write_page(text_tree, output_file, output_format):
+    write_structured(text_tree, output_file, output_format)
+    return output_file
+
+def render_page(html_file, pdf_dir):
+    """Render a saved page without its scripts and stylesheets, as clean_html() leaves it."""
+    html_content = str(clean_html(read_html_file(html_file)))
+    # Relative links resolve against the stored page's URL, or the file's directory
+    base_url = source_url(html_file) or str(Path(html_file).resolve())
+    pdf_file = pdf_path_for(html_file, pdf_dir)
+    write_html_pdf(pdf_file, string=html_content, base_url=base_url)
+    return [str(pdf_file)]
+
+class PipelineStage:
+    """A bounded queue drained by a pool of worker threads.
+
+    task(page, value) returns the (function, args) that processes one item; its result is put on
+    the downstream stage or, for the last stage, handed to collect(index, page, result). put()
+    blocks while the queue is full, so a slow stage holds back the stages (and in the end the
+    crawl) feeding it instead of letting pending work pile up in memory. With a process pool the
+    threads hand each call to it, so CPU-bound stages are not serialised by the GIL, and a call
+    that takes longer than `timeout` seconds counts as failed while the thread moves on.
+    """
+
+    def __init__(self, name, task, workers=1, queue_size=32, pool=None, downstream=None, collect=None, timeout=None):
+        self.name = name
+        self.task = task
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.pool = pool
+        self.downstream = downstream
+        self.collect = collect
+        self.timeout = timeout
+        self.stats = {"processed": 0, "failed": 0, "timeouts": 0, "seconds": 0.0, "blocked_seconds": 0.0, "errors": []}
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._run, name=f"pipeline-{name}-{n}", daemon=True)
+                        for n in range(max(1, workers))]
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, item):
+        start = time.perf_counter()
+        self.queue.put(item)
+        with self.lock:
+            self.stats["blocked_seconds"] += time.perf_counter() - start
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is _DONE:
+                return
+            index, page, value = item
+            start = time.perf_counter()
+            result = error = None
+            timed_out = False
+            try:
+                function, args = self.task(page, value)
+                result = self.pool.submit(function, *args).result(self.timeout) if self.pool else function(*args)
+            except FutureTimeout:
+                # The call keeps its pool process until finish() stops the pool
+                timed_out = True
+                error = f"Timed out after {self.timeout}s"
+                logger.error(f"Pipeline {self.name} stage failed for {page['file_path']}: {error}")
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.error(f"Pipeline {self.name} stage failed for {page['file_path']}: {error}")
+            with self.lock:
+                self.stats["seconds"] += time.perf_counter() - start
+                if timed_out:
+                    self.stats["timeouts"] += 1
+                if error:
+                    self.stats["failed"] += 1
+                    if len(self.stats["errors"]) < 100:
+                        self.stats["errors"].append({"file": page['file_path'], "error": error})
+                else:
+                    self.stats["processed"] += 1
+            if not result:
+                continue
+            if self.downstream:
+                self.downstream.put((index, page, result))
+            elif self.collect:
+                self.collect(index, page, result)
+
+    def close(self):
+        """Wait for the queued work to finish, then close the stages downstream."""
+        for _ in self.threads:
+            self.queue.put(_DONE)
+        for thread in self.threads:
+            thread.join()
+        if self.downstream:
+            self.downstream.close()
+
+    def summary(self):
+        return dict(self.stats, seconds=round(self.stats["seconds"], 3),
+                    blocked_seconds=round(self.stats["blocked_seconds"], 3))
+
+class CrawlPipeline:
+    """Clean, write structured output and render a PDF for every page while the crawl is still running.
+
+    Outputs go next to the crawl output: <output_dir>_clean for the structured files and
+    <output_dir>_pdf for the per-page PDFs plus, once finish() is called, merged.pdf in crawl
+    order. Total time approaches that of the slowest stage instead of the sum of all stages.
+    Cleaning and rendering run in a pool of `workers` processes; a page that takes longer than
+    `timeout` seconds in either counts as failed, so a page that hangs the renderer does not
+    hold up the stage (and through it the crawl).
+    """
+
+    def __init__(self, output_dir, workers=1, queue_size=32, extractor="soup", output_format="yaml", pdf=True,
+                 timeout=120.0):
+        if extractor not in EXTRACTORS:
+            raise ValueError(f"Unknown extractor '{extractor}', expected one of: {', '.join(EXTRACTORS)}")
+        if output_format not in PIPELINE_FORMATS:
+            raise ValueError(f"Unknown pipeline format '{output_format}', expected one of: {', '.join(PIPELINE_FORMATS)}")
+        if workers < 1 or queue_size < 1:
+            # A queue of size 0 would be unbounded and let the crawl run ahead of the stages
+            raise ValueError("workers and queue_size must be at least 1")
+        output_path = Path(output_dir)
+        self.clean_dir = output_path.with_name(f"{output_path.name}_clean")
+        self.pdf_dir = output_path.with_name(f"{output_path.name}_pdf") if pdf else None
+        self.clean_dir.mkdir(parents=True, exist_ok=True)
+        if self.pdf_dir:
+            self.pdf_dir.mkdir(parents=True, exist_ok=True)
+        self.extractor = extractor
+        self.output_format = output_format
+        self.count = 0
+        self.pdf_files = {}
+        self.start = time.perf_counter()
+
+        # Parsing and rendering are CPU-bound and may hang; writing the structured file is not worth a process.
+        # Not fork: the crawl worker creating the pool runs crawl threads and Selenium, and a forked
+        # child can inherit a lock another thread held (see render_in_processes).
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if context.get_start_method() == 'forkserver':
+            context.set_forkserver_preload(['crawl_pipeline'])
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+        stages = [("clean", self._clean_task, workers, self.pool),
+                  ("structured", self._structured_task, 1, None)]
+        if self.pdf_dir:
+            stages.append(("pdf", self._render_task, workers, self.pool))
+        self.stages = []
+        downstream = None
+        for name, task, stage_workers, pool in reversed(stages):
+            collect = None if downstream else self._collect
+            downstream = PipelineStage(name, task, stage_workers, queue_size, pool, downstream, collect,
+                                       timeout if pool else None)
+            self.stages.insert(0, downstream)
+
+    def _clean_task(self, page, html_file):
+        return extract_html_file, (html_file, self.extractor)
+
+    def _structured_task(self, page, text_tree):
+        # Unlike clean_and_strip.py, YAML gets a .yaml suffix so the PDF stage can tell the format
+        output_file = self.clean_dir / Path(page['file_path']).with_suffix(f".{self.output_format}").name
+        return write_page, (text_tree, str(output_file), self.output_format)
+
+    def _render_task(self, page, structured_file):
+        # The PDF shows the page itself, not the structured text written before it
+        return render_page, (page['file_path'], str(self.pdf_dir))
+
+    def _collect(self, index, page, result):
+        if self.pdf_dir:
+            self.pdf_files[index] = (result, page.get('title'))
+
+    def submit(self, page):
+        """Queue a saved page (a page record from the crawler); blocks while the clean stage is full."""
+        # Only what the stages need, not the page's HTML
+        page = {'file_path': page['file_path'], 'title': str(page['title']) if page.get('title') else None}
+        self.stages[0].put((self.count, page, page['file_path']))
+        self.count += 1
+
+    def finish(self):
+        """Drain every stage, merge the page PDFs in crawl order and return a summary."""
+        try:
+            self.stages[0].close()
+        finally:
+            if any(stage.stats["timeouts"] for stage in self.stages):
+                # A timed-out call is still running; shutdown() alone would wait for it
+                processes = getattr(self.pool, "_processes", None) or {}
+                for process in list(processes.values()):
+                    process.kill()
+            self.pool.shutdown(cancel_futures=True)
+        summary = {
+            "pages": self.count,
+            "clean_dir": str(self.clean_dir),
+            "pdf_dir": str(self.pdf_dir) if self.pdf_dir else None,
+            "stages": {stage.name: stage.summary() for stage in self.stages},
+            "volumes": []
+        }
+        entries = []
+        for index in sorted(self.pdf_files):
+            pdf_files, title = self.pdf_files[index]
+            for pdf_file in pdf_files:
+                entries.append((pdf_file, title if title and len(pdf_files) == 1 else Path(pdf_file).stem))
+        if entries:
+            summary["volumes"] = stream_merge_pdfs(entries, self.pdf_dir / "merged.pdf")
+        summary["seconds"] = round(time.perf_counter() - self.start, 3)
+        logger.info(f"Pipeline finished {self.count} pages in {summary['seconds']}s: " +
+                    ", ".join(f"{name} {stats['processed']} ok/{stats['failed']} failed"
+                              for name, stats in summary["stages"].items()))
+        return summary
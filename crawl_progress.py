@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# streaming JSON Lines crawl summary and a live throughput line for crawler.py
+# see https://github.com/deftio/simple-py-crawlbot
+
+import sys
+import json
+import time
+from collections import deque
+
+class PageLog:
+    """Append one JSON line per saved page as the crawl goes, and keep only running totals.
+
+    Every line is flushed as it is written, so a crash loses at most the page being saved and
+    other tools can tail the file while the crawl runs. rollup() returns the compact totals
+    that replace the full page list in the final summary.
+    """
+
+    def __init__(self, jsonl_path):
+        self.jsonl_path = jsonl_path
+        self.file = open(jsonl_path, 'a', encoding='utf-8')
+        self.pages = 0
+        self.failed = 0
+        self.bytes = 0
+        self.stage_seconds = {}
+        self.start = time.perf_counter()
+
+    def add(self, page):
+        self.file.write(json.dumps(page) + "\n")
+        self.file.flush()
+        self.pages += 1
+        self.bytes += page.get('bytes', 0)
+        for stage, seconds in page.get('timings', {}).items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+    def add_failure(self):
+        self.failed += 1
+
+    def rollup(self):
+        seconds = time.perf_counter() - self.start
+        return {
+            'pages_file': self.jsonl_path,
+            'pages_saved': self.pages,
+            'pages_failed': self.failed,
+            'bytes_saved': self.bytes,
+            'seconds': round(seconds, 3),
+            'pages_per_sec': round(self.pages / seconds, 3) if seconds else None,
+            'bytes_per_sec': round(self.bytes / seconds) if seconds else None,
+            'stage_seconds': {stage: round(total, 3) for stage, total in self.stage_seconds.items()}
+        }
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def format_bytes(count):
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024 or unit == "GB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
+
+def format_duration(seconds):
+    if seconds is None:
+        return "--:--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+class ProgressMeter:
+    """One status line with pages/sec, bytes/sec, frontier size and ETA.
+
+    Rates cover the last `window` seconds so they follow the crawl's current speed rather than
+    its average. The ETA counts down to max_links when the crawl is capped, and otherwise to
+    the frontier running dry (an estimate: pages still to be found are not counted). On a
+    terminal the line is redrawn in place; otherwise a line is printed every `interval` seconds.
+    """
+
+    def __init__(self, max_links=None, stream=None, window=30.0, interval=2.0):
+        self.max_links = max_links
+        self.stream = stream or sys.stderr
+        self.window = window
+        self.interval = interval
+        self.interactive = self.stream.isatty()
+        self.samples = deque()
+        self.pages = 0
+        self.bytes = 0
+        self.last_print = 0.0
+        self.frontier_size = 0
+        self.url = ""
+
+    def rates(self, now):
+        while len(self.samples) > 1 and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+        if len(self.samples) < 2:
+            return None, None
+        (start, pages, size), (end, last_pages, last_size) = self.samples[0], self.samples[-1]
+        elapsed = end - start
+        if not elapsed:
+            return None, None
+        return (last_pages - pages) / elapsed, (last_size - size) / elapsed
+
+    def update(self, saved_bytes, frontier_size, url=""):
+        """Count one crawled page and redraw the status line."""
+        now = time.perf_counter()
+        self.pages += 1
+        self.bytes += saved_bytes
+        self.frontier_size = frontier_size
+        self.url = url
+        self.samples.append((now, self.pages, self.bytes))
+        if self.interactive or now - self.last_print >= self.interval:
+            self._draw(now)
+
+    def _draw(self, now):
+        self.last_print = now
+        pages_per_sec, bytes_per_sec = self.rates(now)
+        remaining = self.frontier_size if self.max_links is None else min(self.frontier_size, self.max_links - self.pages)
+        eta = remaining / pages_per_sec if pages_per_sec else None
+        line = (f"[{self.pages} pages | {pages_per_sec or 0:.2f} pages/s | {format_bytes(bytes_per_sec or 0)}/s | "
+                f"frontier {self.frontier_size} | ETA {format_duration(eta)}] {self.url}")
+        if self.interactive:
+            self.stream.write("\r\033[K" + line[:200])
+        else:
+            self.stream.write(line + "\n")
+        self.stream.flush()
+
+    def finish(self):
+        """Draw the final state and end the status line."""
+        if not self.pages:
+            return
+        if self.last_print != self.samples[-1][0]:
+            self._draw(self.samples[-1][0])
+        if self.interactive:
+            self.stream.write("\n")
+            self.stream.flush()
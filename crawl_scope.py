@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# crawl scope rules: include/exclude patterns, depth, extension and MIME prefilters, per-prefix limits
+# see https://github.com/deftio/simple-py-crawlbot
+
+import re
+import threading
+import requests
+from fnmatch import translate
+from posixpath import splitext
+from urllib.parse import urlsplit
+
+# Links to these are downloads, not pages; the browser would fetch them for nothing
+SKIPPED_EXTENSIONS = (".pdf", ".zip", ".gz", ".tgz", ".tar", ".rar", ".7z", ".exe", ".dmg", ".msi", ".iso", ".bin",
+                      ".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp", ".svg", ".ico", ".tif", ".tiff",
+                      ".mp3", ".mp4", ".m4a", ".wav", ".ogg", ".avi", ".mov", ".mkv", ".webm",
+                      ".css", ".js", ".json", ".xml", ".rss", ".woff", ".woff2", ".ttf", ".eot",
+                      ".doc", ".docx", ".xls", ".xlsx", ".ppt", ".pptx", ".csv")
+HTML_MIME_TYPES = ("text/html", "application/xhtml+xml")
+HEAD_TIMEOUT = 10
+
+def compile_patterns(patterns):
+    """One regex matching any of patterns: 're:<regex>' is used as is, anything else is a glob.
+
+    Globs are matched against the whole URL (so '*/logout*' or 'https://example.com/docs/*');
+    regexes are searched anywhere in it. None if there are no patterns.
+    """
+    parts = []
+    for pattern in patterns or ():
+        if pattern.startswith("re:"):
+            try:
+                # Checked on its own so the error names the pattern, not the combined regex
+                re.compile(pattern[3:])
+            except re.error as e:
+                raise ValueError(f"Invalid regex pattern '{pattern}': {e}")
+            parts.append(f"(?:{pattern[3:]})")
+        else:
+            parts.append(f"(?:^{translate(pattern)})")
+    return re.compile("|".join(parts)) if parts else None
+
+class CrawlScope:
+    """Decide which discovered links are worth a browser navigation.
+
+    allows() is checked when a link is found and costs no network access: the URL must match
+    an include pattern (if any), match no exclude pattern, not end in a skipped extension, be
+    within max_depth links of the start page, and its path prefix must still be under its limit
+    in prefix_limits (the longest matching prefix counts; e.g. {"/calendar/": 50} stops an
+    endless calendar after 50 pages). fetchable() is checked just before a page is crawled;
+    with head_check it sends a HEAD request and skips URLs whose Content-Type is not HTML.
+    A failed or refused HEAD request lets the page through. stats counts the rejections.
+    """
+
+    def __init__(self, include=None, exclude=None, max_depth=None, skip_extensions=None, prefix_limits=None,
+                 head_check=False, allowed_mime=HTML_MIME_TYPES):
+        self.include = compile_patterns(include)
+        self.exclude = compile_patterns(exclude)
+        self.max_depth = max_depth
+        self.skip_extensions = frozenset(ext.lower() if ext.startswith(".") else f".{ext.lower()}"
+                                         for ext in (SKIPPED_EXTENSIONS if skip_extensions is None else skip_extensions))
+        # Longest prefix first, so the most specific limit applies
+        self.prefix_limits = sorted((prefix_limits or {}).items(), key=lambda item: -len(item[0]))
+        self.prefix_counts = {}
+        self.head_check = head_check
+        self.allowed_mime = tuple(allowed_mime)
+        self.session = requests.Session() if head_check else None
+        self.not_html = set()
+        # fetchable() runs in crawl workers outside the pool lock
+        self.lock = threading.Lock()
+        self.stats = {"excluded": 0, "not_included": 0, "extension": 0, "depth": 0, "prefix_limit": 0, "mime": 0,
+                      "head_requests": 0}
+
+    def _reject(self, reason):
+        self.stats[reason] += 1
+        return False
+
+    def allows(self, url, depth=None):
+        """True if a link found at the given depth (0 = start page) is in scope; counts it against its prefix limit."""
+        if url in self.not_html:
+            return False
+        if self.include and not self.include.search(url):
+            return self._reject("not_included")
+        if self.exclude and self.exclude.search(url):
+            return self._reject("excluded")
+        path = urlsplit(url).path
+        if splitext(path)[1].lower() in self.skip_extensions:
+            return self._reject("extension")
+        if self.max_depth is not None and depth is not None and depth > self.max_depth:
+            return self._reject("depth")
+        for prefix, limit in self.prefix_limits:
+            if path.startswith(prefix):
+                if self.prefix_counts.get(prefix, 0) >= limit:
+                    return self._reject("prefix_limit")
+                self.prefix_counts[prefix] = self.prefix_counts.get(prefix, 0) + 1
+                break
+        return True
+
+    def filter(self, urls, depth=None, *known):
+        """The urls in scope, in order; URLs in any of known (e.g. the frontier and the visited set) pass
+        without being checked, so they are not counted against a prefix limit twice."""
+        return [url for url in urls if any(url in urls_known for urls_known in known) or self.allows(url, depth)]
+
+    def fetchable(self, url):
+        """False if a HEAD request shows url is not an HTML page (only with head_check)."""
+        if not self.head_check:
+            return True
+        with self.lock:
+            self.stats["head_requests"] += 1
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=HEAD_TIMEOUT)
+        except requests.RequestException:
+            return True
+        if response.status_code >= 400:
+            # Some servers refuse HEAD; let the browser find out
+            return True
+        mime = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if mime and mime not in self.allowed_mime:
+            # Remembered so the link is not queued (and checked) again when found on other pages
+            with self.lock:
+                self.not_html.add(url)
+                return self._reject("mime")
+        return True
+
+    def summary(self):
+        return dict(self.stats, rejected=sum(count for reason, count in self.stats.items() if reason != "head_requests"))
+
+    def close(self):
+        if self.session:
+            self.session.close()
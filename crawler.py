@@ -10,6 +10,18 @@ from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from bs4 import BeautifulSoup, Comment
 import time
+from contextlib import contextmanager, nullcontext
+from profiling import StageTimer, profile_run, PROFILERS
+from segment_store import STORAGE_MODES, SegmentWriter
+from warc_writer import WarcWriter
+from link_graph import FRONTIER_ORDERS, LinkGraph, Frontier
+from crawl_progress import PageLog, ProgressMeter
+from url_canon import TRAILING_SLASH_POLICIES, UrlCanonicalizer, find_rel_canonical
+from crawl_scope import CrawlScope
+from sitemaps import SitemapSeeder
+from http_cache import CACHE_MODES, HttpCache
+from concurrency import SKIP, WAIT, AimdController, WorkerPool
+from fetch_guard import FetchGuard, PageLoadError
 
 #from webdriver_manager.chrome import ChromeDriverManager
 
@@ -21,9 +33,8 @@ def setup_browser():
     driver = webdriver.Chrome(options=options)
     return driver
 
-def normalize_url(base, url):
-    parsed = urlparse(urljoin(base, url.strip()))
-    return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+def normalize_url(base, url, canon=None):
+    return (canon or UrlCanonicalizer()).canonicalize(url, base)
 
 def save_html(content, filename):
     try:
@@ -40,57 +51,189 @@ def clean_html(soup):
         comment.extract()
     return soup
 
-def extract_content(driver, url, output_dir, clean_content):
+def extract_content(driver, url, output_dir, clean_content, store=None, warc=None, canon=None, lock=None, guard=None):
+    timer = StageTimer()
     try:
-        driver.get(url)
-        time.sleep(2)
-        soup = BeautifulSoup(driver.page_source, 'html.parser')
+        with timer.stage('fetch'):
+            driver.get(url)
+        with timer.stage('render'), guard.rendering(driver) if guard else nullcontext():
+            # A replayed page was rendered when it was recorded
+            if not getattr(driver, 'replaying', False):
+                time.sleep(2)
+            page_source = driver.page_source
+    except Exception as e:
+        # Left to the crawl's FetchGuard, which retries transient failures
+        raise PageLoadError(url, e) from e
+    try:
+        # The archive and the store lock their own writes, so other workers carry on meanwhile
+        if warc:
+            with timer.stage('archive'):
+                warc.capture(url, page_source)
+        with timer.stage('parse'):
+            soup = BeautifulSoup(page_source, 'html.parser')
+        # Read before cleaning, which removes <link> elements
+        canonical_href = find_rel_canonical(soup)
         title = soup.title.string if soup.title else 'No_Title'
         filename = f"{title.replace(' ', '_').replace('/', '_')}.html"
         filepath = os.path.join(output_dir, filename)
 
         if clean_content:
-            soup = clean_html(soup)
-        save_html(str(soup), filepath)
+            with timer.stage('clean'):
+                soup = clean_html(soup)
+        with timer.stage('write'):
+            html = str(soup)
+            if store:
+                # Packed into the segment store; file_path names the record inside it
+                store.write(filename, html, url=url)
+            else:
+                save_html(html, filepath)
+        # The canonicaliser is shared by every crawl worker
+        with lock or nullcontext():
+            links = get_links(soup, url, canon)
 
         return {
             'title': title,
             'file_path': filepath,
-            'html_url': url
-        }, get_links(soup, url)
+            'html_url': url,
+            'bytes': len(html.encode('utf-8')),
+            'canonical_url': urljoin(url, canonical_href) if canonical_href else None,
+            'timings': timer.as_dict()
+        }, links
     except Exception as e:
         print(f"Error processing URL {url}: {e}")
         return None, set()
 
-def get_links(soup, base_url):
-    base_domain = urlparse(base_url).netloc
+def get_links(soup, base_url, canon=None):
+    canon = canon or UrlCanonicalizer()
+    base_domain = urlparse(canon.canonicalize(base_url)).netloc
     links = set()
     for link in soup.find_all('a', href=True):
-        full_url = normalize_url(base_url, link['href'])
-        if urlparse(full_url).netloc == base_domain:
-            links.add(full_url)
+        try:
+            if urlparse(canon.canonicalize(link['href'], base_url)).netloc == base_domain:
+                links.add(canon.discover(link['href'], base_url))
+        except ValueError:
+            # e.g. a non-numeric or out-of-range port ("http://host:{{port}}/"); skip just this link
+            continue
     return links
 
-def crawl_site(start_url, output_dir, show_progress, clean_content, max_links):
-    driver = setup_browser()
+@contextmanager
+def browser(http_cache=None, guard=None):
+    """A driver for one crawl worker (a replay driver when replaying from http_cache), quit on exit.
+    With a guard, the browser gets its navigation, render and command timeouts."""
+    if http_cache and http_cache.replaying:
+        driver = http_cache.driver()
+    else:
+        driver = setup_browser()
+        if guard:
+            guard.apply_timeouts(driver)
+        if http_cache:
+            driver = http_cache.driver(driver)
+    try:
+        yield driver
+    finally:
+        driver.quit()
+
+def crawl_site(start_url, output_dir, show_progress, clean_content, max_links, store=None, warc=None, frontier=None,
+               page_log=None, canon=None, scope=None, sitemaps=None, http_cache=None, controller=None, guard=None,
+               requeue=None):
+    """Crawl from start_url and return the saved pages; with a page_log, each page is written to it
+    as soon as it is saved instead of being kept in memory, and None is returned.
+    URLs are canonicalised by canon, so each page is fetched once however it is linked, and only
+    links the scope allows are queued. With sitemaps, the URLs the site's sitemaps list are queued
+    (one click from the start page) before the first page is rendered. With an http_cache, pages and
+    HTTP responses are recorded into it, or replayed from it without a browser or network.
+    The controller decides how many browsers fetch pages at once (one if not given). The guard
+    times out, retries and pauses page loads per host; the URLs that failed for good are left in
+    guard.failed. requeue is a list of URLs (e.g. those of an earlier crawl) queued after the start URL."""
     visited = set()
-    to_visit = {normalize_url(start_url, start_url)}
+    if frontier is None:
+        frontier = Frontier(LinkGraph())
+    if canon is None:
+        canon = UrlCanonicalizer()
+    if scope is None:
+        scope = CrawlScope()
+    if guard is None:
+        guard = FetchGuard()
+    if http_cache:
+        http_cache.mount(warc and warc.session, scope.session, sitemaps and sitemaps.session)
+    frontier.add(canon.discover(start_url))
+    if sitemaps:
+        for url in scope.filter(sitemaps.load(start_url, canon), 1, frontier):
+            frontier.add(url, depth=1)
+    for url in scope.filter(requeue or [], None, frontier):
+        frontier.add(url)
     all_pages = []
+    progress = ProgressMeter(max_links) if show_progress else None
+    pool = WorkerPool(controller or AimdController(), lambda: browser(http_cache, guard))
+    # Taken from the frontier but refused by scope.fetchable(), so not counted against max_links
+    skipped = set()
 
-    while to_visit and (max_links is None or len(visited) < max_links):
-        current_url = to_visit.pop()
-        if current_url in visited:
-            continue
-        visited.add(current_url)
-        page_info, new_links = extract_content(driver, current_url, output_dir, clean_content)
+    def next_url():
+        retry_url = guard.next_retry()
+        if retry_url:
+            return retry_url
+        while len(frontier):
+            if max_links is not None and len(visited) - len(skipped) >= max_links:
+                # Not STOP: a page still in flight may yet be skipped and free its place
+                break
+            current_url = frontier.pop()
+            if current_url in visited or canon.skip_alias(current_url):
+                continue
+            visited.add(current_url)
+            # A host whose circuit breaker is open keeps its page until it is let through again
+            if guard.allows(current_url):
+                return current_url
+        return WAIT if guard.pending() else None
+
+    def fetch(driver, current_url):
+        return extract_content(driver, current_url, output_dir, clean_content, store, warc, canon, pool.lock, guard)
+
+    def done(current_url, page_info, new_links, error):
+        if error is SKIP:
+            skipped.add(current_url)
+            return
+        if error is None:
+            guard.success(current_url)
+        elif guard.failure(current_url, error):
+            return
+        else:
+            print(f"Error processing URL {current_url}: {error}")
+        depth = frontier.graph.depth(current_url)
+        new_links = scope.filter(new_links, depth + 1 if depth is not None else None, frontier, visited)
         if page_info:
+            canon.add_rel_canonical(current_url, page_info['canonical_url'], visited)
+            if sitemaps and sitemaps.lastmod.get(current_url):
+                page_info['lastmod'] = sitemaps.lastmod[current_url]
+        if page_info and page_log:
+            page_log.add(page_info)
+        elif page_info:
             all_pages.append(page_info)
-        to_visit.update(new_links - visited)
-        if show_progress:
-            print(f"[{len(all_pages)} saved : {current_url}]")
+        elif page_log:
+            page_log.add_failure()
+        frontier.record(current_url, new_links, visited)
+        if progress:
+            progress.update(page_info['bytes'] if page_info else 0, len(frontier), current_url)
+
+    try:
+        with browser(http_cache, guard) as driver:
+            pool.run(driver, next_url, fetch, done, admit=scope.fetchable)
+    finally:
+        guard.abandon()
+        if progress:
+            progress.finish()
+        scope.close()
+        if sitemaps:
+            sitemaps.close()
+    return None if page_log else all_pages
 
-    driver.quit()
-    return all_pages
+def comma_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def prefix_limit(value):
+    prefix, _, limit = value.rpartition('=')
+    if not prefix or not limit.isdigit():
+        raise argparse.ArgumentTypeError(f"expected PREFIX=N, got '{value}'")
+    return prefix, int(limit)
 
 def main():
     parser = argparse.ArgumentParser(description="Web Crawler for Internal Documentation Site")
@@ -100,20 +243,115 @@ def main():
     parser.add_argument('--progress', action='store_true', help="Show progress during crawling")
     parser.add_argument('--clean', action='store_true', help="Remove non-informational content from HTML")
     parser.add_argument('--max_links', type=int, help="Maximum number of links to crawl, crawls entire site if omitted")
+    parser.add_argument('--profile', choices=PROFILERS, help="Run the crawl under a profiler and save the profile next to the output directory")
+    parser.add_argument('--storage', choices=STORAGE_MODES, default='files', help="Save each page as its own file, or append compressed pages to segment files in the output directory")
+    parser.add_argument('--segment_mb', type=int, default=256, help="Size at which a new segment file is started (segments storage only)")
+    parser.add_argument('--warc', action='store_true', help="Also archive each page's HTTP exchange and rendered DOM to a WARC file with a CDXJ index")
+    parser.add_argument('--warc_dom_only', action='store_true', help="With --warc, archive only the rendered DOM instead of fetching each page a second time for its HTTP exchange")
+    parser.add_argument('--frontier', choices=FRONTIER_ORDERS, default='bfs', help="Crawl queued pages breadth-first, or the most linked-to (indegree) or highest PageRank pages first")
+    parser.add_argument('--strip_query', action='store_true', help="Drop every query string, so ?page=2 and ?page=3 count as the same URL")
+    parser.add_argument('--keep_params', type=comma_list, help="Keep only these query parameters (comma-separated, * wildcards allowed)")
+    parser.add_argument('--strip_params', type=comma_list, help="Drop these query parameters (comma-separated, * wildcards allowed); defaults to common tracking parameters such as utm_*")
+    parser.add_argument('--trailing_slash', choices=TRAILING_SLASH_POLICIES, default='strip', help="Strip or add the trailing slash of paths, or keep it as linked")
+    parser.add_argument('--include', action='append', help="Only crawl URLs matching this glob (or 're:' regex); repeat for more patterns")
+    parser.add_argument('--exclude', action='append', help="Never crawl URLs matching this glob (or 're:' regex), e.g. '*/logout*'; repeat for more patterns")
+    parser.add_argument('--max_depth', type=int, help="Only follow links up to this many clicks from the start page")
+    parser.add_argument('--skip_ext', type=comma_list, help="Comma-separated extensions never fetched (default: documents, images, media, archives; '' skips none)")
+    parser.add_argument('--prefix_limit', type=prefix_limit, action='append', help="PREFIX=N: crawl at most N URLs whose path starts with PREFIX, e.g. /calendar/=50; repeat for more prefixes")
+    parser.add_argument('--head_check', action='store_true', help="Send a HEAD request before each page and skip URLs that are not HTML")
+    parser.add_argument('--sitemaps', action='store_true', help="Seed the crawl with the URLs of the sitemaps listed in robots.txt (or /sitemap.xml)")
+    parser.add_argument('--sitemap', action='append', help="Also seed the crawl from this sitemap or sitemap index URL; repeat for more sitemaps")
+    parser.add_argument('--sitemap_since', help="Only seed sitemap URLs whose lastmod is on or after this date (e.g. 2024-01-31), for incremental crawls")
+    parser.add_argument('--max_workers', type=int, default=1, help="Most browsers fetching pages at once; the count adapts between 1 and this to latency, errors, CPU and memory")
+    parser.add_argument('--max_per_host', type=int, help="Most pages fetched at once from one host (default: --max_workers)")
+    parser.add_argument('--cache_dir', help="Record every page and HTTP response into this directory, or replay them from it with --cache_mode replay")
+    parser.add_argument('--cache_mode', choices=CACHE_MODES, default='record', help="With --cache_dir: record from the live site, or replay the recorded crawl with no browser or network")
+    parser.add_argument('--navigation_timeout', type=float, default=30, help="Seconds a page may take to load before the attempt fails")
+    parser.add_argument('--render_timeout', type=float, default=10, help="Seconds the browser may take to hand back the rendered page")
+    parser.add_argument('--retries', type=int, default=2, help="Times a page that timed out or lost its connection is retried, with jittered exponential backoff")
+    parser.add_argument('--breaker_failures', type=int, default=5, help="Failures in a row after which a host is paused while the crawl continues on other hosts")
+    parser.add_argument('--breaker_cooldown', type=float, default=30, help="Seconds a failing host is paused before one page is tried again (doubles while it keeps failing)")
+    parser.add_argument('--requeue_failed', action='store_true', help="Queue the URLs in the output directory's failed_urls.jsonl from the previous crawl again")
+    parser.add_argument('--no_rel_canonical', action='store_true', help="Ignore <link rel=\"canonical\"> when deciding which URLs name the same page")
     args = parser.parse_args()
+    if args.cache_mode == 'replay' and not args.cache_dir:
+        parser.error("--cache_mode replay needs --cache_dir")
 
     # Ensure the output directory exists
     if not os.path.exists(args.output_dir):
         os.makedirs(args.output_dir)
 
-    crawled_pages = crawl_site(args.url, args.output_dir, args.progress, args.clean, args.max_links)
+    store = SegmentWriter(args.output_dir, segment_mb=args.segment_mb) if args.storage == 'segments' else None
+    warc = None
+    if args.warc:
+        warc = WarcWriter(os.path.join(args.output_dir, f"crawl-{time.strftime('%Y%m%d-%H%M%S')}.warc.gz"), refetch=not args.warc_dom_only)
+    frontier = Frontier(LinkGraph(), args.frontier)
+    canon = UrlCanonicalizer(strip_query=args.strip_query, keep_params=args.keep_params, strip_params=args.strip_params,
+                             trailing_slash=args.trailing_slash, rel_canonical=not args.no_rel_canonical)
+    try:
+        scope = CrawlScope(include=args.include, exclude=args.exclude, max_depth=args.max_depth,
+                           skip_extensions=args.skip_ext, prefix_limits=dict(args.prefix_limit or []),
+                           head_check=args.head_check)
+        sitemaps = None
+        if args.sitemaps or args.sitemap:
+            sitemaps = SitemapSeeder(args.sitemap, robots=args.sitemaps, since=args.sitemap_since)
+        http_cache = HttpCache(args.cache_dir, args.cache_mode, canon) if args.cache_dir else None
+        controller = AimdController(max_workers=args.max_workers, max_per_host=args.max_per_host)
+        guard = FetchGuard(navigation_timeout=args.navigation_timeout, render_timeout=args.render_timeout,
+                           retries=args.retries, breaker_failures=args.breaker_failures,
+                           breaker_cooldown=args.breaker_cooldown)
+    except ValueError as e:
+        parser.error(str(e))
+    # URLs that failed for good, one JSON line each, for --requeue_failed on the next run
+    failed_path = os.path.join(args.output_dir, 'failed_urls.jsonl')
+    requeue = []
+    if args.requeue_failed and os.path.exists(failed_path):
+        with open(failed_path, 'r', encoding='utf-8') as f:
+            requeue = [json.loads(line)['url'] for line in f if line.strip()]
+        print(f"Requeueing {len(requeue)} failed URLs")
+    # One JSON line per page as it is saved (summary.json -> summary.jsonl); summary.json gets the rollup
+    pages_path = os.path.join(args.output_dir, os.path.splitext(args.summary_file)[0] + '.jsonl')
+    if os.path.exists(pages_path):
+        os.remove(pages_path)
+    page_log = PageLog(pages_path)
+    try:
+        with profile_run(args.profile, args.output_dir) as profile:
+            crawl_site(args.url, args.output_dir, args.progress, args.clean, args.max_links, store, warc, frontier,
+                       page_log, canon, scope, sitemaps, http_cache, controller, guard, requeue)
+    finally:
+        page_log.close()
+        with open(failed_path, 'w', encoding='utf-8') as f:
+            for failure in guard.failed:
+                f.write(json.dumps(failure) + "\n")
+        if store:
+            store.close()
+        if warc:
+            warc.close()
+        graph_path = os.path.join(args.output_dir, 'links.graph')
+        frontier.graph.save(graph_path)
     
-    # Create JSON summary
+    # Create the JSON summary: totals only, the pages are in the JSON Lines file
     summary = {
-        'total_links': len(crawled_pages),
-        'pages': crawled_pages,
-        'output_directory': os.path.abspath(args.output_dir)
+        'total_links': page_log.pages,
+        'output_directory': os.path.abspath(args.output_dir),
+        **page_log.rollup()
     }
+    if warc:
+        summary['warc_path'] = str(warc.warc_file)
+    summary['graph_path'] = graph_path
+    summary['canonicalization'] = canon.summary()
+    if sitemaps:
+        summary['sitemaps'] = sitemaps.summary()
+    if http_cache:
+        summary['http_cache'] = http_cache.summary()
+    summary['concurrency'] = controller.summary()
+    summary['fetch'] = guard.summary()
+    summary['failed_urls'] = failed_path
+    summary['scope'] = scope.summary()
+    summary['graph'] = frontier.graph.summary()
+    if profile['path']:
+        summary['profile_path'] = profile['path']
+        print(f"Profile saved to {profile['path']}")
     
     summary_path = os.path.join(args.output_dir, args.summary_file)
     with open(summary_path, 'w') as json_file:
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# page load timeouts, retries with jittered backoff and per-host circuit breakers for the crawlers
+# see https://github.com/deftio/simple-py-crawlbot
+
+import time
+import heapq
+import random
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+
+import requests
+from urllib3.exceptions import HTTPError as Urllib3Error
+from urllib3.util import Retry, Timeout
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.remote.remote_connection import RemoteConnection
+
+logger = logging.getLogger(__name__)
+
+# Chrome network errors worth another try; anything else (e.g. ERR_NAME_NOT_RESOLVED) is not
+TRANSIENT_NET_ERRORS = ("ERR_CONNECTION_RESET", "ERR_CONNECTION_CLOSED", "ERR_CONNECTION_REFUSED",
+                        "ERR_CONNECTION_TIMED_OUT", "ERR_TIMED_OUT", "ERR_EMPTY_RESPONSE", "ERR_NETWORK_CHANGED",
+                        "ERR_INTERNET_DISCONNECTED", "ERR_HTTP2_PROTOCOL_ERROR", "ERR_ADDRESS_UNREACHABLE")
+
+class PageLoadError(Exception):
+    """A page could not be loaded or rendered; transient failures are worth retrying."""
+
+    def __init__(self, url, cause):
+        super().__init__(f"{type(cause).__name__}: {cause}".strip())
+        self.url = url
+        self.cause = cause
+        self.transient = is_transient(cause)
+
+def set_command_timeout(driver, timeout):
+    """Bound the HTTP requests behind one driver's WebDriver commands. RemoteConnection.set_timeout
+    would change every browser in the process, so only this driver's connection is changed."""
+    executor = getattr(driver, "command_executor", None)
+    if not isinstance(executor, RemoteConnection):
+        return
+    # Read whenever the connection builds a pool: once with keep-alive, per request without it
+    executor.get_timeout = lambda: timeout
+    manager = getattr(executor, "_conn", None)
+    if manager is not None:
+        # A command that timed out is not sent again, or the bound would be several times timeout
+        settings = {"timeout": Timeout(connect=timeout, read=timeout), "retries": Retry(3, read=False)}
+        manager.connection_pool_kw.update(settings)
+        for key in manager.pools.keys():
+            pool = manager.pools[key]
+            pool.timeout, pool.retries = settings["timeout"], settings["retries"]
+
+def is_transient(error):
+    """True for timeouts and dropped connections, False for errors another try would repeat."""
+    if isinstance(error, (TimeoutException, TimeoutError, ConnectionError, Urllib3Error)):
+        return True
+    if isinstance(error, requests.RequestException):
+        # Includes a replay cache miss, which no retry will fix
+        return isinstance(error, requests.Timeout)
+    if isinstance(error, WebDriverException):
+        message = str(error.msg or "")
+        return "timeout" in message.lower() or any(code in message for code in TRANSIENT_NET_ERRORS)
+    return False
+
+class CircuitBreaker:
+    """Stop sending pages to a host after failure_threshold transient failures in a row.
+
+    The breaker opens for `cooldown` seconds, then lets one trial page through (half-open): a
+    success closes it, a failure opens it again for twice as long, up to max_cooldown.
+    """
+
+    def __init__(self, failure_threshold=5, cooldown=30.0, max_cooldown=300.0):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = None
+        self.trial = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        if self.open_until is None:
+            return "closed"
+        return "half-open" if self.trial or time.monotonic() >= self.open_until else "open"
+
+    def allows(self):
+        if self.open_until is None:
+            return True
+        if self.trial or time.monotonic() < self.open_until:
+            return False
+        self.trial = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.open_until = None
+        self.trial = False
+        self.cooldown = self.base_cooldown
+
+    def failure(self):
+        self.failures += 1
+        if self.trial:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+        if self.trial or self.failures >= self.failure_threshold:
+            self.open_until = time.monotonic() + self.cooldown
+            self.trial = False
+            self.opened += 1
+            return True
+        return False
+
+class FetchGuard:
+    """Timeouts, retries and circuit breakers around page loads.
+
+    apply_timeouts() gives a driver a navigation timeout (page load) and bounds every other
+    WebDriver command by both timeouts together, so even a hung browser cannot block a crawl
+    worker; within rendering(), reading back the rendered page is bounded by render_timeout. A transient failure (timeout,
+    dropped connection) is retried up to `retries` times after a random delay between 0 and
+    backoff * 2 ** (attempt - 1) seconds, capped at max_backoff ("full jitter", so retries of
+    many pages do not arrive together). Waiting retries are kept in a queue instead of holding
+    a worker. Each host has a CircuitBreaker; while it is open, that host's pages are parked and
+    workers take pages of other hosts. URLs that fail for good are collected in `failed`.
+
+    The crawl loop calls next_retry() and allows() to pick work, and success() or failure()
+    with each outcome; pending() tells it whether work is still due later.
+    """
+
+    def __init__(self, navigation_timeout=30.0, render_timeout=10.0, retries=2, backoff=2.0, max_backoff=60.0,
+                 breaker_failures=5, breaker_cooldown=30.0):
+        if navigation_timeout <= 0 or render_timeout <= 0 or retries < 0:
+            raise ValueError("Timeouts must be positive and retries must not be negative")
+        self.navigation_timeout = navigation_timeout
+        self.render_timeout = render_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.breakers = {}
+        self.attempts = {}
+        self.retry_queue = []
+        self.parked = {}
+        self.failed = []
+        self.stats = {"retries": 0, "retried_ok": 0, "timeouts": 0, "breaker_trips": 0, "parked": 0}
+
+    def apply_timeouts(self, driver):
+        driver.set_page_load_timeout(self.navigation_timeout)
+        # Longer than the page load timeout, so a slow page fails with the browser's own timeout
+        set_command_timeout(driver, self.navigation_timeout + self.render_timeout)
+
+    @contextmanager
+    def rendering(self, driver):
+        """Bound the commands that wait for and read back the rendered page by render_timeout."""
+        set_command_timeout(driver, self.render_timeout)
+        try:
+            yield
+        finally:
+            set_command_timeout(driver, self.navigation_timeout + self.render_timeout)
+
+    def _breaker(self, host):
+        breaker = self.breakers.get(host)
+        if breaker is None:
+            breaker = self.breakers[host] = CircuitBreaker(self.breaker_failures, self.breaker_cooldown)
+        return breaker
+
+    def allows(self, url):
+        """True if url's host may be sent a page now; otherwise url is parked until its breaker lets a trial through."""
+        host = urlsplit(url).netloc
+        if self._breaker(host).allows():
+            return True
+        if url not in self.parked.setdefault(host, {}):
+            self.parked[host][url] = None
+            self.stats["parked"] += 1
+        return False
+
+    def next_retry(self):
+        """A URL whose retry is due or whose host is accepting pages again, or None."""
+        now = time.monotonic()
+        deferred = []
+        url = None
+        while self.retry_queue and self.retry_queue[0][0] <= now:
+            due, candidate = heapq.heappop(self.retry_queue)
+            if self._breaker(urlsplit(candidate).netloc).allows():
+                url = candidate
+                break
+            deferred.append((due, candidate))
+        for item in deferred:
+            heapq.heappush(self.retry_queue, item)
+        if url:
+            return url
+        for host, urls in self.parked.items():
+            if urls and self._breaker(host).allows():
+                url = next(iter(urls))
+                del urls[url]
+                return url
+        return None
+
+    def pending(self):
+        """True while retries are scheduled or pages are parked behind an open breaker."""
+        return bool(self.retry_queue) or any(self.parked.values())
+
+    def success(self, url):
+        if self.attempts.pop(url, 0):
+            self.stats["retried_ok"] += 1
+        self._breaker(urlsplit(url).netloc).success()
+
+    def failure(self, url, error):
+        """Record a failed load; returns True if the URL will be retried, False if it failed for good."""
+        transient = getattr(error, "transient", is_transient(error))
+        if isinstance(getattr(error, "cause", error), TimeoutException):
+            self.stats["timeouts"] += 1
+        host = urlsplit(url).netloc
+        if not transient:
+            # The host answered; the page itself is the problem
+            self._breaker(host).success()
+        elif self._breaker(host).failure():
+            self.stats["breaker_trips"] += 1
+            logger.warning(f"Circuit breaker open for {host} after repeated failures")
+        attempt = self.attempts.get(url, 0) + 1
+        if transient and attempt <= self.retries:
+            self.attempts[url] = attempt
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+            heapq.heappush(self.retry_queue, (time.monotonic() + delay, url))
+            self.stats["retries"] += 1
+            logger.info(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}): {error}")
+            return True
+        self.attempts.pop(url, None)
+        self.failed.append({
+            "url": url,
+            "error": str(error),
+            "transient": transient,
+            "attempts": attempt,
+            "failed_at": datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        })
+        return False
+
+    def abandon(self):
+        """Move retries still waiting and parked pages to failed (the crawl ended before they were due)."""
+        for _, url in sorted(self.retry_queue):
+            self.failed.append({"url": url, "error": "Crawl ended before the retry was due", "transient": True,
+                                "attempts": self.attempts.pop(url, 0), "failed_at": None})
+        for urls in self.parked.values():
+            for url in urls:
+                self.failed.append({"url": url, "error": "Host circuit breaker was open", "transient": True,
+                                    "attempts": 0, "failed_at": None})
+        self.retry_queue = []
+        self.parked = {}
+
+    def summary(self):
+        return dict(self.stats, failed=len(self.failed),
+                    open_breakers=sorted(host for host, breaker in self.breakers.items() if breaker.state != "closed"))
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# cached listings, streamed zip/tar archives and byte ranges for serving crawl output directories
+# see https://github.com/deftio/simple-py-crawlbot
+
+import io
+import os
+import time
+import queue
+import tarfile
+import zipfile
+import threading
+from pathlib import Path
+
+from segment_store import is_segment_store, open_store
+
+EXPORT_FORMATS = {"zip": "application/zip", "tar": "application/x-tar", "tar.gz": "application/gzip"}
+CHUNK_SIZE = 256 * 1024
+MAX_CACHED_LISTINGS = 32
+
+_listings = {}
+
+def _scan(directory):
+    """Relative paths of every file under directory, sorted, plus the mtime of each directory walked."""
+    files = []
+    dir_mtimes = {}
+    pending = [directory]
+    while pending:
+        current = pending.pop()
+        dir_mtimes[current] = os.stat(current).st_mtime_ns
+        with os.scandir(current) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file():
+                    files.append(os.path.relpath(entry.path, directory))
+    files.sort()
+    return files, dir_mtimes
+
+def list_files(directory):
+    """Sorted relative paths of the files under directory (or the records of a segment store).
+
+    Listings are cached. Adding, removing or renaming a file changes the mtime of its directory,
+    so a cached listing is reused only while every directory it walked has an unchanged mtime;
+    checking that costs one stat per directory instead of one per file.
+    """
+    directory = os.path.abspath(directory)
+    if is_segment_store(directory):
+        return open_store(directory).names()
+    cached = _listings.get(directory)
+    if cached:
+        files, dir_mtimes = cached
+        try:
+            if all(os.stat(path).st_mtime_ns == mtime for path, mtime in dir_mtimes.items()):
+                return files
+        except OSError:
+            pass
+    files, dir_mtimes = _scan(directory)
+    _listings.pop(directory, None)
+    _listings[directory] = (files, dir_mtimes)
+    while len(_listings) > MAX_CACHED_LISTINGS:
+        _listings.pop(next(iter(_listings)))
+    return files
+
+class _QueueWriter(io.RawIOBase):
+    """A write-only, unseekable file that hands every write to a bounded queue."""
+
+    def __init__(self, chunks, cancelled):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        while True:
+            if self.cancelled.is_set():
+                raise IOError("Archive download cancelled")
+            try:
+                self.chunks.put(bytes(data), timeout=1)
+                break
+            except queue.Full:
+                continue
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        # zipfile asks where it is to record offsets; this is all it needs from an unseekable file
+        return self.position
+
+_END = object()
+
+def _archive_members(directory):
+    """(archive name, path or None, bytes or None) for every file under directory."""
+    directory = Path(directory)
+    if is_segment_store(directory):
+        store = open_store(directory)
+        for name in store.names():
+            yield name, None, store.read(name)
+    else:
+        for name in list_files(directory):
+            yield name, directory / name, None
+
+def _write_zip(directory, fileobj):
+    with zipfile.ZipFile(fileobj, 'w', compression=zipfile.ZIP_DEFLATED, allowZip64=True) as archive:
+        for name, path, data in _archive_members(directory):
+            if path is None:
+                archive.writestr(name, data)
+            else:
+                archive.write(path, name)
+
+def _write_tar(directory, fileobj, compress):
+    with tarfile.open(fileobj=fileobj, mode='w|gz' if compress else 'w|') as archive:
+        for name, path, data in _archive_members(directory):
+            if path is None:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                info.mtime = time.time()
+                archive.addfile(info, io.BytesIO(data))
+            else:
+                archive.add(path, name, recursive=False)
+
+def stream_archive(directory, archive_format="zip", queue_size=16):
+    """Yield a zip, tar or tar.gz of everything under directory as it is written, without temp files.
+
+    The archive is written by a background thread into a bounded queue of chunks, so memory
+    stays at queue_size chunks however large the output directory is. Closing the generator
+    early (a client that disconnects) stops the writer.
+    """
+    if archive_format not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown archive format '{archive_format}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    chunks = queue.Queue(maxsize=queue_size)
+    cancelled = threading.Event()
+    errors = []
+
+    def write():
+        try:
+            fileobj = io.BufferedWriter(_QueueWriter(chunks, cancelled), buffer_size=CHUNK_SIZE)
+            if archive_format == "zip":
+                _write_zip(directory, fileobj)
+            else:
+                _write_tar(directory, fileobj, archive_format == "tar.gz")
+            fileobj.flush()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            while not cancelled.is_set():
+                try:
+                    chunks.put(_END, timeout=1)
+                    break
+                except queue.Full:
+                    continue
+
+    writer = threading.Thread(target=write, name="archive-writer", daemon=True)
+    writer.start()
+    try:
+        while True:
+            chunk = chunks.get()
+            if chunk is _END:
+                break
+            yield chunk
+        if errors:
+            raise errors[0]
+    finally:
+        cancelled.set()
+        writer.join()
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single-range 'bytes=' header, or None to send the whole file.
+
+    Multi-range and malformed headers are ignored (the whole file is sent, as RFC 9110
+    allows); a range that starts past the end raises ValueError, i.e. 416.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    start, dash, end = header[len("bytes="):].strip().partition("-")
+    if not dash or not (start or end) or not all(part.isdigit() for part in (start, end) if part):
+        return None
+    if not start:
+        # Suffix range: the last end bytes
+        if not size or not int(end):
+            raise ValueError(f"Unsatisfiable range: {header}")
+        return max(0, size - int(end)), size - 1
+    start = int(start)
+    if end and int(end) < start:
+        return None
+    if start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, min(int(end), size - 1) if end else size - 1
+
+def iter_file_range(path, start, end, chunk_size=CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) of a file in chunks."""
+    remaining = end - start + 1
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# on-disk record/replay cache of rendered pages and HTTP responses for repeatable offline crawls
+# see https://github.com/deftio/simple-py-crawlbot
+
+import io
+import gzip
+import json
+import hashlib
+import requests
+from pathlib import Path
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib3 import HTTPResponse
+
+from url_canon import UrlCanonicalizer
+
+CACHE_VERSION = 1
+CACHE_MODES = ("record", "replay")
+
+class CacheMiss(requests.ConnectionError):
+    """A replayed crawl asked for something that was not recorded. A ConnectionError, so code
+    that already copes with an unreachable server copes with a miss the same way."""
+
+class HttpCache:
+    """Rendered pages and HTTP responses stored by canonical URL under cache_dir.
+
+    Two fetch layers go through the cache. driver() wraps the Selenium driver: in record mode
+    every page_source the crawler reads is stored with the URL it asked for; in replay mode no
+    browser is started at all and the stored DOM is returned. mount() attaches a transport
+    adapter to a requests session (WARC capture, sitemaps, HEAD checks): in record mode each
+    response is stored exactly as received, still content-encoded, and in replay mode it is
+    rebuilt from disk, so redirects, status codes and headers come out as they were. Replay
+    needs no network; anything not recorded raises CacheMiss. Recording again overwrites.
+
+    Each entry is one gzip file, <kind>/<sha256 of the key>[:2]/<sha256>.gz, holding a JSON
+    header line followed by the body. URLs are canonicalised with canon (the crawl's
+    UrlCanonicalizer), so the replay of a crawl finds entries under the URLs the crawl used.
+    """
+
+    def __init__(self, cache_dir, mode="record", canon=None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode '{mode}', expected one of: {', '.join(CACHE_MODES)}")
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.canon = canon or UrlCanonicalizer()
+        self.stats = {"hits": 0, "misses": 0, "recorded": 0}
+        if mode == "replay" and not self.cache_dir.is_dir():
+            raise ValueError(f"Cache directory '{cache_dir}' does not exist; record a crawl into it first")
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def _path(self, kind, key):
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()
+        return self.cache_dir / kind / digest[:2] / f"{digest}.gz"
+
+    def _key(self, url, method=None):
+        url = self.canon.canonicalize(url)
+        return f"{method} {url}" if method else url
+
+    def store(self, kind, key, header, body):
+        path = self._path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        header = dict(header, version=CACHE_VERSION, key=key,
+                      recorded=datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+        tmp_path = path.with_name(path.name + ".tmp")
+        with gzip.open(tmp_path, 'wb', compresslevel=6) as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            f.write(body)
+        tmp_path.replace(path)
+        self.stats["recorded"] += 1
+
+    def load(self, kind, key):
+        """(header, body) of an entry; raises CacheMiss if it was never recorded."""
+        path = self._path(kind, key)
+        try:
+            with gzip.open(path, 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read()
+        except FileNotFoundError:
+            self.stats["misses"] += 1
+            raise CacheMiss(f"Not in the cache: {key}")
+        if header.get("version") != CACHE_VERSION or header.get("key") != key:
+            self.stats["misses"] += 1
+            raise CacheMiss(f"Not in the cache: {key}")
+        self.stats["hits"] += 1
+        return header, body
+
+    def store_page(self, url, html, final_url=None):
+        self.store("rendered", self._key(url), {"url": url, "final_url": final_url}, html.encode('utf-8'))
+
+    def load_page(self, url):
+        header, body = self.load("rendered", self._key(url))
+        return body.decode('utf-8'), header.get("final_url") or url
+
+    def driver(self, driver=None):
+        """The driver to crawl with: the real driver recording into the cache, or a replay driver."""
+        return ReplayDriver(self) if self.replaying else RecordingDriver(driver, self)
+
+    def mount(self, *sessions):
+        """Send the requests of each session (None is skipped) through the cache."""
+        adapter = CachingAdapter(self)
+        for session in sessions:
+            if session is not None:
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+
+    def summary(self):
+        return dict(self.stats, mode=self.mode, cache_dir=str(self.cache_dir))
+
+class RecordingDriver:
+    """A Selenium driver that stores every page_source it returns."""
+
+    replaying = False
+
+    def __init__(self, driver, cache):
+        self._driver = driver
+        self._cache = cache
+        self._url = None
+
+    def get(self, url):
+        self._url = url
+        self._driver.get(url)
+
+    @property
+    def page_source(self):
+        html = self._driver.page_source
+        if self._url:
+            self._cache.store_page(self._url, html, getattr(self._driver, "current_url", None))
+        return html
+
+    def __getattr__(self, name):
+        return getattr(self._driver, name)
+
+class ReplayDriver:
+    """Stands in for the Selenium driver during replay: get() loads the recorded DOM, nothing is rendered."""
+
+    replaying = True
+
+    def __init__(self, cache):
+        self._cache = cache
+        self.page_source = ""
+        self.current_url = None
+
+    def get(self, url):
+        self.page_source, self.current_url = self._cache.load_page(url)
+
+    def quit(self):
+        pass
+
+class CachingAdapter(HTTPAdapter):
+    """Records responses as they come off the wire, or rebuilds them from the cache without sending anything."""
+
+    def __init__(self, cache):
+        super().__init__()
+        self.cache = cache
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        key = self.cache._key(request.url, request.method)
+        if self.cache.replaying:
+            header, body = self.cache.load("http", key)
+            recorded = header["response"]
+        else:
+            response = super().send(request, stream=True, timeout=timeout, verify=verify, cert=cert, proxies=proxies)
+            try:
+                body = response.raw.read(decode_content=False)
+            finally:
+                response.close()
+            recorded = {"url": request.url, "method": request.method, "status": response.status_code,
+                        "reason": response.reason, "version": getattr(response.raw, "version", 11),
+                        "headers": list(response.raw.headers.items())}
+            self.cache.store("http", key, {"response": recorded}, body)
+        raw = HTTPResponse(body=io.BytesIO(body), headers=recorded["headers"],
+                           status=recorded["status"], reason=recorded["reason"], version=recorded["version"],
+                           preload_content=False, decode_content=False)
+        return self.build_response(request, raw)
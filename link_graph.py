@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+# compact link graph of a crawl (integer URL ids, array adjacency) and a frontier that crawls important pages first
+# see https://github.com/deftio/simple-py-crawlbot
+
+import sys
+import gzip
+import json
+import heapq
+from array import array
+from pathlib import Path
+from collections import OrderedDict, deque
+
+GRAPH_VERSION = 1
+FRONTIER_ORDERS = ("bfs", "indegree", "pagerank")
+GRAPH_SORT_KEYS = ("pagerank", "in_degree", "out_degree", "depth")
+# Outlinks of pages not crawled (yet) are unknown; they all share this empty list
+_NO_LINKS = array('I')
+
+class LinkGraph:
+    """The links between the pages of one crawl.
+
+    Every URL gets an integer id in the order it was first seen. A crawled page's outlinks are
+    kept as an array of target ids and the crawl depth of every URL as an array of ints (-1 if
+    unknown), so an edge costs 4 bytes instead of a pair of URL strings. save() writes the graph
+    in compressed sparse row form to one gzip file; load() reads it back.
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.urls = []
+        self.depths = array('i')
+        self.in_counts = array('I')
+        self.out_links = []
+        self._ranks = None
+
+    def __len__(self):
+        return len(self.urls)
+
+    def edge_count(self):
+        return sum(len(targets) for targets in self.out_links)
+
+    def url_id(self, url, depth=None):
+        """The id of url, adding it to the graph if it is new."""
+        node = self.ids.get(url)
+        if node is None:
+            node = len(self.urls)
+            self.ids[url] = node
+            self.urls.append(url)
+            self.depths.append(-1)
+            self.in_counts.append(0)
+            self.out_links.append(_NO_LINKS)
+        if depth is not None and (self.depths[node] < 0 or depth < self.depths[node]):
+            self.depths[node] = depth
+        return node
+
+    def add_page(self, url, links):
+        """Record the outlinks of a crawled page; returns (page id, ids of its distinct targets)."""
+        source = self.url_id(url, 0 if not self.urls else None)
+        depth = self.depths[source] + 1 if self.depths[source] >= 0 else None
+        targets = array('I', sorted({self.url_id(link, depth) for link in links} - {source}))
+        # A page crawled twice replaces its earlier outlinks
+        for target in self.out_links[source]:
+            self.in_counts[target] -= 1
+        for target in targets:
+            self.in_counts[target] += 1
+        self.out_links[source] = targets
+        self._ranks = None
+        return source, targets
+
+    def depth(self, url):
+        """Crawl depth of url (0 for the start page), or None if unknown."""
+        node = self.ids.get(url)
+        return self.depths[node] if node is not None and self.depths[node] >= 0 else None
+
+    def out_degree(self, node):
+        return len(self.out_links[node])
+
+    def pagerank(self, damping=0.85, iterations=50, tolerance=1e-6):
+        """PageRank of every node, indexed by id and summing to 1.
+
+        Pages without known outlinks (not crawled, or linking nowhere in the site) spread their
+        rank evenly over all pages. Iterates until the total change drops below tolerance.
+        """
+        if self._ranks is not None:
+            return self._ranks
+        count = len(self.urls)
+        if not count:
+            return []
+        ranks = [1.0 / count] * count
+        for _ in range(iterations):
+            incoming = [0.0] * count
+            dangling = 0.0
+            for source, targets in enumerate(self.out_links):
+                if targets:
+                    share = ranks[source] / len(targets)
+                    for target in targets:
+                        incoming[target] += share
+                else:
+                    dangling += ranks[source]
+            base = (1.0 - damping + damping * dangling) / count
+            updated = [base + damping * value for value in incoming]
+            change = sum(abs(new - old) for new, old in zip(updated, ranks))
+            ranks = updated
+            if change < tolerance:
+                break
+        self._ranks = ranks
+        return ranks
+
+    def node(self, node):
+        """Degree, depth and PageRank of one node."""
+        return {
+            "id": node,
+            "url": self.urls[node],
+            "in_degree": self.in_counts[node],
+            "out_degree": self.out_degree(node),
+            "depth": self.depths[node] if self.depths[node] >= 0 else None,
+            "pagerank": round(self.pagerank()[node], 8)
+        }
+
+    def top(self, sort="pagerank", limit=50, offset=0):
+        """Nodes ordered by one of GRAPH_SORT_KEYS (highest first; shallowest first for depth)."""
+        if sort not in GRAPH_SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}', expected one of: {', '.join(GRAPH_SORT_KEYS)}")
+        if sort == "pagerank":
+            ranks = self.pagerank()
+            key = lambda node: -ranks[node]
+        elif sort == "in_degree":
+            key = lambda node: -self.in_counts[node]
+        elif sort == "out_degree":
+            key = lambda node: -len(self.out_links[node])
+        else:
+            key = lambda node: self.depths[node] if self.depths[node] >= 0 else sys.maxsize
+        nodes = heapq.nsmallest(offset + limit, range(len(self.urls)), key=key)[offset:]
+        return [self.node(node) for node in nodes]
+
+    def summary(self):
+        known = [depth for depth in self.depths if depth >= 0]
+        return {
+            "nodes": len(self.urls),
+            "edges": self.edge_count(),
+            "crawled": sum(1 for links in self.out_links if links is not _NO_LINKS),
+            "max_depth": max(known) if known else None
+        }
+
+    def save(self, graph_file):
+        """Write the graph to graph_file (gzip) atomically."""
+        graph_file = Path(graph_file)
+        offsets = array('Q', [0])
+        targets = array('I')
+        for links in self.out_links:
+            targets.extend(links)
+            offsets.append(len(targets))
+        crawled = bytes(links is not _NO_LINKS for links in self.out_links)
+        url_block = "\n".join(self.urls).encode('utf-8')
+        header = {"version": GRAPH_VERSION, "byteorder": sys.byteorder, "nodes": len(self.urls),
+                  "edges": len(targets), "url_bytes": len(url_block)}
+        tmp_file = graph_file.with_name(graph_file.name + ".tmp")
+        with gzip.open(tmp_file, 'wb', compresslevel=6) as f:
+            f.write(json.dumps(header).encode('utf-8') + b"\n")
+            for block in (url_block, crawled, self.depths.tobytes(), offsets.tobytes(), targets.tobytes()):
+                f.write(block)
+        tmp_file.replace(graph_file)
+
+    @classmethod
+    def load(cls, graph_file):
+        with gzip.open(graph_file, 'rb') as f:
+            header = json.loads(f.readline())
+            if header.get("version") != GRAPH_VERSION:
+                raise ValueError(f"Unsupported link graph version: {header.get('version')}")
+            nodes = header["nodes"]
+            url_block = f.read(header["url_bytes"])
+            crawled = f.read(nodes)
+            arrays = []
+            for typecode, length in (('i', nodes), ('Q', nodes + 1), ('I', header["edges"])):
+                values = array(typecode)
+                values.frombytes(f.read(length * values.itemsize))
+                if header["byteorder"] != sys.byteorder:
+                    values.byteswap()
+                arrays.append(values)
+        depths, offsets, targets = arrays
+        graph = cls()
+        graph.urls = url_block.decode('utf-8').split("\n") if nodes else []
+        graph.ids = {url: node for node, url in enumerate(graph.urls)}
+        graph.depths = depths
+        graph.in_counts = array('I', [0]) * nodes
+        for target in targets:
+            graph.in_counts[target] += 1
+        graph.out_links = [targets[offsets[node]:offsets[node + 1]] if crawled[node] else _NO_LINKS
+                           for node in range(nodes)]
+        return graph
+
+# Graphs kept loaded by open_graph(), least recently used first
+MAX_OPEN_GRAPHS = 8
+_graphs = OrderedDict()
+
+def open_graph(graph_file):
+    """A LinkGraph for graph_file, reloaded only when the file has changed since the last call.
+
+    The instance is shared, so its PageRank is computed once per version of the file. Only the
+    MAX_OPEN_GRAPHS most recently used graphs stay loaded, so a long-running server does not
+    keep every crawl's graph in memory.
+    """
+    stat = Path(graph_file).stat()
+    key = str(Path(graph_file).resolve())
+    cached = _graphs.get(key)
+    if cached and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        _graphs.move_to_end(key)
+        return cached[1]
+    graph = LinkGraph.load(graph_file)
+    _graphs[key] = ((stat.st_size, stat.st_mtime_ns), graph)
+    _graphs.move_to_end(key)
+    while len(_graphs) > MAX_OPEN_GRAPHS:
+        _graphs.popitem(last=False)
+    return graph
+
+class Frontier:
+    """The URLs waiting to be crawled, taken in breadth-first or importance order.
+
+    bfs returns URLs in discovery order. indegree returns the URL with the most inlinks from
+    the pages crawled so far. pagerank returns the URL with the highest estimated PageRank:
+    the graph's PageRank is recomputed whenever it has grown by rerank_growth since the last
+    computation, and in between every crawled page passes a damped share of its rank to each
+    of its targets, so newly found URLs are ranked without a full recomputation per page. Ties
+    go to the URL discovered first. With max_links capping a crawl, the importance orders fetch
+    well-linked hub pages before the deep pages BFS happens to reach first.
+    """
+
+    def __init__(self, graph, order="bfs", damping=0.85, rerank_growth=0.25, min_rerank_nodes=100):
+        if order not in FRONTIER_ORDERS:
+            raise ValueError(f"Unknown frontier order '{order}', expected one of: {', '.join(FRONTIER_ORDERS)}")
+        self.graph = graph
+        self.order = order
+        self.damping = damping
+        self.rerank_growth = rerank_growth
+        self.min_rerank_nodes = min_rerank_nodes
+        self.pending = set()
+        self.fifo = deque()
+        self.heap = []
+        self.scores = {}
+        self.ranks = []
+        self.ranked_nodes = 0
+
+    def __len__(self):
+        return len(self.pending)
+
+    def __contains__(self, url):
+        return self.graph.ids.get(url) in self.pending
+
+    def add(self, url, depth=None):
+        """Queue url; the first URL added is the start page (depth 0)."""
+        node = self.graph.url_id(url, 0 if not len(self.graph) else depth)
+        if node in self.pending:
+            return
+        self.pending.add(node)
+        if self.order == "bfs":
+            self.fifo.append(node)
+        else:
+            score = self._score(node)
+            self.scores[node] = score
+            heapq.heappush(self.heap, (-score, node))
+
+    def _score(self, node):
+        if self.order == "indegree":
+            return float(self.graph.in_counts[node])
+        return self.ranks[node] if node < len(self.ranks) else 0.0
+
+    def record(self, url, links, visited=()):
+        """Add a crawled page's outlinks to the graph and queue the targets not yet visited."""
+        source, targets = self.graph.add_page(url, links)
+        if self.order == "pagerank" and len(self.graph) >= self.min_rerank_nodes \
+                and len(self.graph) >= self.ranked_nodes * (1 + self.rerank_growth):
+            self._rerank()
+        share = 0.0
+        if self.order == "pagerank" and len(targets):
+            source_rank = self.ranks[source] if source < len(self.ranks) else 1.0 / len(self.graph)
+            share = self.damping * source_rank / len(targets)
+        for target in targets:
+            url = self.graph.urls[target]
+            if url in visited:
+                continue
+            if target not in self.pending:
+                self.add(url)
+                if self.order != "pagerank":
+                    continue
+            elif self.order == "bfs":
+                continue
+            if self.order == "indegree":
+                self.scores[target] = float(self.graph.in_counts[target])
+            else:
+                self.scores[target] += share
+            heapq.heappush(self.heap, (-self.scores[target], target))
+
+    def _rerank(self):
+        self.ranks = self.graph.pagerank(damping=self.damping, tolerance=1e-4)
+        self.ranked_nodes = len(self.graph)
+        self.scores = {node: self.ranks[node] for node in self.pending}
+        self.heap = [(-score, node) for node, score in self.scores.items()]
+        heapq.heapify(self.heap)
+
+    def pop(self):
+        """The next URL to crawl; raises IndexError when the frontier is empty."""
+        if self.order == "bfs":
+            node = self.fifo.popleft()
+        else:
+            while True:
+                negative_score, node = heapq.heappop(self.heap)
+                # Skip entries superseded by a later score change
+                if node in self.pending and -negative_score == self.scores[node]:
+                    break
+            del self.scores[node]
+        self.pending.discard(node)
+        return self.graph.urls[node]
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# per-output-directory manifests so the post-crawl stages only redo work for changed inputs
+# see https://github.com/deftio/simple-py-crawlbot
+
+import os
+import json
+import hashlib
+from pathlib import Path
+from segment_store import source_stat, store_entry
+
+MANIFEST_VERSION = 1
+
+def file_stat(path):
+    """Size and mtime of a file, or of a page record in a segment store."""
+    return source_stat(path)
+
+def file_sha256(path):
+    stored = store_entry(path)
+    if stored:
+        store, name = stored
+        return store.entry(name)["sha256"]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+class Manifest:
+    """Records, for one stage writing into one output directory, each input's fingerprint and the outputs it produced.
+
+    An input is skipped when its size and mtime are unchanged (or, if only the mtime moved, its
+    SHA-256 still matches) and all of its outputs still exist unmodified. The manifest is dropped
+    entirely when the stage settings change or force is set.
+    """
+
+    def __init__(self, output_dir, stage, settings=None, force=False):
+        self.path = Path(output_dir) / f".spycrawl-{stage}.manifest"
+        self.settings = settings or {}
+        self.entries = {}
+        if force or not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == MANIFEST_VERSION and data.get("settings") == self.settings:
+            self.entries = data.get("entries", {})
+
+    def is_current(self, key, input_file):
+        """True if input_file is unchanged since it was recorded under key and its outputs are intact."""
+        entry = self.entries.get(key)
+        if not entry:
+            return False
+        try:
+            stat = file_stat(input_file)
+        except OSError:
+            return False
+        recorded = entry["input"]
+        if stat["size"] != recorded["size"]:
+            return False
+        if stat["mtime_ns"] != recorded["mtime_ns"]:
+            # Touched but maybe not changed (e.g. a recrawl rewrote the same page)
+            if file_sha256(input_file) != recorded.get("sha256"):
+                return False
+            recorded["mtime_ns"] = stat["mtime_ns"]
+        for output, fingerprint in entry["outputs"].items():
+            try:
+                if file_stat(output) != fingerprint:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def outputs(self, key):
+        entry = self.entries.get(key)
+        return list(entry["outputs"]) if entry else []
+
+    def record(self, key, input_file, outputs=()):
+        """Remember input_file's fingerprint and the outputs it produced."""
+        fingerprint = file_stat(input_file)
+        fingerprint["sha256"] = file_sha256(input_file)
+        self.entries[key] = {
+            "input": fingerprint,
+            "outputs": {str(output): file_stat(output) for output in outputs if os.path.exists(output)}
+        }
+
+    def forget(self, key):
+        self.entries.pop(key, None)
+
+    def prune(self, current_keys, delete_outputs=True):
+        """Drop entries whose inputs no longer exist, deleting their outputs. Returns the removed keys."""
+        current_keys = set(current_keys)
+        removed = [key for key in self.entries if key not in current_keys]
+        for key in removed:
+            entry = self.entries.pop(key)
+            if delete_outputs:
+                for output in entry["outputs"]:
+                    try:
+                        os.remove(output)
+                    except OSError:
+                        pass
+        return removed
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": MANIFEST_VERSION, "settings": self.settings, "entries": self.entries}, f)
+        os.replace(tmp_path, self.path)
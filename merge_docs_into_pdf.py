@@ -1,15 +1,28 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
+import json
+import time
+import shutil
+import hashlib
 import logging
+import argparse
+import multiprocessing
+from multiprocessing.connection import wait
 from pathlib import Path
-from weasyprint import HTML
-from PyPDF2 import PdfFileMerger
+import weasyprint
+from weasyprint import HTML, CSS, default_url_fetcher
+from weasyprint.text.fonts import FontConfiguration
+from PyPDF2 import PdfFileReader, PdfFileWriter
 from markdown2 import markdown
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-import yaml
+from structured_io import STRUCTURED_SUFFIXES, dump_yaml, find_structured_files, iter_records
+from manifest import Manifest, file_sha256
+from asset_cache import AssetCache
+from segment_store import find_sources, open_source, source_url, store_entry
 
 # Configure logging
 def setup_logging():
@@ -43,12 +56,52 @@ def setup_logging():
 # Initialize logging
 logger = setup_logging()
 
+# Kinds of source rendered by WeasyPrint; these are the ones worth caching
+CACHEABLE_KINDS = ("html", "md")
+
+# Input PDFs held open at once while merging
+MERGE_BATCH_SIZE = 64
+MERGE_RECORD = ".spycrawl-merge.json"
+TITLE_PATTERN = re.compile(rb'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+# Fonts, stylesheets and asset fetcher shared by every WeasyPrint render in this process
+_render_resources = None
+
+def configure_rendering(stylesheets=(), asset_cache_dir=None, offline=False):
+    """Build the resources shared by all renders: one FontConfiguration, the user stylesheets
+    parsed once, and a caching url_fetcher (see asset_cache.AssetCache).
+
+    Render processes are started fresh, not forked, so each calls this once with the same options.
+    """
+    global _render_resources
+    font_config = FontConfiguration()
+    url_fetcher = AssetCache(default_url_fetcher, asset_cache_dir, offline)
+    _render_resources = {
+        "font_config": font_config,
+        "url_fetcher": url_fetcher,
+        "stylesheets": [CSS(filename=str(stylesheet), font_config=font_config, url_fetcher=url_fetcher)
+                        for stylesheet in stylesheets],
+        "settings": {"stylesheets": [file_sha256(stylesheet) for stylesheet in stylesheets], "offline": offline},
+        "options": {"stylesheets": [str(stylesheet) for stylesheet in stylesheets],
+                    "asset_cache_dir": asset_cache_dir and str(asset_cache_dir), "offline": offline},
+    }
+    return _render_resources
+
+def render_resources():
+    return _render_resources or configure_rendering()
+
+def write_html_pdf(pdf_file, filename=None, string=None, base_url=None):
+    """Render an HTML file or string to pdf_file with the shared rendering resources."""
+    resources = render_resources()
+    document = HTML(filename, string=string, base_url=base_url, url_fetcher=resources["url_fetcher"])
+    document.write_pdf(pdf_file, stylesheets=resources["stylesheets"], font_config=resources["font_config"])
+
 def convert_html_to_pdf(source_html, output_filename):
-    HTML(source_html).write_pdf(output_filename)
+    write_html_pdf(output_filename, source_html)
 
 def convert_markdown_to_pdf(markdown_text, output_filename):
     html_text = markdown(markdown_text)
-    HTML(string=html_text).write_pdf(output_filename)
+    write_html_pdf(output_filename, string=html_text)
 
 def convert_text_to_pdf(text, output_filename):
     c = canvas.Canvas(output_filename, pagesize=letter)
@@ -59,20 +112,351 @@ def convert_text_to_pdf(text, output_filename):
     c.save()
 
 def convert_yaml_to_pdf(yaml_content, output_filename):
-    yaml_text = yaml.dump(yaml_content, default_flow_style=False)
+    yaml_text = dump_yaml(yaml_content)
     convert_text_to_pdf(yaml_text, output_filename)
 
+def convert_structured_to_pdf(structured_file, output_dir):
+    """Render every record of a YAML/JSON/JSON Lines/MessagePack file as text; returns the PDFs written."""
+    pdf_files = []
+    for source, content in iter_records(structured_file):
+        # Keep the source suffix in the name so notes.yaml and notes.html don't overwrite each other
+        source = Path(source)
+        pdf_file = Path(output_dir) / f"{source.stem}{source.suffix.replace('.', '_')}.pdf"
+        convert_yaml_to_pdf(content, str(pdf_file))
+        pdf_files.append(pdf_file)
+    return pdf_files
+
 def merge_pdfs(pdf_files, output_filename):
-    merger = PdfFileMerger()
-    for pdf in pdf_files:
-        merger.append(pdf)
-    merger.write(output_filename)
-    merger.close()
-
-def convert_files_to_pdf(input_dir, output_path):
-    """Convert HTML and Markdown files to PDF and optionally merge them"""
+    return stream_merge_pdfs(pdf_files, output_filename)
+
+def count_pdf_pages(pdf_file):
+    with open(pdf_file, 'rb') as f:
+        return PdfFileReader(f, strict=False).getNumPages()
+
+def _write_merged(pdf_files, output_filename, bookmarks=()):
+    """Append every page of pdf_files to one new PDF; only these inputs are open at a time."""
+    writer = PdfFileWriter()
+    handles = []
+    tmp_filename = f"{output_filename}.tmp"
+    try:
+        for pdf_file in pdf_files:
+            handle = open(pdf_file, 'rb')
+            handles.append(handle)
+            reader = PdfFileReader(handle, strict=False)
+            for page_number in range(reader.getNumPages()):
+                writer.addPage(reader.getPage(page_number))
+        for title, page_number in bookmarks:
+            writer.addBookmark(title, page_number)
+        # The writer only reads the page contents from the inputs here, so they stay open until now
+        with open(tmp_filename, 'wb') as f:
+            writer.write(f)
+        os.replace(tmp_filename, output_filename)
+    finally:
+        for handle in handles:
+            handle.close()
+        if os.path.exists(tmp_filename):
+            os.remove(tmp_filename)
+
+def _merge_volume(pdf_files, output_filename, bookmarks, batch_size):
+    """Merge in batches of batch_size files through temporary parts, so at most batch_size inputs are ever open."""
+    if len(pdf_files) <= batch_size:
+        _write_merged(pdf_files, output_filename, bookmarks)
+        return
+    parts = []
+    try:
+        for start in range(0, len(pdf_files), batch_size):
+            part = f"{output_filename}.part{len(parts):04d}"
+            _write_merged(pdf_files[start:start + batch_size], part)
+            parts.append(part)
+        # Parts drop outlines, so the bookmarks are only added by the final write
+        _merge_volume(parts, output_filename, bookmarks, batch_size)
+    finally:
+        for part in parts:
+            if os.path.exists(part):
+                os.remove(part)
+
+def volume_path_for(output_filename, number, count):
+    """merged.pdf when there is one volume, merged-001.pdf, merged-002.pdf... otherwise."""
+    if count == 1:
+        return str(output_filename)
+    path = Path(output_filename)
+    return str(path.with_name(f"{path.stem}-{number:03d}{path.suffix}"))
+
+def stream_merge_pdfs(entries, output_filename, batch_size=MERGE_BATCH_SIZE, volume_pages=None, volume_mb=None):
+    """Merge PDFs with a bookmark per input, optionally split into volumes, and return the written files.
+
+    entries are PDF paths or (path, bookmark title) pairs. Unlike PdfFileMerger, which keeps every
+    input open until it writes, inputs are merged in batches of batch_size files. PyPDF2 still
+    holds a whole output file in memory while writing it, so volume_pages and volume_mb (estimated
+    from input sizes) are what bound memory for very large document sets. An input is never split
+    across volumes.
+    """
+    sources = []
+    for entry in entries:
+        pdf_file, title = entry if isinstance(entry, tuple) else (entry, None)
+        sources.append((str(pdf_file), title or Path(pdf_file).stem, count_pdf_pages(pdf_file), os.path.getsize(pdf_file)))
+
+    volumes = [[]]
+    pages = size = 0
+    for source in sources:
+        _, _, source_pages, source_size = source
+        full = ((volume_pages and pages + source_pages > volume_pages) or
+                (volume_mb and size + source_size > volume_mb * 1024 * 1024))
+        if volumes[-1] and full:
+            volumes.append([])
+            pages = size = 0
+        volumes[-1].append(source)
+        pages += source_pages
+        size += source_size
+
+    written = []
+    for number, volume in enumerate(volumes, 1):
+        bookmarks = []
+        page_number = 0
+        for _, title, source_pages, _ in volume:
+            if source_pages:
+                bookmarks.append((title, page_number))
+            page_number += source_pages
+        volume_file = volume_path_for(output_filename, number, len(volumes))
+        _merge_volume([source[0] for source in volume], volume_file, bookmarks, max(2, batch_size))
+        written.append(volume_file)
+    return written
+
+def source_title(kind, source_file):
+    """Bookmark title for a source file: an HTML page's <title>, otherwise the file name."""
+    if kind == "html":
+        with open_source(source_file) as f:
+            match = TITLE_PATTERN.search(f.read(65536))
+        if match:
+            title = " ".join(match.group(1).decode('utf-8', 'replace').split())
+            if title:
+                return title
+    return Path(source_file).stem
+
+class PdfRenderCache:
+    """On-disk cache of rendered PDFs keyed by source content and render settings, bounded by size.
+
+    Entries are evicted least recently used first; a hit refreshes the entry's mtime, which is
+    what the eviction order is based on (atime is often disabled). Only the page source is
+    hashed, so a page whose linked stylesheets or images change but whose HTML does not will
+    still hit the cache.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, kind, source_file, settings):
+        digest = hashlib.sha256()
+        digest.update(json.dumps({"kind": kind, "settings": settings}, sort_keys=True).encode('utf-8'))
+        with open_source(source_file) as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _entry(self, key):
+        return self.cache_dir / key[:2] / f"{key}.pdf"
+
+    def get(self, key, pdf_file):
+        """Copy the cached PDF for key to pdf_file; returns False on a miss."""
+        entry = self._entry(key)
+        try:
+            shutil.copyfile(entry, pdf_file)
+            os.utime(entry)
+        except OSError:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def put(self, key, pdf_file):
+        entry = self._entry(key)
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        tmp_entry = entry.with_name(f"{entry.name}.{os.getpid()}.tmp")
+        shutil.copyfile(pdf_file, tmp_entry)
+        os.replace(tmp_entry, entry)
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in max_bytes. Returns the number removed."""
+        entries = []
+        total = 0
+        for entry in self.cache_dir.glob("*/*.pdf"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry))
+            total += stat.st_size
+        removed = 0
+        for _, size, entry in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                entry.unlink()
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+def render_settings():
+    """Everything besides the source content that changes the rendered PDF; part of the cache key."""
+    return dict(render_resources()["settings"], weasyprint=getattr(weasyprint, '__version__', None))
+
+def pdf_path_for(source_file, output_dir):
+    return Path(output_dir) / Path(source_file).with_suffix('.pdf').name
+
+def render_source_to_pdf(kind, source_file, output_dir):
+    """Render one input file to PDF(s) in output_dir and return the PDF paths, in order."""
+    source_file = Path(source_file)
+    if kind == "html":
+        pdf_file = pdf_path_for(source_file, output_dir)
+        if store_entry(source_file):
+            # A page in a segment store; relative links resolve against the URL it was crawled from
+            with open_source(source_file) as f:
+                write_html_pdf(pdf_file, string=f.read().decode('utf-8'), base_url=source_url(source_file))
+        else:
+            write_html_pdf(pdf_file, source_file)
+        return [pdf_file]
+    if kind == "md":
+        pdf_file = pdf_path_for(source_file, output_dir)
+        # Convert Markdown to HTML, then HTML to PDF
+        with open(source_file, 'r', encoding='utf-8') as f:
+            html_content = markdown(f.read())
+        write_html_pdf(pdf_file, string=html_content)
+        return [pdf_file]
+    # Structured text (YAML, JSON, JSON Lines, MessagePack) from clean_and_strip.py
+    return convert_structured_to_pdf(source_file, output_dir)
+
+def _render_worker(conn, options):
+    """Render process entry point: set up rendering once, then render (kind, source_file, output_dir)
+    jobs received on conn, sending back (pdf_paths, error) for each, until None arrives."""
+    try:
+        configure_rendering(**options)
+        while True:
+            job = conn.recv()
+            if job is None:
+                break
+            kind, source_file, output_dir = job
+            try:
+                conn.send(([str(pdf_file) for pdf_file in render_source_to_pdf(kind, source_file, output_dir)], None))
+            except Exception as e:
+                conn.send(([], f"{type(e).__name__}: {e}"))
+    except EOFError:
+        # The parent went away
+        pass
+    finally:
+        conn.close()
+
+def render_in_processes(jobs, output_dir, workers, timeout=None):
+    """Render (key, kind, file) jobs in up to `workers` long-lived render processes.
+
+    Each process sets up the fonts, stylesheets and asset cache once and renders file after file,
+    so they are shared by every page it renders. A process whose file exceeds `timeout` seconds
+    is killed (or one that crashes the renderer is lost) without losing the rest of the batch;
+    a new process takes its place for the next file. Yields (key, pdf_paths, error) in completion
+    order; callers restore input order themselves.
+    """
+    # Not fork: the API server calls this from a threaded process, and a forked child can inherit
+    # a lock another thread held. The forkserver imports WeasyPrint once and forks from a clean process.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+    if context.get_start_method() == 'forkserver':
+        context.set_forkserver_preload(['merge_docs_into_pdf'])
+    options = render_resources()["options"]
+    jobs = list(jobs)
+    idle = []  # (connection, process) of workers waiting for a file
+    running = {}  # connection -> (key, process, deadline)
+
+    def assign(key, kind, source_file):
+        while idle:
+            conn, process = idle.pop()
+            try:
+                conn.send((kind, source_file, output_dir))
+                return conn, process
+            except OSError:
+                # Died while idle; start another
+                conn.close()
+                process.join()
+        conn, child_conn = context.Pipe()
+        process = context.Process(target=_render_worker, args=(child_conn, options), daemon=True)
+        process.start()
+        child_conn.close()
+        conn.send((kind, source_file, output_dir))
+        return conn, process
+
+    try:
+        while jobs or running:
+            while jobs and len(running) < workers:
+                key, kind, source_file = jobs.pop(0)
+                conn, process = assign(key, kind, source_file)
+                deadline = time.monotonic() + timeout if timeout else None
+                running[conn] = (key, process, deadline)
+
+            deadlines = [deadline for _, _, deadline in running.values() if deadline]
+            wait_for = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+            for conn in wait(list(running), timeout=wait_for):
+                key, process, _ = running.pop(conn)
+                try:
+                    pdf_paths, error = conn.recv()
+                    idle.append((conn, process))
+                except EOFError:
+                    conn.close()
+                    process.join()
+                    pdf_paths, error = [], f"Renderer exited with code {process.exitcode}"
+                yield key, [Path(pdf_path) for pdf_path in pdf_paths], error
+
+            now = time.monotonic()
+            for conn, (key, process, deadline) in list(running.items()):
+                if deadline and now >= deadline:
+                    process.kill()
+                    process.join()
+                    conn.close()
+                    del running[conn]
+                    yield key, [], f"Timed out after {timeout}s"
+    finally:
+        for conn, process in idle:
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+            conn.close()
+        for conn, (_, process, _) in running.items():
+            process.kill()
+            conn.close()
+        for process in [process for _, process in idle] + [process for _, process, _ in running.values()]:
+            process.join()
+
+def find_pdf_sources(input_path):
+    """(kind, file) for every convertible file: HTML, then Markdown, then structured text, each alphabetically.
+
+    input_path may be a segment store, whose HTML pages are read straight from their segments.
+    """
+    return ([("html", f) for f in find_sources(input_path, ".html")] +
+            [("md", f) for f in sorted(input_path.glob("**/*.md"))] +
+            [("structured", f) for f in find_structured_files(input_path)])
+
+def convert_files_to_pdf(input_dir, output_path, force=False, workers=1, timeout=None,
+                         cache_dir=None, cache_max_mb=1024, merge_batch=MERGE_BATCH_SIZE,
+                         volume_pages=None, volume_mb=None, stylesheets=(), asset_cache_dir=None,
+                         offline=False):
+    """Convert HTML, Markdown and structured text files to PDF and merge them.
+
+    With workers > 1 (0 = all CPUs) or a per-file timeout, files are rendered in separate
+    processes; the merged PDF keeps input order either way. A manifest in the output directory
+    lets unchanged files reuse their existing PDFs and removes PDFs of deleted inputs; force
+    re-renders everything. With cache_dir, HTML and Markdown renders are also looked up in a
+    content-hash keyed cache shared between runs and output directories, trimmed to
+    cache_max_mb. The merge streams inputs in batches of merge_batch files, bookmarks each
+    source, and can be split into volumes of volume_pages pages or volume_mb MB (see
+    stream_merge_pdfs). All renders share one font configuration, the given user stylesheets
+    and a url_fetcher that caches linked assets, on disk in asset_cache_dir if set; offline
+    renders from that cache without touching the network. Returns a summary of the run,
+    including the merged volumes.
+    """
     try:
         logger.info(f"Starting PDF conversion from {input_dir} to {output_path}")
+        configure_rendering(stylesheets, asset_cache_dir, offline)
         
         # Create output directory if it doesn't exist
         output_dir = Path(output_path)
@@ -82,64 +466,120 @@ def convert_files_to_pdf(input_dir, output_path):
         # Process each file
         input_path = Path(input_dir)
         pdf_files = []
+        sources = find_pdf_sources(input_path)
+        kinds = [kind for kind, _ in sources]
+        logger.info(f"Found {kinds.count('html')} HTML files, {kinds.count('md')} Markdown files and "
+                    f"{kinds.count('structured')} structured text files to process")
         
-        # Get all HTML and Markdown files
-        html_files = list(input_path.glob("**/*.html"))
-        md_files = list(input_path.glob("**/*.md"))
-        logger.info(f"Found {len(html_files)} HTML files and {len(md_files)} Markdown files to process")
+        settings = render_settings()
+        # A new stylesheet, offline mode or WeasyPrint version re-renders everything, as it does for the cache
+        manifest = Manifest(output_dir, "pdf", dict(settings, input_dir=str(input_path.resolve())), force)
+        keys = {str(source_file.relative_to(input_path)): (kind, source_file) for kind, source_file in sources}
+        removed = manifest.prune(keys)
+        summary = {"total": len(sources), "rendered": 0, "cached": 0, "skipped": 0, "removed": len(removed), "failed": 0}
+        cache = PdfRenderCache(cache_dir, cache_max_mb * 1024 * 1024) if cache_dir else None
+        cache_keys = {}
         
-        # Process HTML files
-        for html_file in html_files:
-            try:
-                logger.info(f"Processing HTML file: {html_file}")
-                pdf_file = output_dir / html_file.with_suffix('.pdf').name
-                
-                # Convert HTML to PDF
-                HTML(html_file).write_pdf(pdf_file)
-                pdf_files.append(pdf_file)
-                logger.info(f"Successfully converted HTML to PDF: {pdf_file}")
-                
-            except Exception as e:
-                logger.error(f"Error processing HTML file {html_file}: {str(e)}")
-                continue
+        rendered_files = {}
+        pending = []
+        for key, (kind, source_file) in keys.items():
+            if manifest.is_current(key, source_file):
+                summary["skipped"] += 1
+                rendered_files[key] = [Path(pdf_file) for pdf_file in manifest.outputs(key)]
+            elif cache and kind in CACHEABLE_KINDS:
+                cache_keys[key] = cache.key(kind, source_file, settings)
+                pdf_file = pdf_path_for(source_file, output_dir)
+                if cache.get(cache_keys[key], pdf_file):
+                    summary["cached"] += 1
+                    manifest.record(key, source_file, [pdf_file])
+                    rendered_files[key] = [pdf_file]
+                else:
+                    pending.append((key, kind, source_file))
+            else:
+                pending.append((key, kind, source_file))
         
-        # Process Markdown files
-        for md_file in md_files:
-            try:
-                logger.info(f"Processing Markdown file: {md_file}")
-                pdf_file = output_dir / md_file.with_suffix('.pdf').name
-                
-                # Convert Markdown to HTML
-                with open(md_file, 'r', encoding='utf-8') as f:
-                    html_content = markdown(f.read())
-                
-                # Convert HTML to PDF
-                HTML(string=html_content).write_pdf(pdf_file)
+        def collect(key, rendered, error):
+            kind, source_file = keys[key]
+            if error:
+                logger.error(f"Error processing {kind} file {source_file}: {error}")
+                manifest.forget(key)
+                summary["failed"] += 1
+                return
+            manifest.record(key, source_file, rendered)
+            rendered_files[key] = rendered
+            summary["rendered"] += 1
+            if key in cache_keys and rendered:
+                cache.put(cache_keys[key], rendered[0])
+            logger.info(f"Successfully converted {kind} file to PDF: {source_file}")
+        
+        if workers is not None and workers <= 0:
+            workers = os.cpu_count() or 1
+        try:
+            if (not workers or workers == 1) and not timeout:
+                for key, kind, source_file in pending:
+                    logger.info(f"Processing {kind} file: {source_file}")
+                    try:
+                        collect(key, render_source_to_pdf(kind, source_file, output_dir), None)
+                    except Exception as e:
+                        collect(key, [], str(e))
+            elif pending:
+                logger.info(f"Rendering {len(pending)} files in up to {workers or 1} processes"
+                            + (f" with a {timeout}s timeout per file" if timeout else ""))
+                for key, rendered, error in render_in_processes(pending, output_dir, workers or 1, timeout):
+                    collect(key, rendered, error)
+        finally:
+            manifest.save()
+            if cache:
+                evicted = cache.evict()
+                logger.info(f"Render cache: {cache.hits} hits, {cache.misses} misses, {evicted} evicted")
+        
+        # Merge in input order, whichever order the files finished rendering in
+        entries = []
+        for key, (kind, source_file) in keys.items():
+            pdfs = rendered_files.get(key, [])
+            for pdf_file in pdfs:
+                entries.append((pdf_file, source_title(kind, source_file) if len(pdfs) == 1 else Path(pdf_file).stem))
                 pdf_files.append(pdf_file)
-                logger.info(f"Successfully converted Markdown to PDF: {pdf_file}")
-                
-            except Exception as e:
-                logger.error(f"Error processing Markdown file {md_file}: {str(e)}")
-                continue
         
-        # Merge PDFs if there are multiple files
-        if len(pdf_files) > 1:
+        # Merge PDFs if there are multiple files, unless nothing changed since the last merge
+        merged_pdf = output_dir / "merged.pdf"
+        merge_record_file = output_dir / MERGE_RECORD
+        merge_settings = {"inputs": [str(pdf_file) for pdf_file in pdf_files],
+                          "volume_pages": volume_pages, "volume_mb": volume_mb}
+        try:
+            with open(merge_record_file, 'r', encoding='utf-8') as f:
+                merge_record = json.load(f)
+        except (OSError, ValueError):
+            merge_record = {}
+        previous_volumes = [Path(volume) for volume in merge_record.get("volumes", [])]
+        merge_is_current = (not summary["rendered"] and not summary["cached"] and not removed and
+                            merge_record.get("settings") == merge_settings and previous_volumes and
+                            all(volume.exists() for volume in previous_volumes))
+        if merge_is_current:
+            merged_at = min(volume.stat().st_mtime for volume in previous_volumes)
+            merge_is_current = all(merged_at >= pdf_file.stat().st_mtime for pdf_file in pdf_files)
+        summary["volumes"] = [str(volume) for volume in previous_volumes] if merge_is_current else []
+        if len(pdf_files) > 1 and merge_is_current:
+            logger.info(f"Merged PDF is up to date: {', '.join(summary['volumes'])}")
+        elif len(pdf_files) > 1:
             try:
-                logger.info("Merging PDF files")
-                merger = PdfFileMerger()
-                for pdf_file in pdf_files:
-                    merger.append(str(pdf_file))
-                
-                # Save merged PDF
-                merged_pdf = output_dir / "merged.pdf"
-                merger.write(str(merged_pdf))
-                merger.close()
-                logger.info(f"Successfully merged PDFs into: {merged_pdf}")
+                logger.info(f"Merging {len(pdf_files)} PDF files")
+                volumes = stream_merge_pdfs(entries, merged_pdf, merge_batch, volume_pages, volume_mb)
+                for volume in previous_volumes:
+                    if str(volume) not in volumes and volume.exists():
+                        volume.unlink()
+                with open(merge_record_file, 'w', encoding='utf-8') as f:
+                    json.dump({"settings": merge_settings, "volumes": volumes}, f)
+                summary["volumes"] = volumes
+                logger.info(f"Successfully merged PDFs into: {', '.join(volumes)}")
                 
             except Exception as e:
                 logger.error(f"Error merging PDFs: {str(e)}")
         
-        logger.info("PDF conversion completed")
+        logger.info(f"PDF conversion completed: {summary['rendered']} rendered, {summary['cached']} from cache, "
+                    f"{summary['skipped']} unchanged, "
+                    f"{summary['removed']} removed, {summary['failed']} failed")
+        return summary
         
     except Exception as e:
         logger.error(f"Error in convert_files_to_pdf: {str(e)}")
@@ -150,6 +590,17 @@ def main():
     parser.add_argument('-d', '--directory', type=str, help='Directory containing the files to process')
     parser.add_argument('-o', '--output', type=str, help='Output PDF file name')
     parser.add_argument('--no-merge', action='store_true', help='Create separate PDFs instead of merging')
+    parser.add_argument('--force', action='store_true', help='Re-render every file, ignoring the manifest of previous runs')
+    parser.add_argument('--workers', type=int, default=1, help='Files to render in parallel (0 = all CPUs, default 1)')
+    parser.add_argument('--timeout', type=float, help='Seconds allowed per file before its render is killed')
+    parser.add_argument('--cache_dir', help='Directory of a render cache shared between runs; unchanged pages reuse their cached PDFs')
+    parser.add_argument('--cache_mb', type=int, default=1024, help='Maximum size of the render cache in MB (default 1024)')
+    parser.add_argument('--merge_batch', type=int, default=MERGE_BATCH_SIZE, help=f'PDFs held open at once while merging (default {MERGE_BATCH_SIZE})')
+    parser.add_argument('--volume_pages', type=int, help='Split the merged PDF into volumes of at most this many pages')
+    parser.add_argument('--volume_mb', type=float, help='Split the merged PDF into volumes of roughly this many MB')
+    parser.add_argument('--stylesheet', action='append', default=[], help='Extra CSS file applied to every page (repeatable)')
+    parser.add_argument('--asset_cache_dir', help='Directory caching stylesheets, images and fonts fetched while rendering')
+    parser.add_argument('--offline', action='store_true', help='Never fetch assets over the network, only use the asset cache')
     
     args = parser.parse_args()
 
@@ -157,10 +608,11 @@ def main():
         parser.print_help()
     else:
         if args.no_merge:
+            configure_rendering(args.stylesheet, args.asset_cache_dir, args.offline)
             output_dir = os.path.splitext(args.output)[0]
             os.makedirs(output_dir, exist_ok=True)
             for filename in os.listdir(args.directory):
-                if not filename.endswith(('.html', '.md', '.txt', '.yaml', '.pdf')):
+                if not filename.endswith(('.html', '.md', '.txt', '.pdf') + tuple(STRUCTURED_SUFFIXES)):
                     continue
                 filepath = os.path.join(args.directory, filename)
                 output_pdf = os.path.join(output_dir, os.path.splitext(filename)[0] + '.pdf')
@@ -171,18 +623,19 @@ def main():
                     with open(filepath, 'r') as file:
                         markdown_content = file.read()
                     convert_markdown_to_pdf(markdown_content, output_pdf)
-                elif filename.endswith('.txt') or filename.endswith('.yaml'):
+                elif filename.endswith('.txt'):
                     with open(filepath, 'r') as file:
                         text_content = file.read()
-                    if filename.endswith('.yaml'):
-                        convert_yaml_to_pdf(yaml.safe_load(text_content), output_pdf)
-                    else:
-                        convert_text_to_pdf(text_content, output_pdf)
+                    convert_text_to_pdf(text_content, output_pdf)
+                elif filename.endswith(tuple(STRUCTURED_SUFFIXES)):
+                    convert_structured_to_pdf(filepath, output_dir)
                 elif filename.endswith('.pdf'):
                     from shutil import copyfile
                     copyfile(filepath, output_pdf)
         else:
-            convert_files_to_pdf(args.directory, args.output)
+            convert_files_to_pdf(args.directory, args.output, args.force, args.workers, args.timeout,
+                                 args.cache_dir, args.cache_mb, args.merge_batch, args.volume_pages, args.volume_mb,
+                                 args.stylesheet, args.asset_cache_dir, args.offline)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# per-page timing and on-demand profiling helpers shared by crawler.py and spycrawl.py
+
+import sys
+import time
+import threading
+import cProfile
+from pathlib import Path
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+PROFILERS = ("cprofile", "sampling")
+
+class StageTimer:
+    """Accumulate wall-clock seconds spent in the named stages of one page."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - start
+
+    def as_dict(self):
+        timings = {name: round(seconds, 4) for name, seconds in self.timings.items()}
+        timings['total'] = round(sum(self.timings.values()), 4)
+        return timings
+
+class SamplingProfiler:
+    """Periodically sample the stack of one thread and count folded stacks.
+
+    The output is in the "folded" format understood by flamegraph.pl and speedscope,
+    one `frame;frame;frame count` line per distinct stack.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{Path(code.co_filename).name}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def dump(self, filename):
+        with open(filename, 'w', encoding='utf-8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+def profile_path_for(output_dir, mode, label=None):
+    """Return the profile file that sits next to (not inside) the output directory."""
+    output_path = Path(output_dir).resolve()
+    label = label or datetime.now().strftime('%Y%m%d-%H%M%S')
+    suffix = '.prof' if mode == 'cprofile' else '.folded.txt'
+    return output_path.parent / f"{output_path.name}.profile-{label}{suffix}"
+
+@contextmanager
+def profile_run(mode, output_dir, label=None):
+    """Run the enclosed block under the selected profiler and save the result.
+
+    Yields a dict whose 'path' key is filled in once the profile has been written,
+    so callers can record it after the block exits. A falsy mode profiles nothing.
+    """
+    result = {'path': None}
+    if not mode:
+        yield result
+        return
+    if mode not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{mode}', expected one of: {', '.join(PROFILERS)}")
+
+    profile_file = profile_path_for(output_dir, mode, label)
+    profile_file.parent.mkdir(parents=True, exist_ok=True)
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = SamplingProfiler()
+        profiler.start()
+    try:
+        yield result
+    finally:
+        if mode == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(str(profile_file))
+        else:
+            profiler.stop()
+            profiler.dump(profile_file)
+        result['path'] = str(profile_file)
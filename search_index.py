@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# SQLite FTS5 full-text index of crawled pages, kept in crawls.db next to the crawl sessions
+# see https://github.com/deftio/simple-py-crawlbot
+
+import threading
+
+from sqlalchemy import text
+
+SEARCH_TABLE = "page_search"
+DOCS_TABLE = "page_search_docs"
+# Title matches count ten times as much as body matches
+RANK_FUNCTION = "bm25(10.0, 1.0)"
+# Crawl workers index pages from several threads; one write transaction at a time avoids "database is locked"
+_write_lock = threading.Lock()
+
+def create_search_index(engine):
+    """Create the FTS5 table and the table mapping its rowids to (session, url), if missing.
+
+    The mapping table is what makes re-indexing a page and filtering by session cheap: both
+    are primary-key or unique-index lookups instead of scans of the full-text table.
+    """
+    with engine.begin() as conn:
+        conn.execute(text(f"""
+            CREATE TABLE IF NOT EXISTS {DOCS_TABLE} (
+                id INTEGER PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                url TEXT NOT NULL,
+                file_path TEXT,
+                UNIQUE (session_id, url)
+            )"""))
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {DOCS_TABLE}_session ON {DOCS_TABLE} (session_id)"))
+        conn.execute(text(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+            USING fts5(title, body, tokenize='porter unicode61')"""))
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', :rank)"),
+                     {"rank": RANK_FUNCTION})
+
+def index_page(engine, session_id, url, file_path, title, body):
+    """Add a page to the index, replacing what was indexed for the same URL in the same session."""
+    with _write_lock, engine.begin() as conn:
+        doc_id = conn.execute(text(f"SELECT id FROM {DOCS_TABLE} WHERE session_id = :session_id AND url = :url"),
+                              {"session_id": session_id, "url": url}).scalar()
+        if doc_id is None:
+            doc_id = conn.execute(text(f"INSERT INTO {DOCS_TABLE} (session_id, url, file_path) "
+                                       f"VALUES (:session_id, :url, :file_path)"),
+                                  {"session_id": session_id, "url": url, "file_path": file_path}).lastrowid
+        else:
+            conn.execute(text(f"UPDATE {DOCS_TABLE} SET file_path = :file_path WHERE id = :id"),
+                         {"file_path": file_path, "id": doc_id})
+            conn.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid = :id"), {"id": doc_id})
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE} (rowid, title, body) VALUES (:id, :title, :body)"),
+                     {"id": doc_id, "title": title or "", "body": body or ""})
+
+def search(engine, query, session_id=None, limit=20, offset=0):
+    """Best-ranked pages matching an FTS5 query, with a highlighted snippet of each.
+
+    query uses FTS5 syntax (words, "phrases", AND/OR/NOT, prefix*, title:word); a malformed
+    query raises sqlalchemy.exc.OperationalError. Every match is ranked before the best ones are
+    returned, so word and phrase queries stay fast on large indexes while a very short prefix
+    that matches most pages takes as long as ranking them all.
+    """
+    session_filter = "AND d.session_id = :session_id" if session_id else ""
+    with engine.connect() as conn:
+        rows = conn.execute(text(f"""
+            SELECT d.session_id, d.url, d.file_path, s.title,
+                   snippet({SEARCH_TABLE}, 1, '<b>', '</b>', '...', 24) AS snippet,
+                   s.rank
+            FROM {SEARCH_TABLE} AS s
+            JOIN {DOCS_TABLE} AS d ON d.id = s.rowid
+            WHERE {SEARCH_TABLE} MATCH :query {session_filter}
+            ORDER BY s.rank
+            LIMIT :limit OFFSET :offset"""),
+            {"query": query, "session_id": session_id, "limit": limit, "offset": offset})
+        return [{
+            "session_id": row.session_id,
+            "url": row.url,
+            "file_path": row.file_path,
+            "title": row.title,
+            "snippet": row.snippet,
+            # bm25 is lower for better matches; negate it so higher scores rank first
+            "score": round(-row.rank, 6)
+        } for row in rows]
+
+def delete_session(engine, session_id=None):
+    """Remove one session's pages from the index, or every page if session_id is None."""
+    with engine.begin() as conn:
+        if session_id is None:
+            conn.execute(text(f"DELETE FROM {SEARCH_TABLE}"))
+            conn.execute(text(f"DELETE FROM {DOCS_TABLE}"))
+            return
+        conn.execute(text(f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN "
+                          f"(SELECT id FROM {DOCS_TABLE} WHERE session_id = :session_id)"),
+                     {"session_id": session_id})
+        conn.execute(text(f"DELETE FROM {DOCS_TABLE} WHERE session_id = :session_id"), {"session_id": session_id})
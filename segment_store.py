@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# packed, compressed storage for crawled pages: records appended to rolling segment files plus an offset index
+# see https://github.com/deftio/simple-py-crawlbot
+
+import io
+import os
+import gzip
+import json
+import time
+import hashlib
+import threading
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+INDEX_FILENAME = "segments.index"
+SEGMENT_PATTERN = "segment-{:05d}.seg"
+CODECS = ("zstd", "gzip")
+STORAGE_MODES = ("files", "segments")
+
+def default_codec():
+    return "zstd" if zstandard else "gzip"
+
+def compress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("The zstd codec requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Reading zstd segments requires the zstandard package (pip install zstandard)")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def is_segment_store(path):
+    return (Path(path) / INDEX_FILENAME).is_file()
+
+class SegmentWriter:
+    """Append pages to a segment store.
+
+    Every record is compressed on its own (zstd when the zstandard package is installed,
+    gzip otherwise) so it can be read back without touching its neighbours. Records go to
+    segment-00001.seg until it reaches segment_mb, then to the next segment. After each record
+    one JSON line with its segment, offset and length is appended to segments.index; a record
+    cut short by a crash never reaches the index, so readers never see it. Writing a name
+    again supersedes the earlier record.
+    """
+
+    def __init__(self, store_dir, codec=None, segment_mb=256):
+        self.store_dir = Path(store_dir)
+        self.store_dir.mkdir(parents=True, exist_ok=True)
+        self.codec = codec or default_codec()
+        if self.codec not in CODECS:
+            raise ValueError(f"Unknown codec '{self.codec}', expected one of: {', '.join(CODECS)}")
+        self.segment_bytes = int(segment_mb * 1024 * 1024)
+        segments = sorted(self.store_dir.glob("segment-*.seg"))
+        self.segment_number = int(segments[-1].stem.split("-")[1]) if segments else 1
+        self.segment = None
+        self.index = open(self.store_dir / INDEX_FILENAME, 'a', encoding='utf-8')
+        # Compression runs outside it, so crawl workers only wait for each other's appends
+        self.lock = threading.Lock()
+
+    def _segment_file(self):
+        if self.segment and self.segment.tell() >= self.segment_bytes:
+            self.segment.close()
+            self.segment = None
+            self.segment_number += 1
+        if self.segment is None:
+            self.segment = open(self.store_dir / SEGMENT_PATTERN.format(self.segment_number), 'ab')
+        return self.segment
+
+    def write(self, name, data, **metadata):
+        """Store data (str or bytes) under name and return its index entry."""
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        record = compress(data, self.codec)
+        digest = hashlib.sha256(data).hexdigest()
+        with self.lock:
+            segment = self._segment_file()
+            offset = segment.tell()
+            segment.write(record)
+            segment.flush()
+            entry = {
+                "name": name,
+                "segment": Path(segment.name).name,
+                "offset": offset,
+                "length": len(record),
+                "size": len(data),
+                "codec": self.codec,
+                "sha256": digest,
+                "mtime_ns": time.time_ns(),
+                **metadata
+            }
+            self.index.write(json.dumps(entry) + "\n")
+            self.index.flush()
+        return entry
+
+    def close(self):
+        with self.lock:
+            if self.segment:
+                self.segment.close()
+            self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class SegmentStore:
+    """Random access to the records of a segment store, through its index."""
+
+    def __init__(self, store_dir):
+        self.store_dir = Path(store_dir)
+        self.entries = {}
+        with open(self.store_dir / INDEX_FILENAME, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries[entry["name"]] = entry
+
+    def names(self, suffix=None):
+        return sorted(name for name in self.entries if suffix is None or name.endswith(suffix))
+
+    def __contains__(self, name):
+        return name in self.entries
+
+    def entry(self, name):
+        return self.entries[name]
+
+    def read(self, name):
+        entry = self.entries[name]
+        with open(self.store_dir / entry["segment"], 'rb') as f:
+            f.seek(entry["offset"])
+            return decompress(f.read(entry["length"]), entry["codec"])
+
+    def stored_bytes(self):
+        return sum(entry["length"] for entry in self.entries.values())
+
+_stores = {}
+
+def open_store(store_dir):
+    """A SegmentStore for store_dir, reloaded only when its index has grown since the last call."""
+    store_dir = Path(store_dir)
+    stat = os.stat(store_dir / INDEX_FILENAME)
+    key = str(store_dir.resolve())
+    cached = _stores.get(key)
+    if cached and cached[0] == (stat.st_size, stat.st_mtime_ns):
+        return cached[1]
+    store = SegmentStore(store_dir)
+    _stores[key] = ((stat.st_size, stat.st_mtime_ns), store)
+    return store
+
+def store_entry(path):
+    """(store, name) when path names a record in a segment store rather than a file on disk, else None."""
+    path = Path(path)
+    if path.exists() or not is_segment_store(path.parent):
+        return None
+    store = open_store(path.parent)
+    return (store, path.name) if path.name in store else None
+
+def open_source(path):
+    """Open a page for binary reading, whether it is a file or a record in a segment store."""
+    stored = store_entry(path)
+    if stored:
+        store, name = stored
+        return io.BytesIO(store.read(name))
+    return open(path, 'rb')
+
+def source_stat(path):
+    """Size and mtime of a file, or of a stored record (its uncompressed size and when it was written)."""
+    stored = store_entry(path)
+    if stored:
+        store, name = stored
+        entry = store.entry(name)
+        return {"size": entry["size"], "mtime_ns": entry["mtime_ns"]}
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def source_url(path):
+    """The URL a stored page was fetched from, if it is a record that kept one."""
+    stored = store_entry(path)
+    if stored:
+        store, name = stored
+        return store.entry(name).get("url")
+    return None
+
+def find_sources(input_dir, suffix):
+    """Files under input_dir ending in suffix, or the matching records if input_dir is a segment store, sorted."""
+    input_path = Path(input_dir)
+    if is_segment_store(input_path):
+        return [input_path / name for name in open_store(input_path).names(suffix)]
+    return sorted(input_path.glob(f"**/*{suffix}"))
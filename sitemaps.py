@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# sitemap.xml and robots.txt Sitemap: discovery to seed the crawl frontier
+# see https://github.com/deftio/simple-py-crawlbot
+
+import io
+import gzip
+import logging
+import requests
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+
+logger = logging.getLogger(__name__)
+
+FETCH_TIMEOUT = 15
+MAX_SITEMAP_URLS = 100000
+MAX_SITEMAPS = 500
+
+def parse_lastmod(value):
+    """A <lastmod> (W3C datetime: a date, or a date and time with an offset) as an aware UTC datetime, or None."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+def robots_sitemaps(robots_txt, robots_url):
+    """The URLs of the Sitemap: lines of a robots.txt (they apply whatever user-agent group they are in)."""
+    urls = []
+    for line in robots_txt.splitlines():
+        field, _, value = line.split("#", 1)[0].partition(":")
+        if field.strip().lower() == "sitemap" and value.strip():
+            urls.append(urljoin(robots_url, value.strip()))
+    return urls
+
+def iter_sitemap(data):
+    """Yield ('url', loc, lastmod) for a <urlset> and ('sitemap', loc, lastmod) for a <sitemapindex>.
+
+    data is the raw body; gzipped sitemaps are recognised by their magic bytes, as servers
+    label them inconsistently. The XML is parsed incrementally and every entry is discarded
+    once read, so a 50,000-URL sitemap never sits in memory as a tree.
+    """
+    stream = io.BytesIO(data)
+    if data[:2] == b"\x1f\x8b":
+        stream = gzip.GzipFile(fileobj=stream)
+    loc = lastmod = None
+    for _, element in ET.iterparse(stream, events=("end",)):
+        # Tags carry the sitemap namespace (or none); match the local name only
+        tag = element.tag.rsplit("}", 1)[-1]
+        if tag == "loc":
+            loc = (element.text or "").strip()
+        elif tag == "lastmod":
+            lastmod = (element.text or "").strip() or None
+        elif tag in ("url", "sitemap"):
+            if loc:
+                yield tag, loc, lastmod
+            loc = lastmod = None
+            element.clear()
+
+class SitemapSeeder:
+    """Find a site's sitemaps and turn their URLs into frontier seeds.
+
+    load() reads robots.txt for Sitemap: lines (falling back to /sitemap.xml if it lists none)
+    plus any sitemap_urls given, follows sitemap indexes breadth-first and keeps the <loc> and
+    <lastmod> of every page on the start URL's host, up to max_urls pages and max_sitemaps
+    sitemap files. With since, pages whose lastmod is older are left out, so an incremental
+    crawl starts on what changed; pages without a lastmod are always kept. lastmod maps each
+    canonical seed URL to its <lastmod> string, for recording with the crawled page.
+    """
+
+    def __init__(self, sitemap_urls=None, robots=True, since=None, max_urls=MAX_SITEMAP_URLS, max_sitemaps=MAX_SITEMAPS):
+        self.sitemap_urls = list(sitemap_urls or [])
+        self.robots = robots
+        self.since = parse_lastmod(since) if since else None
+        if since and self.since is None:
+            raise ValueError(f"Invalid sitemap since date '{since}', expected e.g. 2024-01-31 or 2024-01-31T12:00:00Z")
+        self.max_urls = max_urls
+        self.max_sitemaps = max_sitemaps
+        self.lastmod = {}
+        self.session = requests.Session()
+        self.stats = {"sitemaps_fetched": 0, "sitemaps_failed": 0, "urls_found": 0, "urls_listed": 0,
+                      "unchanged_since": 0, "other_host": 0, "invalid_urls": 0}
+
+    def _fetch(self, url):
+        try:
+            response = self.session.get(url, timeout=FETCH_TIMEOUT)
+        except requests.RequestException as e:
+            logger.warning(f"Could not fetch {url}: {e}")
+            return None
+        if response.status_code != 200:
+            logger.debug(f"{url} returned HTTP {response.status_code}")
+            return None
+        return response
+
+    def _discover(self, start_url):
+        parts = urlsplit(start_url)
+        sitemaps = list(self.sitemap_urls)
+        if self.robots:
+            robots_url = f"{parts.scheme}://{parts.netloc}/robots.txt"
+            response = self._fetch(robots_url)
+            declared = robots_sitemaps(response.text, robots_url) if response else []
+            logger.info(f"robots.txt declares {len(declared)} sitemap(s)")
+            sitemaps += declared or [f"{parts.scheme}://{parts.netloc}/sitemap.xml"]
+        return sitemaps
+
+    def load(self, start_url, canon):
+        """Canonical URLs of the seeds, in sitemap order; fills lastmod."""
+        host = urlsplit(canon.canonicalize(start_url)).netloc
+        seeds = []
+        pending = self._discover(start_url)
+        seen = set()
+        while pending and len(seen) < self.max_sitemaps and len(seeds) < self.max_urls:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in seen:
+                continue
+            seen.add(sitemap_url)
+            response = self._fetch(sitemap_url)
+            if response is None:
+                self.stats["sitemaps_failed"] += 1
+                continue
+            self.stats["sitemaps_fetched"] += 1
+            try:
+                for kind, loc, lastmod in iter_sitemap(response.content):
+                    if kind == "sitemap":
+                        pending.append(urljoin(sitemap_url, loc))
+                        continue
+                    self.stats["urls_found"] += 1
+                    try:
+                        url = canon.discover(loc, sitemap_url)
+                    except ValueError as e:
+                        # e.g. a bad port; skip this <loc> and keep the rest of the sitemap
+                        self.stats["invalid_urls"] += 1
+                        logger.debug(f"Skipping invalid sitemap URL {loc!r}: {e}")
+                        continue
+                    if urlsplit(url).netloc != host:
+                        self.stats["other_host"] += 1
+                        continue
+                    if self.since and (parse_lastmod(lastmod) or self.since) < self.since:
+                        self.stats["unchanged_since"] += 1
+                        continue
+                    if url not in self.lastmod:
+                        self.lastmod[url] = lastmod
+                        seeds.append(url)
+                        if len(seeds) >= self.max_urls:
+                            break
+            except (ET.ParseError, OSError, EOFError) as e:
+                self.stats["sitemaps_failed"] += 1
+                logger.warning(f"Could not parse sitemap {sitemap_url}: {e}")
+        self.stats["urls_listed"] = len(seeds)
+        logger.info(f"Seeding the frontier with {len(seeds)} URLs from {self.stats['sitemaps_fetched']} sitemap(s)")
+        return seeds
+
+    def summary(self):
+        return dict(self.stats)
+
+    def close(self):
+        self.session.close()
@@ -3,7 +3,14 @@
 import os
 import json
 import sys
+import mimetypes
 import logging
+import signal
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
 from pathlib import Path
 from urllib.parse import urljoin, urlparse
 from selenium import webdriver
@@ -13,11 +20,11 @@ from selenium.common.exceptions import WebDriverException
 from webdriver_manager.chrome import ChromeDriverManager
 from bs4 import BeautifulSoup, Comment, NavigableString
 import time
-from fastapi import FastAPI, Form, HTTPException
+from fastapi import FastAPI, Form, HTTPException, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict
 import uvicorn
 import yaml
@@ -26,12 +33,25 @@ from PyPDF2 import PdfFileMerger
 from markdown2 import markdown
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
 import uuid
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Boolean, JSON
+from sqlalchemy import create_engine, event, Column, String, DateTime, Integer, Boolean, JSON, inspect, text, and_, or_
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from profiling import StageTimer, profile_run, PROFILERS
+from warc_writer import WarcWriter, find_capture, read_record, parse_http_response, parse_timestamp
+from segment_store import STORAGE_MODES, SegmentWriter, is_segment_store, store_entry, source_stat
+from search_index import create_search_index, index_page, search as search_pages, delete_session as delete_search_session
+from sqlalchemy.exc import OperationalError
+from link_graph import LinkGraph, Frontier, open_graph
+from url_canon import UrlCanonicalizer, find_rel_canonical
+from crawl_scope import CrawlScope
+from sitemaps import SitemapSeeder
+from http_cache import HttpCache
+from concurrency import SKIP, STOP, WAIT, AimdController, WorkerPool
+from fetch_guard import FetchGuard, PageLoadError
+from file_export import EXPORT_FORMATS, list_files as list_output_files, stream_archive, parse_range, iter_file_range
 
 # Configure logging
 def setup_logging():
@@ -70,6 +90,7 @@ try:
     from clean_and_strip import process_html_files
     from yaml_to_json import convert_yaml_to_json
     from merge_docs_into_pdf import convert_files_to_pdf
+    from crawl_pipeline import CrawlPipeline, PIPELINE_FORMATS
     logger.info("Successfully imported all helper scripts")
 except ImportError as e:
     logger.error(f"Failed to import helper scripts: {e}")
@@ -106,24 +127,100 @@ class CrawlRequest(BaseModel):
     show_progress: Optional[bool] = False
     clean_content: Optional[bool] = True
     max_links: Optional[int]
+    profile: Optional[str] = None  # cprofile or sampling
+    pipeline: Optional[bool] = False  # clean, convert and render each page to PDF while crawling
+    pipeline_workers: int = Field(1, ge=1)  # processes for the clean and PDF stages
+    pipeline_queue_size: int = Field(32, ge=1)  # pages waiting per stage before the stage feeding it blocks
+    pipeline_format: Optional[str] = "yaml"  # yaml, json or msgpack
+    pipeline_pdf: Optional[bool] = True  # also render and merge PDFs
+    pipeline_timeout: float = Field(120, gt=0)  # seconds a page may take to clean or render before it counts as failed
+    storage: Optional[str] = "files"  # files, or segments: compressed pages packed into segment files
+    segment_mb: Optional[int] = 256  # size at which a new segment file is started
+    warc: Optional[bool] = False  # also archive request, response and rendered DOM to a WARC file
+    warc_dom_only: Optional[bool] = False  # archive only the rendered DOM, without fetching each page again
+    search_index: Optional[bool] = True  # add each page's text to the full-text index behind /api/search
+    frontier: Optional[str] = "bfs"  # bfs, indegree or pagerank: which queued page to crawl next
+    strip_query: Optional[bool] = False  # drop every query string
+    keep_params: Optional[List[str]] = None  # keep only these query parameters (* wildcards allowed)
+    strip_params: Optional[List[str]] = None  # drop these query parameters; None = common tracking parameters
+    trailing_slash: Optional[str] = "strip"  # strip, add or keep the trailing slash of paths
+    rel_canonical: Optional[bool] = True  # treat a page's <link rel="canonical"> URL as the same page
+    include: Optional[List[str]] = None  # only crawl URLs matching one of these globs ('re:' prefix for a regex)
+    exclude: Optional[List[str]] = None  # never crawl URLs matching one of these, e.g. "*/logout*"
+    max_depth: Optional[int] = None  # only follow links up to this many clicks from the start page
+    skip_extensions: Optional[List[str]] = None  # never fetched; None = documents, images, media and archives
+    prefix_limits: Optional[Dict[str, int]] = None  # at most N URLs per path prefix, e.g. {"/calendar/": 50}
+    head_check: Optional[bool] = False  # HEAD each page first and skip URLs that are not HTML
+    sitemaps: Optional[bool] = False  # seed the crawl with the URLs of the sitemaps in robots.txt (or /sitemap.xml)
+    sitemap_urls: Optional[List[str]] = None  # sitemaps or sitemap indexes to seed from as well
+    sitemap_since: Optional[str] = None  # only seed sitemap URLs with a lastmod on or after this date
+    cache_dir: Optional[str] = None  # record pages and HTTP responses here, or replay them with cache_mode "replay"
+    cache_mode: Optional[str] = "record"  # "record" from the live site or "replay" with no browser or network
+    max_workers: Optional[int] = 1  # most browsers fetching at once; adapts to latency, errors, CPU and memory
+    max_per_host: Optional[int] = None  # most pages fetched at once from one host (default: max_workers)
+    navigation_timeout: Optional[float] = 30  # seconds a page may take to load before the attempt fails
+    render_timeout: Optional[float] = 10  # seconds the browser may take to hand back the rendered page
+    retries: Optional[int] = 2  # retries of a page that timed out or lost its connection, with jittered backoff
+    breaker_failures: Optional[int] = 5  # failures in a row after which a host is paused while other hosts are crawled
+    breaker_cooldown: Optional[float] = 30  # seconds before a paused host is tried again (doubles while it fails)
+    requeue_failed_from: Optional[str] = None  # session id whose failed URLs are queued again
+    wait: Optional[bool] = True  # return the result when the crawl has finished; False returns the queued session id at once
+    wait_timeout: float = Field(3600, gt=0)  # seconds to wait for the result before answering 504; the job keeps running
 
 class CleanRequest(BaseModel):
     input_dir: str
     output_dir: str
+    workers: Optional[int] = 1  # 0 = all CPUs
+    chunk_size: int = Field(64, ge=1)  # files handed to a worker at a time
+    extractor: Optional[str] = "soup"  # soup or stream (bounded memory, for very large pages)
+    output_format: Optional[str] = "yaml"  # yaml, json, jsonl (single corpus.jsonl) or msgpack
+    force: Optional[bool] = False  # reprocess files the manifest says are unchanged
 
 class ConvertRequest(BaseModel):
     input_dir: str
     output_dir: str
+    force: Optional[bool] = False
+    workers: Optional[int] = 1  # 0 = all CPUs
+    chunk_size: int = Field(64, ge=1)  # files handed to a worker at a time
+    corpus: Optional[bool] = False  # write one corpus.jsonl instead of a JSON file per record
 
 class PDFRequest(BaseModel):
     directory: str
     output: str
     no_merge: Optional[bool] = False
+    force: Optional[bool] = False
+    workers: Optional[int] = 1  # 0 = all CPUs
+    timeout: Optional[float] = None  # seconds per file before its render is killed
+    cache_dir: Optional[str] = None  # render cache shared between runs; unchanged pages reuse cached PDFs
+    cache_mb: Optional[int] = 1024  # maximum size of the render cache
+    merge_batch: Optional[int] = 64  # PDFs held open at once while merging
+    volume_pages: Optional[int] = None  # split the merged PDF into volumes of at most this many pages
+    volume_mb: Optional[float] = None  # ... or of roughly this many MB
+    stylesheets: Optional[List[str]] = []  # extra CSS files applied to every page
+    asset_cache_dir: Optional[str] = None  # on-disk cache of stylesheets, images and fonts
+    offline: Optional[bool] = False  # only use the asset cache, never the network
 
-# Database setup
+# Database setup: the one store of job state, shared by every API and crawl worker process
 Base = declarative_base()
-engine = create_engine('sqlite:///crawls.db')
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///crawls.db")
+engine = create_engine(DATABASE_URL, connect_args={"timeout": 30} if DATABASE_URL.startswith("sqlite") else {})
 SessionLocal = sessionmaker(bind=engine)
+# The full-text index is an SQLite FTS5 table; with another database (e.g. PostgreSQL) search is off
+SEARCH_AVAILABLE = engine.dialect.name == "sqlite"
+# How often crawl workers look for jobs and waiting requests look for results
+JOB_POLL_SECONDS = 0.5
+# A running job (or crawl worker) that has not reported for HEARTBEAT_TIMEOUT seconds is taken for dead
+HEARTBEAT_SECONDS = 10
+HEARTBEAT_TIMEOUT = 60
+RUN_MODES = ("dev", "serve", "worker")
+
+@event.listens_for(engine, "connect")
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    # Write-ahead logging lets other processes read while a crawl worker writes
+    if engine.dialect.name == "sqlite":
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
 
 class CrawlJob(Base):
     __tablename__ = 'crawl_jobs'
@@ -131,13 +228,23 @@ class CrawlJob(Base):
     id = Column(String, primary_key=True)
     start_url = Column(String, nullable=False)
     timestamp = Column(DateTime, nullable=False)
-    status = Column(String, nullable=False)  # pending, running, completed, failed, stopped
+    status = Column(String, nullable=False)  # pending (queued), running, completed, failed, stopped
     output_dir = Column(String)
     total_pages = Column(Integer, default=0)
     total_bytes = Column(Integer, default=0)
     error_message = Column(String)
     pages = Column(JSON)  # Store pages as JSON
     current_url = Column(String)  # Track current URL being crawled
+    profile_path = Column(String)  # Profile saved next to output_dir when profiling was requested
+    warc_path = Column(String)  # WARC archive of the crawl, when requested
+    graph_path = Column(String)  # link graph of the crawl
+    concurrency = Column(JSON)  # current concurrency limits and their adjustment history
+    failed_urls = Column(JSON)  # URLs that failed for good, with the error and attempts, for requeueing
+    request = Column(JSON)  # the CrawlRequest, for the crawl worker that claims the job
+    result = Column(JSON)  # what /api/crawl returns for the finished job, except the pages
+    worker_id = Column(String)  # host:pid of the crawl worker running the job
+    heartbeat = Column(DateTime)  # last time that worker reported the job alive
+    finished_at = Column(DateTime)  # when the worker finished with the job, whatever its status
     
     def to_dict(self):
         return {
@@ -150,52 +257,155 @@ class CrawlJob(Base):
             "total_bytes": self.total_bytes,
             "error_message": self.error_message,
             "pages": self.pages or [],
-            "current_url": self.current_url
+            "current_url": self.current_url,
+            "profile_path": self.profile_path,
+            "warc_path": self.warc_path,
+            "graph_path": self.graph_path,
+            "concurrency": self.concurrency,
+            "failed_urls": self.failed_urls or [],
+            "worker_id": self.worker_id,
+            "heartbeat": self.heartbeat.isoformat() if self.heartbeat else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
         }
 
+class CrawlWorker(Base):
+    __tablename__ = 'crawl_workers'
+    
+    id = Column(String, primary_key=True)  # host:pid
+    started_at = Column(DateTime, nullable=False)
+    heartbeat = Column(DateTime)  # last time the worker reported alive
+
+def migrate_schema():
+    """Add columns introduced after a database was created; create_all only creates missing tables."""
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        with engine.begin() as conn:
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                    logger.info(f"Added column {table.name}.{column.name}")
+
 # Create tables
 Base.metadata.create_all(engine)
+migrate_schema()
+if SEARCH_AVAILABLE:
+    create_search_index(engine)
+else:
+    logger.warning(f"Full-text search needs SQLite; it is disabled with the {engine.dialect.name} database")
 
 class CrawlManager:
+    """Crawl jobs and their state. Everything lives in the database, nothing in the process, so any
+    number of API and crawl worker processes share the same jobs: reads always go to the database,
+    a job is claimed by exactly one crawl worker, and a stop is a status the crawl reads back."""
+
     def __init__(self):
         self.db = SessionLocal()
-        self.active_crawls = {}  # Track active crawls by session ID
         
-    def create_session(self, url: str) -> CrawlJob:
+    def create_session(self, url: str, request: Optional[Dict] = None) -> CrawlJob:
         job = CrawlJob(
             id=str(uuid.uuid4()),
             start_url=url,
             timestamp=datetime.now(),
             status="pending",
-            pages=[]
+            pages=[],
+            request=request
         )
         self.db.add(job)
         self.db.commit()
         return job
         
     def get_session(self, session_id: str) -> Optional[CrawlJob]:
-        return self.db.query(CrawlJob).filter(CrawlJob.id == session_id).first()
+        # populate_existing: another process may have changed the job since this one last read it
+        return self.db.query(CrawlJob).populate_existing().filter(CrawlJob.id == session_id).first()
         
     def list_sessions(self) -> List[Dict]:
-        jobs = self.db.query(CrawlJob).order_by(CrawlJob.timestamp.desc()).all()
+        jobs = self.db.query(CrawlJob).populate_existing().order_by(CrawlJob.timestamp.desc()).all()
         return [job.to_dict() for job in jobs]
         
     def update_session(self, job: CrawlJob):
         self.db.commit()
 
     def stop_session(self, session_id: str) -> bool:
+        """Stop a queued job, or ask the crawl worker running it to stop after the current page."""
         job = self.get_session(session_id)
-        if job and job.status == "running":
+        if job and job.status in ("pending", "running"):
             job.status = "stopped"
             self.update_session(job)
             return True
         return False
 
+    def claim_session(self, worker_id: str) -> Optional[CrawlJob]:
+        """The oldest queued job, now running on worker_id, or None if nothing is queued.
+        The status check in the UPDATE makes the claim atomic between competing workers."""
+        while True:
+            job = self.db.query(CrawlJob).filter(CrawlJob.status == "pending") \
+                .order_by(CrawlJob.timestamp).first()
+            if not job:
+                self.db.commit()
+                return None
+            claimed = self.db.query(CrawlJob).filter(CrawlJob.id == job.id, CrawlJob.status == "pending") \
+                .update({"status": "running", "worker_id": worker_id, "heartbeat": datetime.now()},
+                        synchronize_session=False)
+            self.db.commit()
+            if claimed:
+                return self.get_session(job.id)
+
+    def finish_session(self, job: CrawlJob, error: Optional[str] = None):
+        """Record that the worker is done with job; with an error, the job failed."""
+        if error is not None:
+            job.status = "failed"
+            job.error_message = error
+        job.finished_at = datetime.now()
+        self.update_session(job)
+
+    def fail_stale_sessions(self, timeout: float = HEARTBEAT_TIMEOUT) -> int:
+        """Mark failed the unfinished jobs whose crawl worker has not reported for timeout seconds."""
+        cutoff = datetime.fromtimestamp(time.time() - timeout)
+        stale = self.db.query(CrawlJob).filter(
+            CrawlJob.finished_at.is_(None),
+            or_(CrawlJob.status == "running", and_(CrawlJob.status == "stopped", CrawlJob.worker_id.isnot(None))),
+            or_(CrawlJob.heartbeat.is_(None), CrawlJob.heartbeat < cutoff)
+        ).update({"status": "failed", "error_message": "The crawl worker running this job stopped responding",
+                  "finished_at": datetime.now()}, synchronize_session=False)
+        self.db.commit()
+        if stale:
+            logger.warning(f"Marked {stale} crawl job(s) failed: their crawl worker stopped responding")
+        return stale
+
+    def fail_unclaimed_session(self, session_id: str, error: str) -> bool:
+        """Mark a job failed if no crawl worker has claimed it yet; False if one has."""
+        failed = self.db.query(CrawlJob).filter(CrawlJob.id == session_id, CrawlJob.status == "pending") \
+            .update({"status": "failed", "error_message": error, "finished_at": datetime.now()},
+                    synchronize_session=False)
+        self.db.commit()
+        return bool(failed)
+
+    def register_worker(self, worker_id: str):
+        self.db.merge(CrawlWorker(id=worker_id, started_at=datetime.now(), heartbeat=datetime.now()))
+        self.db.commit()
+
+    def unregister_worker(self, worker_id: str):
+        self.db.query(CrawlWorker).filter(CrawlWorker.id == worker_id).delete(synchronize_session=False)
+        self.db.commit()
+
+    def live_workers(self, timeout: float = HEARTBEAT_TIMEOUT) -> int:
+        """The number of crawl workers that have reported alive in the last timeout seconds."""
+        cutoff = datetime.fromtimestamp(time.time() - timeout)
+        count = self.db.query(CrawlWorker).filter(CrawlWorker.heartbeat >= cutoff).count()
+        self.db.commit()
+        return count
+
     def clear_all_sessions(self):
         jobs = self.db.query(CrawlJob).all()
         for job in jobs:
             self.db.delete(job)
         self.db.commit()
+        if SEARCH_AVAILABLE:
+            delete_search_session(engine)
 
 # Initialize the crawl manager
 crawl_manager = CrawlManager()
@@ -237,10 +447,21 @@ def managed_browser():
             except Exception as e:
                 logger.error(f"Error closing driver: {str(e)}")
 
-def normalize_url(base, url):
+@contextmanager
+def crawl_browser(http_cache=None, guard=None):
+    """A driver for one crawl worker: a replay driver when replaying from http_cache, otherwise a
+    managed browser (recording into http_cache if given) with the guard's timeouts."""
+    if http_cache and http_cache.replaying:
+        yield http_cache.driver()
+        return
+    with managed_browser() as driver:
+        if guard:
+            guard.apply_timeouts(driver)
+        yield http_cache.driver(driver) if http_cache else driver
+
+def normalize_url(base, url, canon=None):
     try:
-        parsed = urlparse(urljoin(base, url.strip()))
-        return f"{parsed.scheme}://{parsed.netloc}{parsed.path}"
+        return (canon or UrlCanonicalizer()).canonicalize(url, base)
     except Exception as e:
         raise HTTPException(
             status_code=400,
@@ -266,24 +487,52 @@ def clean_html(soup):
         comment.extract()
     return soup
 
-def extract_content(driver, url, output_dir, clean_content):
-    """Extract content from a URL and save it"""
+def page_text(soup):
+    """The visible text of a page, for the search index"""
+    body = soup.body or soup
+    texts = (text for text in body.find_all(string=True)
+             if not isinstance(text, Comment) and text.parent.name not in ("script", "style", "noscript"))
+    return " ".join(" ".join(texts).split())
+
+def extract_content(driver, url, output_dir, clean_content, store=None, warc=None, search_session=None, guard=None):
+    """Extract content from a URL and save it (to the segment store if given), recording how long each stage took.
+    With search_session the page's text is also added to the search index under that session.
+    The archive, the store and the search index lock their own writes, so crawl workers can call
+    this at the same time. A page that cannot be loaded or rendered (within the guard's render
+    timeout, if given) raises PageLoadError; other failures return None."""
+    timer = StageTimer()
     try:
         logger.info(f"Extracting content from URL: {url}")
         # Load the page
-        driver.get(url)
-        time.sleep(1)  # Give JavaScript a moment to execute
+        with timer.stage('fetch'):
+            driver.get(url)
         
-        # Get the page source
-        html = driver.page_source
+        # Give JavaScript a moment to execute, then get the page source
+        with timer.stage('render'), guard.rendering(driver) if guard else nullcontext():
+            # A replayed page was rendered when it was recorded
+            if not getattr(driver, 'replaying', False):
+                time.sleep(1)
+            html = driver.page_source
+    except Exception as e:
+        # Left to the crawl's FetchGuard, which retries transient failures
+        raise PageLoadError(url, e) from e
+    try:
+        # Archive the HTTP exchange and the rendered DOM
+        if warc:
+            with timer.stage('archive'):
+                warc.capture(url, html)
         
         # Parse with BeautifulSoup
-        soup = BeautifulSoup(html, 'lxml')
+        with timer.stage('parse'):
+            soup = BeautifulSoup(html, 'lxml')
+        # Read before cleaning, which removes <link> elements
+        canonical_href = find_rel_canonical(soup)
         
         # Clean HTML if requested
         if clean_content:
             logger.debug("Cleaning HTML content")
-            clean_html(soup)
+            with timer.stage('clean'):
+                clean_html(soup)
         
         # Get the title
         title = soup.title.string if soup.title else url
@@ -292,31 +541,58 @@ def extract_content(driver, url, output_dir, clean_content):
         filename = os.path.join(output_dir, f"{hash(url)}.html")
         
         # Save the HTML
-        save_html(str(soup), filename)
+        with timer.stage('write'):
+            content = str(soup)
+            if store:
+                store.write(os.path.basename(filename), content, url=url)
+            else:
+                save_html(content, filename)
         logger.info(f"Saved content to: {filename}")
         
+        if search_session:
+            # The page is saved either way; a failed index update (e.g. a locked database) only costs search
+            try:
+                with timer.stage('index'):
+                    index_page(engine, search_session, url, filename, str(title) if title else url, page_text(soup))
+            except Exception as e:
+                logger.error(f"Could not add {url} to the search index: {str(e)}")
+        
         return {
             'title': title,
             'html_url': url,
             'file_path': filename,
-            'html': str(soup)
+            'html': content,
+            'canonical_url': urljoin(url, canonical_href) if canonical_href else None,
+            'timings': timer.as_dict()
         }
         
     except Exception as e:
         logger.error(f"Error extracting content from {url}: {str(e)}")
         return None
 
-def get_links(soup, base_url):
-    base_domain = urlparse(base_url).netloc
+def get_links(soup, base_url, canon=None):
+    canon = canon or UrlCanonicalizer()
+    base_domain = urlparse(canon.canonicalize(base_url)).netloc
     links = set()
     for link in soup.find_all('a', href=True):
-        full_url = normalize_url(base_url, link['href'])
-        if urlparse(full_url).netloc == base_domain:
-            links.add(full_url)
+        try:
+            if urlparse(canon.canonicalize(link['href'], base_url)).netloc == base_domain:
+                links.add(canon.discover(link['href'], base_url))
+        except ValueError:
+            # e.g. a non-numeric or out-of-range port ("http://host:{{port}}/"); skip just this link
+            continue
     return links
 
-def crawl_site(start_url, output_dir, show_progress, clean_content, max_links, session_id):
-    """Crawl a website starting from the given URL"""
+def crawl_site(start_url, output_dir, show_progress, clean_content, max_links, session_id, pipeline=None, store=None,
+               warc=None, search_index=True, frontier=None, canon=None, scope=None, sitemaps=None, http_cache=None,
+               controller=None, guard=None, requeue=None):
+    """Crawl a website starting from the given URL, handing each saved page to the pipeline if given.
+    Links are recorded in the frontier's link graph; its order decides which queued page is crawled next.
+    URLs are canonicalised by canon, so each page is fetched once however it is linked, and only
+    links the scope allows are queued. With sitemaps, the frontier is seeded from the site's sitemaps.
+    With an http_cache, pages and HTTP responses are recorded into it, or replayed without a browser.
+    The controller decides how many browsers fetch pages at once (one if not given). The guard times
+    out, retries and pauses page loads per host; requeue lists URLs (e.g. failed ones) queued after the start URL."""
     try:
         logger.info(f"Starting crawl of {start_url}")
         # Create output directory if it doesn't exist
@@ -327,64 +603,147 @@ def crawl_site(start_url, output_dir, show_progress, clean_content, max_links, s
         crawled_pages = []
         total_links = 0
         
-        with managed_browser() as driver:
-            # Start with the initial URL
-            queue = [start_url]
-            visited = set()
-            
-            while queue and (max_links is None or total_links < max_links):
-                # Check if crawl has been stopped
+        # Start with the initial URL
+        if frontier is None:
+            frontier = Frontier(LinkGraph())
+        if canon is None:
+            canon = UrlCanonicalizer()
+        if scope is None:
+            scope = CrawlScope()
+        if controller is None:
+            controller = AimdController()
+        if guard is None:
+            guard = FetchGuard()
+        if http_cache:
+            http_cache.mount(warc and warc.session, scope.session, sitemaps and sitemaps.session)
+        frontier.add(canon.discover(start_url))
+        if sitemaps:
+            for url in scope.filter(sitemaps.load(start_url, canon), 1, frontier):
+                frontier.add(url, depth=1)
+        for url in scope.filter(requeue or [], None, frontier):
+            frontier.add(url)
+        visited = set()
+        stopped = False
+        reported_changes = -1
+        last_checked = 0.0
+        pool = WorkerPool(controller, lambda: crawl_browser(http_cache, guard))
+        
+        def next_url():
+            nonlocal total_links, stopped, last_checked
+            # Check if crawl has been stopped; at most every JOB_POLL_SECONDS, since this runs under the pool lock
+            job = None
+            if time.monotonic() - last_checked >= JOB_POLL_SECONDS:
+                last_checked = time.monotonic()
                 job = crawl_manager.get_session(session_id)
-                if job and job.status == "stopped":
-                    logger.info(f"Crawl stopped by user. Processed {total_links} pages.")
-                    return {
-                        "total_links": total_links,
-                        "pages": crawled_pages,
-                        "output_directory": output_dir,
-                        "session_id": session_id
-                    }
-                
-                current_url = queue.pop(0)
-                if current_url in visited:
+                if not job or job.status == "stopped":
+                    stopped = True
+                    return STOP
+            retry_url = guard.next_retry()
+            if retry_url:
+                logger.info(f"Retrying URL: {retry_url}")
+                return retry_url
+            while len(frontier):
+                if max_links is not None and total_links >= max_links:
+                    # Not STOP: a page still in flight may yet be skipped and free its place
+                    break
+                current_url = frontier.pop()
+                if current_url in visited or canon.skip_alias(current_url):
                     continue
-                    
                 visited.add(current_url)
                 total_links += 1
+                # A host whose circuit breaker is open keeps its page until it is let through again
+                if not guard.allows(current_url):
+                    logger.info(f"Host paused, deferring URL {total_links}: {current_url}")
+                    continue
+                logger.info(f"Processing URL {total_links}: {current_url}")
+                # Update current URL in database
+                if job:
+                    job.current_url = current_url
+                    crawl_manager.update_session(job)
+                return current_url
+            return WAIT if guard.pending() else None
+        
+        def fetch(driver, current_url):
+            try:
+                # Extract content and get new links
+                page_info = extract_content(driver, current_url, output_dir, clean_content, store, warc,
+                                            session_id if search_index and SEARCH_AVAILABLE else None, guard)
+                if not page_info:
+                    return None, set()
+                soup = BeautifulSoup(page_info['html'], 'lxml')
+                with pool.lock:
+                    return page_info, get_links(soup, current_url, canon)
+            except PageLoadError:
+                raise
+            except Exception as e:
+                logger.error(f"Error processing {current_url}: {str(e)}")
+                return None, set()
+        
+        def done(current_url, page_info, new_links, error):
+            nonlocal reported_changes, total_links
+            if error is SKIP:
+                # Refused by scope.fetchable(), so it does not count against max_links
+                total_links -= 1
+                return
+            if error is None:
+                guard.success(current_url)
+            elif guard.failure(current_url, error):
+                return
+            else:
+                logger.error(f"Giving up on {current_url}: {error}")
+            if page_info:
+                if sitemaps and sitemaps.lastmod.get(current_url):
+                    page_info['lastmod'] = sitemaps.lastmod[current_url]
+                crawled_pages.append(page_info)
+                canon.add_rel_canonical(current_url, page_info['canonical_url'], visited)
+                if pipeline:
+                    pipeline.submit(page_info)
                 
-                try:
-                    logger.info(f"Processing URL {total_links}: {current_url}")
-                    # Update current URL in database
-                    job = crawl_manager.get_session(session_id)
-                    if job:
-                        job.current_url = current_url
-                        crawl_manager.update_session(job)
-                    
-                    # Extract content and get new links
-                    page_info = extract_content(driver, current_url, output_dir, clean_content)
-                    if page_info:
-                        crawled_pages.append(page_info)
-                        
-                        # Get links from the page
-                        soup = BeautifulSoup(page_info['html'], 'lxml')
-                        new_links = get_links(soup, current_url)
-                        logger.debug(f"Found {len(new_links)} new links on {current_url}")
-                        
-                        # Add new links to queue if we haven't reached max_links
-                        if max_links is None or total_links < max_links:
-                            for link in new_links:
-                                if link not in visited and link not in queue:
-                                    queue.append(link)
+                depth = frontier.graph.depth(current_url)
+                new_links = scope.filter(new_links, depth + 1 if depth is not None else None, frontier, visited)
+                logger.debug(f"Found {len(new_links)} new links in scope on {current_url}")
                 
-                except Exception as e:
-                    logger.error(f"Error processing {current_url}: {str(e)}")
-                    continue
+                # Record the links and queue the ones not crawled yet
+                frontier.record(current_url, new_links, visited)
+            # Keep the session's limits and adjustment history current
+            if controller.changes != reported_changes:
+                reported_changes = controller.changes
+                job = crawl_manager.get_session(session_id)
+                if job:
+                    job.concurrency = controller.summary()
+                    crawl_manager.update_session(job)
+        
+        try:
+            with crawl_browser(http_cache, guard) as driver:
+                pool.run(driver, next_url, fetch, done, admit=scope.fetchable)
+        finally:
+            guard.abandon()
+        
+        if stopped:
+            logger.info(f"Crawl stopped by user. Processed {total_links} pages.")
+            return {
+                "total_links": total_links,
+                "pages": crawled_pages,
+                "output_directory": output_dir,
+                "session_id": session_id,
+                "canonicalization": canon.summary(),
+                "scope": scope.summary(),
+                "concurrency": controller.summary(),
+                "fetch": guard.summary(),
+                "failed_urls": guard.failed
+            }
         
         logger.info(f"Crawl completed. Total pages: {len(crawled_pages)}")
         return {
             "total_links": total_links,
             "pages": crawled_pages,
             "output_directory": output_dir,
-            "session_id": session_id
+            "session_id": session_id,
+            "canonicalization": canon.summary(),
+            "scope": scope.summary(),
+            "concurrency": controller.summary(),
+            "fetch": guard.summary(),
+            "failed_urls": guard.failed
         }
         
     except Exception as e:
@@ -423,77 +782,240 @@ async def get_crawl(session_id: str):
         raise HTTPException(status_code=404, detail="Crawl session not found")
     return session.to_dict()
 
-@app.post("/api/crawl")
-async def crawl(crawl_request: CrawlRequest):
-    """Start a new crawl job"""
-    try:
-        logger.info(f"Starting new crawl job for URL: {crawl_request.url}")
-        # Create a new crawl session
-        session = crawl_manager.create_session(crawl_request.url)
-        session.output_dir = crawl_request.output_dir
-        session.status = "running"
-        crawl_manager.update_session(session)
-        
+def crawl_components(crawl_request: CrawlRequest) -> Dict:
+    """The frontier, canonicaliser, scope, sitemap seeder, HTTP cache, concurrency controller and fetch
+    guard a crawl request asks for; raises ValueError for an invalid option."""
+    canon = UrlCanonicalizer(strip_query=crawl_request.strip_query, keep_params=crawl_request.keep_params,
+                             strip_params=crawl_request.strip_params, trailing_slash=crawl_request.trailing_slash,
+                             rel_canonical=crawl_request.rel_canonical)
+    components = {
+        "frontier": Frontier(LinkGraph(), crawl_request.frontier),
+        "canon": canon,
+        "controller": AimdController(max_workers=crawl_request.max_workers, max_per_host=crawl_request.max_per_host),
+        "guard": FetchGuard(navigation_timeout=crawl_request.navigation_timeout,
+                            render_timeout=crawl_request.render_timeout, retries=crawl_request.retries,
+                            breaker_failures=crawl_request.breaker_failures,
+                            breaker_cooldown=crawl_request.breaker_cooldown),
+        "sitemaps": None,
+        "http_cache": None
+    }
+    if crawl_request.sitemaps or crawl_request.sitemap_urls:
+        components["sitemaps"] = SitemapSeeder(crawl_request.sitemap_urls, robots=crawl_request.sitemaps,
+                                               since=crawl_request.sitemap_since)
+    if crawl_request.cache_dir:
+        components["http_cache"] = HttpCache(crawl_request.cache_dir, crawl_request.cache_mode, canon)
+    # Last, so that nothing holding a session is left open when an option above is invalid
+    components["scope"] = CrawlScope(include=crawl_request.include, exclude=crawl_request.exclude,
+                                     max_depth=crawl_request.max_depth, skip_extensions=crawl_request.skip_extensions,
+                                     prefix_limits=crawl_request.prefix_limits, head_check=crawl_request.head_check)
+    return components
+
+def requeued_urls(crawl_request: CrawlRequest) -> Optional[List[str]]:
+    """The failed URLs of the session named by requeue_failed_from, or None; a 404 if it does not exist"""
+    if not crawl_request.requeue_failed_from:
+        return None
+    failed_session = crawl_manager.get_session(crawl_request.requeue_failed_from)
+    if not failed_session:
+        raise HTTPException(status_code=404, detail="Crawl session to requeue failed URLs from not found")
+    return [failure["url"] for failure in failed_session.failed_urls or []]
+
+def session_result(session: CrawlJob) -> Dict:
+    """The result of a finished crawl job as /api/crawl returns it"""
+    result = dict(session.result or {"total_links": 0, "output_directory": session.output_dir,
+                                     "session_id": session.id})
+    result["pages"] = session.pages or []
+    return result
+
+def run_crawl_job(session: CrawlJob):
+    """Run a claimed crawl job in this process and record its outcome in the database."""
+    crawl_request = CrawlRequest(**session.request)
+    logger.info(f"Starting crawl job {session.id} for URL: {crawl_request.url}")
+    components = crawl_components(crawl_request)
+    frontier, sitemaps, scope, http_cache = (components["frontier"], components["sitemaps"], components["scope"],
+                                             components["http_cache"])
+    pipeline = None
+    if crawl_request.pipeline:
+        pipeline = CrawlPipeline(crawl_request.output_dir, crawl_request.pipeline_workers,
+                                 crawl_request.pipeline_queue_size, output_format=crawl_request.pipeline_format,
+                                 pdf=crawl_request.pipeline_pdf, timeout=crawl_request.pipeline_timeout)
+    # Run the crawler, optionally under a profiler
+    store = None
+    if crawl_request.storage == "segments":
+        store = SegmentWriter(crawl_request.output_dir, segment_mb=crawl_request.segment_mb)
+    warc = None
+    if crawl_request.warc:
+        warc = WarcWriter(Path(crawl_request.output_dir) / f"crawl-{session.id}.warc.gz", refetch=not crawl_request.warc_dom_only)
+        session.warc_path = str(warc.warc_file)
+    with profile_run(crawl_request.profile, crawl_request.output_dir, session.id) as profile:
         try:
-            # Run the crawler
             result = crawl_site(
                 crawl_request.url,
                 crawl_request.output_dir,
                 crawl_request.show_progress,
                 crawl_request.clean_content,
                 crawl_request.max_links,
-                session.id
+                session.id,
+                pipeline,
+                store,
+                warc,
+                crawl_request.search_index,
+                frontier,
+                components["canon"],
+                scope,
+                sitemaps,
+                http_cache,
+                components["controller"],
+                components["guard"],
+                requeued_urls(crawl_request)
             )
-            
-            # Update session with results
-            session.total_pages = len(result["pages"])
-            session.pages = result["pages"]
-            session.status = "completed"
-            
-            # Calculate total bytes
-            total_bytes = 0
-            for page in result["pages"]:
-                file_path = Path(page["file_path"])
-                if file_path.exists():
-                    total_bytes += file_path.stat().st_size
-            session.total_bytes = total_bytes
-            
-            crawl_manager.update_session(session)
-            logger.info(f"Crawl job completed successfully. Total pages: {session.total_pages}, Total bytes: {session.total_bytes}")
-            
-            # Return the results
-            return result
-            
-        except Exception as e:
-            logger.error(f"Crawl job failed: {str(e)}")
-            session.status = "failed"
-            session.error_message = str(e)
-            crawl_manager.update_session(session)
-            raise HTTPException(
-                status_code=500,
-                detail=str(e)
-            )
-            
+        finally:
+            if store:
+                store.close()
+            if warc:
+                warc.close()
+            scope.close()
+            if sitemaps:
+                sitemaps.close()
+            if len(frontier.graph):
+                graph_file = Path(crawl_request.output_dir) / f"links-{session.id}.graph"
+                frontier.graph.save(graph_file)
+                session.graph_path = str(graph_file)
+            # Let the stages drain whether or not the crawl succeeded
+            pipeline_summary = pipeline.finish() if pipeline else None
+    if pipeline_summary:
+        result["pipeline"] = pipeline_summary
+    if warc:
+        result["warc_path"] = session.warc_path
+    if sitemaps:
+        result["sitemaps"] = sitemaps.summary()
+    if http_cache:
+        result["http_cache"] = http_cache.summary()
+    if session.graph_path:
+        result["graph_path"] = session.graph_path
+        result["graph"] = frontier.graph.summary()
+    if profile['path']:
+        session.profile_path = profile['path']
+        result["profile_path"] = profile['path']
+        logger.info(f"Saved crawl profile to: {profile['path']}")
+    
+    # Update session with results; the pages are stored once, in pages
+    session.total_pages = len(result["pages"])
+    session.pages = result["pages"]
+    session.result = {key: value for key, value in result.items() if key != "pages"}
+    session.concurrency = result["concurrency"]
+    session.failed_urls = result["failed_urls"]
+    
+    # Calculate total bytes (uncompressed, for pages in a segment store)
+    total_bytes = 0
+    for page in result["pages"]:
+        try:
+            total_bytes += source_stat(page["file_path"])["size"]
+        except OSError:
+            pass
+    session.total_bytes = total_bytes
+    
+    # A stop requested while the crawl ran is kept
+    if crawl_manager.get_session(session.id).status != "stopped":
+        session.status = "completed"
+    crawl_manager.finish_session(session)
+    logger.info(f"Crawl job {session.status}. Total pages: {session.total_pages}, Total bytes: {session.total_bytes}")
+
+@app.post("/api/crawl")
+async def crawl(crawl_request: CrawlRequest):
+    """Queue a crawl job for the crawl workers; with wait (the default), return its result once it has finished"""
+    if crawl_request.profile and crawl_request.profile not in PROFILERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown profiler '{crawl_request.profile}', expected one of: {', '.join(PROFILERS)}"
+        )
+    if crawl_request.storage not in STORAGE_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown storage '{crawl_request.storage}', expected one of: {', '.join(STORAGE_MODES)}"
+        )
+    if crawl_request.pipeline and crawl_request.pipeline_format not in PIPELINE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown pipeline format '{crawl_request.pipeline_format}', expected one of: {', '.join(PIPELINE_FORMATS)}"
+        )
+    # Built here only to reject invalid options before the job is queued; the crawl worker builds its own
+    try:
+        components = crawl_components(crawl_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    components["scope"].close()
+    if components["sitemaps"]:
+        components["sitemaps"].close()
+    requeued_urls(crawl_request)
+    try:
+        logger.info(f"Queueing new crawl job for URL: {crawl_request.url}")
+        session = crawl_manager.create_session(crawl_request.url, crawl_request.model_dump())
+        session.output_dir = crawl_request.output_dir
+        crawl_manager.update_session(session)
+        session_id = session.id
     except Exception as e:
         logger.error(f"Failed to start crawl: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to start crawl: {str(e)}"
         )
+    if not crawl_request.wait:
+        return JSONResponse(status_code=202, content={"session_id": session_id, "status": "pending"})
+    
+    # Any crawl worker may run the job; wait for its outcome in the database
+    started = checked = time.monotonic()
+    while True:
+        await asyncio.sleep(JOB_POLL_SECONDS)
+        if time.monotonic() - checked >= HEARTBEAT_SECONDS:
+            # The crawl workers do this too, but there may be none left to do it
+            checked = time.monotonic()
+            crawl_manager.fail_stale_sessions()
+            if not crawl_manager.live_workers() and crawl_manager.fail_unclaimed_session(
+                    session_id, "No crawl worker is running to take the job"):
+                raise HTTPException(status_code=503, detail="No crawl worker is running to take the job")
+        session = crawl_manager.get_session(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Crawl session was cleared before it finished")
+        if session.status == "failed":
+            raise HTTPException(status_code=500, detail=session.error_message or "Crawl job failed")
+        # A job stopped while it ran is done once its worker has saved what it crawled
+        if session.finished_at or (session.status == "stopped" and not session.worker_id):
+            return session_result(session)
+        if time.monotonic() - started >= crawl_request.wait_timeout:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Crawl job {session_id} did not finish within {crawl_request.wait_timeout:g} seconds; "
+                       f"it is {session.status}, follow it at /api/crawls/{session_id}"
+            )
 
 @app.post("/api/clean")
 async def clean(clean_request: CleanRequest):
     try:
-        process_html_files(clean_request.input_dir, clean_request.output_dir)
-        return {"message": "HTML files cleaned successfully", "output_dir": clean_request.output_dir}
+        summary = process_html_files(
+            clean_request.input_dir,
+            clean_request.output_dir,
+            clean_request.workers,
+            clean_request.chunk_size,
+            clean_request.extractor,
+            clean_request.output_format,
+            clean_request.force
+        )
+        return {"message": "HTML files cleaned successfully", "output_dir": clean_request.output_dir, "summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/convert")
 async def convert(convert_request: ConvertRequest):
     try:
-        convert_yaml_to_json(convert_request.input_dir, convert_request.output_dir)
-        return {"message": "YAML files converted to JSON successfully", "output_dir": convert_request.output_dir}
+        summary = convert_yaml_to_json(
+            convert_request.input_dir,
+            convert_request.output_dir,
+            convert_request.force,
+            convert_request.workers,
+            convert_request.chunk_size,
+            convert_request.corpus
+        )
+        return {"message": "YAML files converted to JSON successfully", "output_dir": convert_request.output_dir, "summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -503,38 +1025,96 @@ async def generate_pdf(pdf_request: PDFRequest):
         if pdf_request.no_merge:
             output_dir = os.path.splitext(pdf_request.output)[0]
             os.makedirs(output_dir, exist_ok=True)
-            convert_files_to_pdf(pdf_request.directory, output_dir)
-            return {"message": "PDFs generated successfully", "output_dir": output_dir}
+            summary = convert_files_to_pdf(pdf_request.directory, output_dir, pdf_request.force,
+                                           pdf_request.workers, pdf_request.timeout,
+                                           pdf_request.cache_dir, pdf_request.cache_mb, pdf_request.merge_batch,
+                                           pdf_request.volume_pages, pdf_request.volume_mb, pdf_request.stylesheets,
+                                           pdf_request.asset_cache_dir, pdf_request.offline)
+            return {"message": "PDFs generated successfully", "output_dir": output_dir, "summary": summary}
         else:
-            convert_files_to_pdf(pdf_request.directory, pdf_request.output)
-            return {"message": "PDF generated successfully", "output_file": pdf_request.output}
+            summary = convert_files_to_pdf(pdf_request.directory, pdf_request.output, pdf_request.force,
+                                           pdf_request.workers, pdf_request.timeout,
+                                           pdf_request.cache_dir, pdf_request.cache_mb, pdf_request.merge_batch,
+                                           pdf_request.volume_pages, pdf_request.volume_mb, pdf_request.stylesheets,
+                                           pdf_request.asset_cache_dir, pdf_request.offline)
+            return {"message": "PDF generated successfully", "output_file": pdf_request.output, "summary": summary}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def output_directory(directory: str) -> Path:
+    """directory as a Path, or a 404/400 if it is missing or not a directory"""
+    dir_path = Path(directory)
+    if not dir_path.exists():
+        raise HTTPException(status_code=404, detail="Directory not found")
+    if not dir_path.is_dir():
+        raise HTTPException(status_code=400, detail="Path is not a directory")
+    return dir_path
+
 @app.get("/api/files/{directory:path}")
-async def list_files(directory: str):
+async def list_files(directory: str, offset: int = 0, limit: Optional[int] = None):
+    """Files under directory, sorted; pass offset and limit to page through large output directories"""
     try:
-        dir_path = Path(directory)
-        if not dir_path.exists():
-            raise HTTPException(status_code=404, detail="Directory not found")
-        if not dir_path.is_dir():
-            raise HTTPException(status_code=400, detail="Path is not a directory")
-        files = [str(f.relative_to(dir_path)) for f in dir_path.rglob("*") if f.is_file()]
-        return {"files": files}
+        dir_path = output_directory(directory)
+        if offset < 0 or (limit is not None and limit < 1):
+            raise HTTPException(status_code=400, detail="offset must not be negative and limit must be positive")
+        files = list_output_files(dir_path)
+        page = files[offset:offset + limit] if limit is not None else files[offset:]
+        result = {"files": page, "total": len(files), "offset": offset, "limit": limit}
+        if is_segment_store(dir_path):
+            # Pages packed into segments are listed from the index; each downloads as <directory>/<name>
+            result["segment_store"] = True
+        return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/export/{directory:path}")
+async def export_directory(directory: str, format: str = "zip"):
+    """Download everything under directory as one zip, tar or tar.gz, streamed as it is built"""
+    dir_path = output_directory(directory)
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown archive format '{format}', expected one of: {', '.join(EXPORT_FORMATS)}"
+        )
+    filename = f"{dir_path.resolve().name or 'output'}.{format}"
+    logger.info(f"Streaming {dir_path} as {filename}")
+    return StreamingResponse(stream_archive(dir_path, format), media_type=EXPORT_FORMATS[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
 @app.get("/api/download/{filepath:path}")
-async def download_file(filepath: str):
+async def download_file(filepath: str, request: Request):
+    """Download one file, or one byte range of it when the request has a Range header"""
     try:
         file_path = Path(filepath)
-        if not file_path.exists():
-            raise HTTPException(status_code=404, detail="File not found")
-        if not file_path.is_file():
-            raise HTTPException(status_code=400, detail="Path is not a file")
-        return FileResponse(str(file_path))
+        stored = store_entry(file_path)
+        if stored:
+            store, name = stored
+            content = store.read(name)
+            size = len(content)
+        else:
+            if not file_path.exists():
+                raise HTTPException(status_code=404, detail="File not found")
+            if not file_path.is_file():
+                raise HTTPException(status_code=400, detail="Path is not a file")
+            size = file_path.stat().st_size
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError as e:
+            raise HTTPException(status_code=416, detail=str(e), headers={"Content-Range": f"bytes */{size}"})
+        if byte_range is None:
+            if stored:
+                return Response(content=content, media_type="text/html", headers={"Accept-Ranges": "bytes"})
+            return FileResponse(str(file_path), headers={"Accept-Ranges": "bytes"})
+        start, end = byte_range
+        headers = {"Content-Range": f"bytes {start}-{end}/{size}", "Accept-Ranges": "bytes",
+                   "Content-Length": str(end - start + 1)}
+        if stored:
+            return Response(content=content[start:end + 1], status_code=206, media_type="text/html", headers=headers)
+        media_type = mimetypes.guess_type(file_path.name)[0] or "application/octet-stream"
+        return StreamingResponse(iter_file_range(file_path, start, end), status_code=206, media_type=media_type,
+                                 headers=headers)
     except HTTPException:
         raise
     except Exception as e:
@@ -553,6 +1133,91 @@ async def clear_crawls():
             detail=f"Failed to clear crawl sessions: {str(e)}"
         )
 
+@app.get("/api/search")
+async def search_crawled_pages(q: str, session_id: Optional[str] = None, limit: int = 20, offset: int = 0):
+    """Full-text search over crawled pages, best matches first, optionally within one crawl session.
+    q uses SQLite FTS5 syntax: words, "exact phrases", AND/OR/NOT, prefix* and title:word."""
+    if not SEARCH_AVAILABLE:
+        raise HTTPException(status_code=501, detail=f"Full-text search needs SQLite; it is disabled with the {engine.dialect.name} database")
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="Query must not be empty")
+    if limit < 1 or limit > 100 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100 and offset must not be negative")
+    try:
+        results = search_pages(engine, q, session_id=session_id, limit=limit, offset=offset)
+    except OperationalError as e:
+        logger.error(f"Invalid search query '{q}': {str(e.orig)}")
+        raise HTTPException(status_code=400, detail=f"Invalid search query: {str(e.orig)}")
+    return {"query": q, "session_id": session_id, "results": results}
+
+def session_graph(session_id: str):
+    """The link graph of a crawl session, or a 404"""
+    session = crawl_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Crawl session not found")
+    if not session.graph_path or not Path(session.graph_path).exists():
+        raise HTTPException(status_code=404, detail="This crawl has no link graph")
+    return open_graph(session.graph_path)
+
+@app.get("/api/crawls/{session_id}/graph")
+async def get_link_graph(session_id: str, sort: str = "pagerank", limit: int = 50, offset: int = 0):
+    """Summary of a crawl's link graph and its pages ranked by pagerank, in_degree, out_degree or depth"""
+    graph = session_graph(session_id)
+    if limit < 1 or limit > 1000 or offset < 0:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000 and offset must not be negative")
+    try:
+        pages = graph.top(sort, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"session_id": session_id, **graph.summary(), "sort": sort, "pages": pages}
+
+@app.get("/api/crawls/{session_id}/graph/page")
+async def get_link_graph_page(session_id: str, url: str):
+    """In/out-degree, crawl depth and PageRank of one URL in a crawl's link graph"""
+    graph = session_graph(session_id)
+    if url not in graph.ids:
+        raise HTTPException(status_code=404, detail=f"URL not in the link graph: {url}")
+    return graph.node(graph.ids[url])
+
+@app.get("/api/crawls/{session_id}/archive")
+async def get_archived_page(session_id: str, url: str, timestamp: Optional[str] = None, rendered: bool = False):
+    """Serve one page from a crawl's WARC archive: the capture of url closest to timestamp (YYYYMMDDhhmmss).
+
+    rendered=true returns the DOM after JavaScript ran instead of the HTTP response body.
+    """
+    session = crawl_manager.get_session(session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail="Crawl session not found")
+    if not session.warc_path or not Path(session.warc_path).exists():
+        raise HTTPException(status_code=404, detail="Crawl has no WARC archive")
+    if timestamp:
+        try:
+            parse_timestamp(timestamp)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if not Path(session.warc_path + ".cdxj").exists():
+        # Written after the crawl's first page; a crawl that stopped before then has none
+        raise HTTPException(status_code=409, detail="The archive index has not been written yet, try again shortly")
+    try:
+        capture = find_capture(session.warc_path + ".cdxj", url, timestamp, "conversion" if rendered else "response")
+        if not capture:
+            raise HTTPException(status_code=404, detail="URL not found in archive")
+        capture_time, entry = capture
+        warc_headers, block = read_record(Path(session.warc_path).with_name(entry["filename"]), entry["offset"], entry["length"])
+        headers = {"Memento-Datetime": warc_headers.get("WARC-Date", ""), "X-Archive-Timestamp": capture_time}
+        if rendered:
+            return Response(content=block, media_type="text/html", headers=headers)
+        status, http_headers, body = parse_http_response(block)
+        encoding = http_headers.get("content-encoding", "").lower()
+        if encoding and encoding not in ("gzip", "x-gzip", "deflate", "identity"):
+            headers["Content-Encoding"] = encoding
+        return Response(content=body, status_code=status, headers=headers,
+                        media_type=http_headers.get("content-type", "application/octet-stream"))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/api/crawls/{session_id}/stop")
 async def stop_crawl(session_id: str):
     """Stop a running crawl job"""
@@ -563,17 +1228,130 @@ async def stop_crawl(session_id: str):
         detail="Crawl job not found or not running"
     )
 
+@contextmanager
+def heartbeat(model, key: str, interval: float = HEARTBEAT_SECONDS):
+    """Report the job or crawl worker with id key alive every interval seconds from a background
+    thread while the block runs."""
+    stop = threading.Event()
+    
+    def beat():
+        # A session of its own: the crawl's session belongs to the crawl threads
+        db = SessionLocal()
+        try:
+            while not stop.wait(interval):
+                try:
+                    db.query(model).filter(model.id == key) \
+                        .update({"heartbeat": datetime.now()}, synchronize_session=False)
+                    db.commit()
+                except OperationalError as e:
+                    db.rollback()
+                    logger.warning(f"Could not record heartbeat of {key}: {str(e)}")
+        finally:
+            db.close()
+    
+    thread = threading.Thread(target=beat, name=f"heartbeat-{key}", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def crawl_worker(parent_pid: Optional[int] = None):
+    """The crawl worker daemon: claim queued jobs from the database and run them one at a time until
+    interrupted (or, when started by an API process, until that process is gone)."""
+    worker_id = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"Crawl worker {worker_id} waiting for jobs")
+    job = None
+    stale_checked = 0
+    # Registered so that a waiting request can tell whether any worker is left to take its job
+    crawl_manager.register_worker(worker_id)
+    try:
+        with heartbeat(CrawlWorker, worker_id):
+            while parent_pid is None or os.getppid() == parent_pid:
+                if time.monotonic() - stale_checked >= HEARTBEAT_SECONDS:
+                    crawl_manager.fail_stale_sessions()
+                    stale_checked = time.monotonic()
+                job = crawl_manager.claim_session(worker_id)
+                if job is None:
+                    time.sleep(JOB_POLL_SECONDS)
+                    continue
+                try:
+                    with heartbeat(CrawlJob, job.id):
+                        run_crawl_job(job)
+                except Exception as e:
+                    logger.error(f"Crawl job {job.id} failed: {str(e)}")
+                    crawl_manager.db.rollback()
+                    job = crawl_manager.get_session(job.id)
+                    if job:
+                        crawl_manager.finish_session(job, str(e))
+                job = None
+    except KeyboardInterrupt:
+        logger.info(f"Crawl worker {worker_id} shutting down")
+        if job is not None:
+            crawl_manager.db.rollback()
+            job = crawl_manager.get_session(job.id)
+            if job:
+                crawl_manager.finish_session(job, "The crawl worker running this job was shut down")
+    finally:
+        crawl_manager.unregister_worker(worker_id)
+
+def launch_crawl_workers(count: int) -> List[subprocess.Popen]:
+    """Start count crawl worker daemons as child processes that exit when this process does."""
+    return [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", "--parent_pid", str(os.getpid())])
+            for _ in range(count)]
+
+def supervise_crawl_workers(processes: List[subprocess.Popen], stop: threading.Event):
+    """Replace any crawl worker in processes that exits (e.g. killed for running out of memory) until stop is set."""
+    while not stop.wait(HEARTBEAT_SECONDS):
+        for index, process in enumerate(processes):
+            if process.poll() is not None:
+                logger.warning(f"Crawl worker {process.pid} exited with code {process.returncode}; starting another")
+                processes[index] = launch_crawl_workers(1)[0]
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SPYCrawl API server and crawl workers")
+    parser.add_argument('mode', nargs='?', choices=RUN_MODES, default=os.environ.get("MODE", "dev"),
+                        help="dev: one API process, reloaded when static/ changes; serve: production, several API "
+                             "worker processes; worker: a crawl worker daemon running queued crawl jobs")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get("WORKERS", "2")),
+                        help="API worker processes in serve mode")
+    parser.add_argument('--crawl_workers', type=int, default=int(os.environ.get("CRAWL_WORKERS", "1")),
+                        help="Crawl worker daemons started with the API; 0 when they are launched separately")
+    parser.add_argument('--parent_pid', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    
+    if args.mode == "worker":
+        # Shut down like on Ctrl-C, so the job being crawled is marked failed rather than left running
+        signal.signal(signal.SIGTERM, interrupt)
+        crawl_worker(args.parent_pid)
+        sys.exit(0)
+    
     # Get host from environment variable or use default
     host = os.environ.get("HOST", "127.0.0.1")
     port = int(os.environ.get("PORT", "8803"))
     
-    logger.info(f"Starting SPYCrawl server on {host}:{port}...")
+    logger.info(f"Starting SPYCrawl server on {host}:{port} ({args.mode} mode, {args.crawl_workers} crawl workers)...")
     print(f"Starting SPYCrawl server on {host}:{port}...")
     print(f"Access the web interface at http://{host}:{port}")
     print(f"API documentation available at http://{host}:{port}/docs")
     
-    # In Docker, we shouldn't use reload=True
-    reload_mode = os.environ.get("RELOAD", "True").lower() in ("true", "1", "t")
-    
-    uvicorn.run("spycrawl:app", host=host, port=port, reload=reload_mode, reload_dirs=["static"]) 
\ No newline at end of file
+    crawl_workers = launch_crawl_workers(args.crawl_workers)
+    supervisor_stop = threading.Event()
+    supervisor = threading.Thread(target=supervise_crawl_workers, args=(crawl_workers, supervisor_stop), daemon=True)
+    supervisor.start()
+    try:
+        if args.mode == "serve":
+            # The API processes keep no state, so any of them can answer any request
+            uvicorn.run("spycrawl:app", host=host, port=port, workers=args.workers)
+        else:
+            reload_mode = os.environ.get("RELOAD", "True").lower() in ("true", "1", "t")
+            uvicorn.run("spycrawl:app", host=host, port=port, reload=reload_mode, reload_dirs=["static"])
+    finally:
+        supervisor_stop.set()
+        supervisor.join()
+        for process in crawl_workers:
+            process.terminate() 
\ No newline at end of file
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# readers and writers for the structured text produced by clean_and_strip.py
+# see https://github.com/deftio/simple-py-crawlbot
+
+import json
+from pathlib import Path
+import yaml
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# libyaml's C emitter and parser are many times faster than the pure Python ones
+YamlDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+OUTPUT_FORMATS = ("yaml", "json", "jsonl", "msgpack")
+CORPUS_FILENAME = "corpus.jsonl"
+# Written by crawler.py next to the pages it saves; JSON, but not structured text
+SIDECAR_FILENAMES = frozenset({"summary.json", "summary.jsonl", "failed_urls.jsonl"})
+STRUCTURED_SUFFIXES = {
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".json": "json",
+    ".jsonl": "jsonl",
+    ".msgpack": "msgpack",
+}
+
+def check_format(output_format):
+    """Raise ValueError for unknown formats, or for msgpack when the package is not installed."""
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', expected one of: {', '.join(OUTPUT_FORMATS)}")
+    if output_format == "msgpack" and msgpack is None:
+        raise ValueError("The msgpack output format requires the msgpack package (pip install msgpack)")
+
+def dump_yaml(data, stream=None):
+    return yaml.dump(data, stream, Dumper=YamlDumper, allow_unicode=True, default_flow_style=False)
+
+def output_path_for(source_name, output_dir, output_format):
+    """Per-file output path for a source file. YAML keeps the source file name, as it always has."""
+    name = Path(source_name).name
+    if output_format == "json":
+        name = str(Path(name).with_suffix(".json"))
+    elif output_format == "msgpack":
+        name = str(Path(name).with_suffix(".msgpack"))
+    return str(Path(output_dir) / name)
+
+def write_structured(data, output_filepath, output_format="yaml"):
+    """Write one document in a per-file format (yaml, json or msgpack)."""
+    if output_format == "msgpack":
+        check_format(output_format)
+        with open(output_filepath, 'wb') as file:
+            file.write(msgpack.packb(data, use_bin_type=True))
+    elif output_format == "json":
+        with open(output_filepath, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+    else:
+        with open(output_filepath, 'w', encoding='utf-8') as file:
+            dump_yaml(data, file)
+
+def encode_record(source, content, **metadata):
+    """Encode one corpus record as a JSON line; done in pool workers so the writer only appends strings."""
+    return json.dumps({"source": str(source), **metadata, "content": content}, ensure_ascii=False) + "\n"
+
+class JsonLinesWriter:
+    """Append documents to a single JSON Lines corpus, one {"source", "content"} record per line."""
+
+    def __init__(self, filename, mode='w'):
+        self.filename = str(filename)
+        Path(self.filename).parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.filename, mode, encoding='utf-8')
+        self.count = 0
+
+    def write(self, source, content, **metadata):
+        self.write_line(encode_record(source, content, **metadata))
+
+    def write_line(self, line):
+        """Append an already-encoded record (see encode_record)."""
+        self.file.write(line if line.endswith("\n") else line + "\n")
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def copy_jsonl_records(corpus_path, writer, keep, field="source"):
+    """Copy the records of an existing corpus whose `field` value is in keep into writer, unparsed."""
+    if not Path(corpus_path).exists():
+        return
+    with open(corpus_path, 'r', encoding='utf-8') as file:
+        for line in file:
+            if line.strip() and json.loads(line).get(field) in keep:
+                writer.write_line(line)
+
+def format_of(path):
+    """Structured format of a file from its suffix, or None if it is not one we read."""
+    return STRUCTURED_SUFFIXES.get(Path(path).suffix.lower())
+
+def find_structured_files(input_dir, formats=None):
+    """All structured files under input_dir (optionally only the given formats), in a stable order.
+    Crawl summaries, failed URL lists and hidden files (e.g. manifests) are left out."""
+    files = []
+    for path in Path(input_dir).glob("**/*"):
+        if path.name in SIDECAR_FILENAMES or path.name.startswith("."):
+            continue
+        file_format = format_of(path)
+        if file_format and path.is_file() and (formats is None or file_format in formats):
+            files.append(path)
+    return sorted(files)
+
+def iter_records(path):
+    """Yield (source, data) for every document in a structured file.
+
+    Per-file formats yield a single record whose source is the file itself; a JSON Lines
+    corpus yields one record per line with the source recorded when it was written.
+    """
+    file_format = format_of(path)
+    if file_format == "jsonl":
+        with open(path, 'r', encoding='utf-8') as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    yield record.get("source", str(path)), record.get("content")
+    elif file_format == "msgpack":
+        check_format(file_format)
+        with open(path, 'rb') as file:
+            yield str(path), msgpack.unpackb(file.read(), raw=False)
+    elif file_format == "json":
+        with open(path, 'r', encoding='utf-8') as file:
+            yield str(path), json.load(file)
+    elif file_format == "yaml":
+        with open(path, 'r', encoding='utf-8') as file:
+            yield str(path), yaml.load(file, Loader=YamlLoader)
+    else:
+        raise ValueError(f"Unsupported structured file: {path}")
@@ -1,11 +1,13 @@
 #!/usr/bin/env python3
 
+import io
 import os
 import requests
 import json
 import time
 import unittest
 import shutil
+import zipfile
 from pathlib import Path
 import tempfile
 import threading
@@ -143,10 +145,11 @@ class TestSpyCrawlAPI(unittest.TestCase):
             "output_dir": str(self.test_output_dir),
             "show_progress": True,
             "clean_content": True,
-            "max_links": 10
+            "max_links": 10,
+            "wait": False
         }
         crawl_response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
-        self.assertEqual(crawl_response.status_code, 200)
+        self.assertEqual(crawl_response.status_code, 202)
         new_session_id = crawl_response.json()["session_id"]
         
         # Now stop the job
@@ -245,6 +248,405 @@ class TestSpyCrawlAPI(unittest.TestCase):
         self.assertEqual(list_response.status_code, 200)
         data = list_response.json()
         self.assertEqual(len(data), 0)
+    
+    def test_13_crawl_with_profile(self):
+        """Test that a profiled crawl records per-page timings and a downloadable profile"""
+        payload = {
+            "url": "http://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 1,
+            "profile": "cprofile"
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("profile_path", data)
+        for page in data["pages"]:
+            self.assertIn("fetch", page["timings"])
+            self.assertIn("total", page["timings"])
+        
+        download = requests.get(f"{BASE_URL}/api/download/{data['profile_path']}")
+        self.assertEqual(download.status_code, 200)
+        self.assertGreater(len(download.content), 0)
+        
+        # Unknown profilers are rejected up front
+        payload["profile"] = "bogus"
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+    
+    def test_14_clean_to_jsonl_corpus(self):
+        """Test cleaning straight to a JSON Lines corpus and converting it back to JSON files"""
+        corpus_dir = Path(tempfile.mkdtemp())
+        json_dir = Path(tempfile.mkdtemp())
+        try:
+            payload = {
+                "input_dir": str(self.test_input_dir),
+                "output_dir": str(corpus_dir),
+                "output_format": "jsonl"
+            }
+            response = requests.post(f"{BASE_URL}/api/clean", json=payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["summary"]["failed"], 0)
+            corpus = corpus_dir / "corpus.jsonl"
+            self.assertTrue(corpus.exists())
+            record = json.loads(corpus.read_text().splitlines()[0])
+            self.assertEqual(record["source"], "test.html")
+            
+            payload = {"input_dir": str(corpus_dir), "output_dir": str(json_dir)}
+            response = requests.post(f"{BASE_URL}/api/convert", json=payload)
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue((json_dir / "test.json").exists())
+        finally:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+            shutil.rmtree(json_dir, ignore_errors=True)
+
+    def test_15_crawl_with_pipeline(self):
+        """Test that a pipeline crawl leaves structured files and a merged PDF next to the output"""
+        output_dir = Path(tempfile.mkdtemp()) / "site"
+        try:
+            payload = {
+                "url": "http://example.com",
+                "output_dir": str(output_dir),
+                "max_links": 1,
+                "pipeline": True,
+                "pipeline_format": "json"
+            }
+            response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+            self.assertEqual(response.status_code, 200)
+            summary = response.json()["pipeline"]
+            self.assertEqual(summary["pages"], 1)
+            self.assertEqual(summary["stages"]["clean"]["failed"], 0)
+            self.assertTrue(list(Path(summary["clean_dir"]).glob("*.json")))
+            self.assertTrue(list(Path(summary["pdf_dir"]).glob("*.pdf")))
+            
+            payload["pipeline_format"] = "bogus"
+            response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+            self.assertEqual(response.status_code, 400)
+        finally:
+            shutil.rmtree(output_dir.parent, ignore_errors=True)
+
+    def test_16_crawl_with_warc(self):
+        """Test archiving a crawl to WARC and reading a page back through the archive endpoint"""
+        payload = {
+            "url": "http://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 1,
+            "warc": True
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(Path(data["warc_path"]).exists())
+        self.assertTrue(Path(data["warc_path"] + ".cdxj").exists())
+        
+        archive_url = f"{BASE_URL}/api/crawls/{data['session_id']}/archive"
+        response = requests.get(archive_url, params={"url": "http://example.com", "rendered": "true"})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Example Domain", response.text)
+        self.assertIn("Memento-Datetime", response.headers)
+        
+        response = requests.get(archive_url, params={"url": "http://example.com/not-crawled"})
+        self.assertEqual(response.status_code, 404)
+        
+        response = requests.get(archive_url, params={"url": "http://example.com", "timestamp": "latest"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_17_search(self):
+        """Test full-text search over crawled pages"""
+        payload = {
+            "url": "http://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 1
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        session_id = response.json()["session_id"]
+        
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "domain", "session_id": session_id})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]["url"], "http://example.com")
+        self.assertIn("<b>", results[0]["snippet"])
+        
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": "domain", "session_id": "no-such-session"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+        
+        response = requests.get(f"{BASE_URL}/api/search", params={"q": '"unterminated'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_18_link_graph(self):
+        """Test the link graph saved by a crawl and its PageRank and degree endpoints"""
+        payload = {
+            "url": "http://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 1,
+            "frontier": "pagerank"
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(Path(data["graph_path"]).exists())
+        self.assertEqual(data["graph"]["crawled"], 1)
+        
+        graph_url = f"{BASE_URL}/api/crawls/{data['session_id']}/graph"
+        response = requests.get(graph_url, params={"sort": "in_degree", "limit": 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(response.json()["pages"]), 5)
+        
+        response = requests.get(f"{graph_url}/page", params={"url": "http://example.com"})
+        self.assertEqual(response.status_code, 200)
+        page = response.json()
+        self.assertEqual(page["depth"], 0)
+        self.assertGreater(page["pagerank"], 0)
+        
+        payload["frontier"] = "random"
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_19_file_paging_export_and_ranges(self):
+        """Test paginated listing, streamed archive export and ranged downloads"""
+        for i in range(5):
+            (self.test_output_dir / f"page{i}.html").write_text(f"<html><body>page {i}</body></html>")
+        
+        response = requests.get(f"{BASE_URL}/api/files/{self.test_output_dir}", params={"offset": 1, "limit": 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data["files"]), 2)
+        self.assertGreaterEqual(data["total"], 5)
+        
+        response = requests.get(f"{BASE_URL}/api/export/{self.test_output_dir}", params={"format": "zip"})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(response.content)) as archive:
+            self.assertIn("page3.html", archive.namelist())
+        
+        test_file = self.test_output_dir / "page0.html"
+        response = requests.get(f"{BASE_URL}/api/download/{test_file}", headers={"Range": "bytes=6-11"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, test_file.read_bytes()[6:12])
+        self.assertTrue(response.headers["Content-Range"].startswith("bytes 6-11/"))
+        
+        response = requests.get(f"{BASE_URL}/api/download/{test_file}", headers={"Range": "bytes=100000-"})
+        self.assertEqual(response.status_code, 416)
+
+    def test_20_url_canonicalization(self):
+        """Test that equivalent URLs collapse to one canonical URL and invalid rules are rejected"""
+        payload = {
+            "url": "HTTP://EXAMPLE.COM:80/?utm_source=test",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 1
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["pages"][0]["html_url"], "http://example.com/")
+        self.assertIn("fetches_avoided", data["canonicalization"])
+        
+        payload["trailing_slash"] = "sometimes"
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_21_crawl_scope(self):
+        """Test that scope rules keep links out of the crawl and invalid patterns are rejected"""
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 5,
+            "exclude": ["*"]
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        # The start page is always crawled; every link it has is excluded
+        self.assertEqual(data["total_links"], 1)
+        self.assertIn("rejected", data["scope"])
+        
+        payload["exclude"] = ["re:("]
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_22_sitemap_seeding(self):
+        """Test seeding a crawl from the site's sitemaps"""
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 3,
+            "sitemaps": True
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("sitemaps_fetched", data["sitemaps"])
+        self.assertLessEqual(data["total_links"], 3)
+        
+        payload["sitemap_since"] = "last tuesday"
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_23_record_replay_cache(self):
+        """Test recording a crawl into the HTTP cache and replaying it offline"""
+        cache_dir = self.test_output_dir / "http_cache"
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 2,
+            "cache_dir": str(cache_dir)
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        recorded = response.json()
+        self.assertGreater(recorded["http_cache"]["recorded"], 0)
+        
+        payload["cache_mode"] = "replay"
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        replayed = response.json()
+        self.assertEqual(replayed["http_cache"]["misses"], 0)
+        self.assertEqual([page["html_url"] for page in replayed["pages"]],
+                         [page["html_url"] for page in recorded["pages"]])
+        
+        payload["cache_dir"] = str(self.test_output_dir / "no_such_cache")
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_24_adaptive_concurrency(self):
+        """Test a crawl with several browsers and its concurrency record"""
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 3,
+            "max_workers": 2
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        concurrency = data["concurrency"]
+        self.assertEqual(concurrency["max_workers"], 2)
+        self.assertTrue(1 <= concurrency["limit"] <= 2)
+        self.assertIsInstance(concurrency["history"], list)
+        
+        response = requests.get(f"{BASE_URL}/api/crawls/{data['session_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["concurrency"]["max_workers"], 2)
+        
+        payload["max_workers"] = 0
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_25_fetch_timeouts_and_retries(self):
+        """Test a crawl with page load timeouts and retries, and requeueing its failed URLs"""
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 3,
+            "navigation_timeout": 20,
+            "retries": 1
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertIn("retries", data["fetch"])
+        self.assertIsInstance(data["failed_urls"], list)
+        
+        response = requests.get(f"{BASE_URL}/api/crawls/{data['session_id']}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["failed_urls"], data["failed_urls"])
+        
+        payload["requeue_failed_from"] = data["session_id"]
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 200)
+        
+        payload["navigation_timeout"] = 0
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 400)
+
+    def test_26_queued_crawl_job(self):
+        """Test a crawl queued for the crawl workers and its state in the shared store"""
+        payload = {
+            "url": "https://example.com",
+            "output_dir": str(self.test_output_dir),
+            "max_links": 2,
+            "wait": False
+        }
+        response = requests.post(f"{BASE_URL}/api/crawl", json=payload)
+        self.assertEqual(response.status_code, 202)
+        session_id = response.json()["session_id"]
+        
+        # Poll until a crawl worker has finished the job
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            data = requests.get(f"{BASE_URL}/api/crawls/{session_id}").json()
+            if data["finished_at"]:
+                break
+            time.sleep(1)
+        self.assertEqual(data["status"], "completed")
+        self.assertIsNotNone(data["worker_id"])
+        
+        # A finished job can no longer be stopped
+        response = requests.post(f"{BASE_URL}/api/crawls/{session_id}/stop")
+        self.assertEqual(response.status_code, 404)
+
+    def test_27_stream_extractor_matches_soup(self):
+        """Test that the streaming extractor writes the same structured text as the soup extractor"""
+        input_dir = Path(tempfile.mkdtemp())
+        output_dirs = {extractor: Path(tempfile.mkdtemp()) for extractor in ("soup", "stream")}
+        pages = {
+            "fragment.html": "<p>a</p><p>b</p>",
+            "lists.html": "<ul><li>one<li>two</ul><table><tr><td>1<td>2<tr><td>3</table>",
+            "nesting.html": "<p>intro<div>block</div>after</p><div><span>x</span> <span>y <b>z</b></span></div>",
+            "document.html": "<!DOCTYPE html><html><head><title>T</title></head><body><!-- note -->"
+                             "<h1>Title &amp; more</h1><p>x<br>y</br>z</p><script>var a;</script></body></html>",
+        }
+        try:
+            for name, html in pages.items():
+                (input_dir / name).write_text(html)
+            for extractor, output_dir in output_dirs.items():
+                payload = {
+                    "input_dir": str(input_dir),
+                    "output_dir": str(output_dir),
+                    "extractor": extractor,
+                    "output_format": "json"
+                }
+                response = requests.post(f"{BASE_URL}/api/clean", json=payload)
+                self.assertEqual(response.status_code, 200)
+            for name in pages:
+                json_name = Path(name).with_suffix(".json").name
+                soup = json.loads((output_dirs["soup"] / json_name).read_text())
+                stream = json.loads((output_dirs["stream"] / json_name).read_text())
+                self.assertEqual(stream, soup, name)
+        finally:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            for output_dir in output_dirs.values():
+                shutil.rmtree(output_dir, ignore_errors=True)
+
+    def test_28_clean_in_chunks(self):
+        """Test cleaning with several workers, one file per chunk, and rejection of an invalid chunk size"""
+        input_dir = Path(tempfile.mkdtemp())
+        output_dir = Path(tempfile.mkdtemp())
+        try:
+            for n in range(5):
+                (input_dir / f"page{n}.html").write_text(f"<html><body><p>Page {n}</p></body></html>")
+            payload = {
+                "input_dir": str(input_dir),
+                "output_dir": str(output_dir),
+                "workers": 2,
+                "chunk_size": 1,
+                "output_format": "json"
+            }
+            response = requests.post(f"{BASE_URL}/api/clean", json=payload)
+            self.assertEqual(response.status_code, 200)
+            summary = response.json()["summary"]
+            self.assertEqual(summary["processed"], 5)
+            self.assertEqual(summary["failed"], 0)
+            self.assertEqual(len(list(output_dir.glob("*.json"))), 5)
+            
+            for chunk_size in (None, 0):
+                response = requests.post(f"{BASE_URL}/api/clean", json=dict(payload, chunk_size=chunk_size))
+                self.assertEqual(response.status_code, 422)
+        finally:
+            shutil.rmtree(input_dir, ignore_errors=True)
+            shutil.rmtree(output_dir, ignore_errors=True)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# configurable URL canonicalisation so equivalent URLs are fetched once
+# see https://github.com/deftio/simple-py-crawlbot
+
+from fnmatch import fnmatchcase
+from urllib.parse import urljoin, urlsplit, urlunsplit, parse_qsl, urlencode
+
+# Query parameters that only track where a visitor came from; stripped by default
+TRACKING_PARAMS = ("utm_*", "fbclid", "gclid", "dclid", "msclkid", "yclid", "mc_cid", "mc_eid", "_ga", "_gl",
+                   "ref_src", "igshid")
+TRAILING_SLASH_POLICIES = ("strip", "add", "keep")
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+def find_rel_canonical(soup):
+    """The href of the page's <link rel="canonical">, or None."""
+    for link in soup.find_all("link", href=True):
+        rel = link.get("rel") or []
+        if "canonical" in (rel if isinstance(rel, list) else rel.split()):
+            return link["href"].strip()
+    return None
+
+class UrlCanonicalizer:
+    """Map every URL to one canonical form, so URLs that name the same page are fetched once.
+
+    Rules, applied in order: drop the fragment; lower-case the scheme and (lower_host) the
+    host; drop the scheme's default port (strip_default_ports); filter the query, either
+    dropping it entirely (strip_query), keeping only parameters matching keep_params, or
+    removing those matching strip_params (shell-style patterns, TRACKING_PARAMS if None);
+    sort the remaining parameters (sort_params); and apply the trailing slash policy to the
+    path ("strip" turns /docs/ into /docs, "add" does the reverse, "keep" leaves it; the root
+    path is always /).
+
+    With rel_canonical, a page that declares <link rel="canonical"> pointing at another URL
+    on the same host makes that URL an alias of the page, so the crawler does not fetch it.
+    stats counts what was avoided: links that were new as written but canonicalised to a
+    URL already known, and declared canonical URLs that were never fetched.
+    """
+
+    def __init__(self, strip_query=False, keep_params=None, strip_params=None, sort_params=True,
+                 trailing_slash="strip", lower_host=True, strip_default_ports=True, rel_canonical=True):
+        if trailing_slash not in TRAILING_SLASH_POLICIES:
+            raise ValueError(f"Unknown trailing slash policy '{trailing_slash}', "
+                             f"expected one of: {', '.join(TRAILING_SLASH_POLICIES)}")
+        self.strip_query = strip_query
+        self.keep_params = tuple(keep_params) if keep_params else None
+        self.strip_params = TRACKING_PARAMS if strip_params is None else tuple(strip_params)
+        self.sort_params = sort_params
+        self.trailing_slash = trailing_slash
+        self.lower_host = lower_host
+        self.strip_default_ports = strip_default_ports
+        self.rel_canonical = rel_canonical
+        self.raw_seen = set()
+        self.canonical_seen = set()
+        self.aliases = {}
+        self.stats = {"links_seen": 0, "duplicate_forms": 0, "rel_canonical_aliases": 0, "rel_canonical_skipped": 0}
+
+    def _keep_param(self, name):
+        if self.keep_params is not None:
+            return any(fnmatchcase(name, pattern) for pattern in self.keep_params)
+        return not any(fnmatchcase(name, pattern) for pattern in self.strip_params)
+
+    def canonicalize(self, url, base=None):
+        """The canonical form of url (resolved against base if given); aliases are not applied."""
+        parts = urlsplit(urljoin(base, url.strip()) if base else url.strip())
+        scheme = parts.scheme.lower()
+        host = parts.hostname or ""
+        if not self.lower_host:
+            # hostname is always lower case; take the original spelling from netloc
+            netloc_host = parts.netloc.rsplit("@", 1)[-1]
+            host = netloc_host[1:].split("]", 1)[0] if netloc_host.startswith("[") else netloc_host.split(":", 1)[0]
+        if ":" in host:
+            host = f"[{host}]"
+        port = parts.port
+        netloc = host
+        if port and not (self.strip_default_ports and DEFAULT_PORTS.get(scheme) == port):
+            netloc += f":{port}"
+        if parts.username:
+            netloc = parts.username + (f":{parts.password}" if parts.password else "") + "@" + netloc
+
+        query = ""
+        if parts.query and not self.strip_query:
+            params = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True)
+                      if self._keep_param(name)]
+            if self.sort_params:
+                params.sort()
+            query = urlencode(params)
+
+        path = parts.path or "/"
+        if path != "/":
+            if self.trailing_slash == "strip":
+                path = path.rstrip("/") or "/"
+            elif self.trailing_slash == "add" and not path.endswith("/"):
+                path += "/"
+        return urlunsplit((scheme, netloc, path, query, ""))
+
+    def resolve(self, url, base=None):
+        """The URL to crawl for a link: its canonical form, followed through rel=canonical aliases."""
+        canonical = self.canonicalize(url, base)
+        return self.aliases.get(canonical, canonical)
+
+    def discover(self, url, base=None):
+        """resolve() for a link found on a page, counting the links it keeps from being fetched again."""
+        raw = url.strip()
+        raw = urljoin(base, raw) if base else raw
+        raw = raw.split("#", 1)[0]
+        resolved = self.resolve(raw)
+        if raw not in self.raw_seen:
+            self.raw_seen.add(raw)
+            self.stats["links_seen"] += 1
+            if resolved in self.canonical_seen:
+                # New as written, but the same page as a URL already known
+                self.stats["duplicate_forms"] += 1
+            else:
+                self.canonical_seen.add(resolved)
+        return resolved
+
+    def add_rel_canonical(self, page_url, href, visited=()):
+        """Record a page's declared canonical URL; returns it if it became an alias of page_url, else None.
+
+        Only same-host declarations are followed: a page cannot make the crawler skip URLs on
+        other hosts, and a canonical URL that was already crawled (in visited) keeps its own entry.
+        """
+        if not self.rel_canonical or not href:
+            return None
+        page = self.canonicalize(page_url)
+        declared = self.canonicalize(href, base=page_url)
+        if declared == page or urlsplit(declared).netloc != urlsplit(page).netloc:
+            return None
+        if declared in visited or declared in self.aliases or declared in self.aliases.values():
+            return None
+        self.aliases[declared] = page
+        self.canonical_seen.add(declared)
+        self.stats["rel_canonical_aliases"] += 1
+        return declared
+
+    def skip_alias(self, url):
+        """True if url was declared canonical by a page already crawled, so fetching it is skipped."""
+        if url in self.aliases:
+            self.stats["rel_canonical_skipped"] += 1
+            return True
+        return False
+
+    def summary(self):
+        return dict(self.stats, fetches_avoided=self.stats["duplicate_forms"] + self.stats["rel_canonical_skipped"])
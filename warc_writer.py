@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# WARC/1.1 archives of crawled pages with a sorted CDXJ index for lookups by URL
+# see https://github.com/deftio/simple-py-crawlbot
+
+import io
+import gzip
+import json
+import uuid
+import zlib
+import base64
+import time
+import hashlib
+import threading
+import requests
+from pathlib import Path
+from datetime import datetime, timezone
+from urllib.parse import urljoin, urlsplit
+
+WARC_VERSION = "WARC/1.1"
+MAX_REDIRECTS = 10
+FETCH_TIMEOUT = 30
+# How often a running crawl rewrites the .cdxj index, so pages can be looked up before close()
+INDEX_FLUSH_SECONDS = 30
+
+def sha1_digest(data):
+    return "sha1:" + base64.b32encode(hashlib.sha1(data).digest()).decode('ascii')
+
+def surt(url):
+    """Sort-friendly URL key: reversed host, then path and query, e.g. com,example)/docs?a=1."""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    key = ",".join(reversed(host.split(".")))
+    if parts.port and parts.port not in (80, 443):
+        key += f":{parts.port}"
+    path = parts.path or "/"
+    # Paths are case-sensitive on most servers, so /Docs and /docs stay distinct
+    return f"{key}){path}" + (f"?{parts.query}" if parts.query else "")
+
+def warc_timestamp(when):
+    return when.strftime("%Y%m%d%H%M%S")
+
+def parse_timestamp(timestamp):
+    """A YYYYMMDDhhmmss timestamp, or a prefix of one (e.g. 2024 or 202401), as a comparable number."""
+    if not (timestamp.isascii() and timestamp.isdigit() and len(timestamp) <= 14):
+        raise ValueError(f"Invalid timestamp '{timestamp}', expected up to 14 digits (YYYYMMDDhhmmss)")
+    return int(timestamp.ljust(14, "0"))
+
+class WarcWriter:
+    """Write request, response and rendered-DOM records for each crawled page.
+
+    The browser does not expose the raw HTTP exchange, so unless refetch is False the page is
+    fetched once more with requests and every hop of any redirect chain is archived as a request/response pair. The
+    response body is kept as sent (still content-encoded), but a chunked transfer encoding is
+    not preserved. The DOM after JavaScript ran is stored as a conversion record that refers to
+    the final response. Each record is its own gzip member, so any record can be read by seeking
+    to its offset. The sorted .cdxj index next to the archive is rewritten after the first page,
+    then at most every INDEX_FLUSH_SECONDS, and by close(); a crash loses at most that much of
+    the index, never records already written. Crawl workers may
+    call capture() at the same time: pages are fetched in parallel, and each page's records are
+    written together under the writer's lock.
+    """
+
+    def __init__(self, warc_file, software="simple-py-crawlbot", refetch=True):
+        self.warc_file = Path(warc_file)
+        self.refetch = refetch
+        self.warc_file.parent.mkdir(parents=True, exist_ok=True)
+        self.cdx_file = self.warc_file.with_name(self.warc_file.name + ".cdxj")
+        self.file = open(self.warc_file, 'ab')
+        self.index = []
+        # Held only while records are written, not while pages are fetched
+        self.lock = threading.Lock()
+        self.flushed_at = None
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = f"{software} (WARC capture)"
+        info = f"software: {software}\r\nformat: WARC File Format 1.1\r\n".encode('utf-8')
+        self._write_record("warcinfo", None, info, {"Content-Type": "application/warc-fields",
+                                                    "WARC-Filename": self.warc_file.name})
+
+    def _write_record(self, record_type, url, block, headers):
+        record_id = f"<urn:uuid:{uuid.uuid4()}>"
+        lines = [WARC_VERSION, f"WARC-Type: {record_type}", f"WARC-Record-ID: {record_id}",
+                 f"WARC-Date: {datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')}"]
+        if url:
+            lines.append(f"WARC-Target-URI: {url}")
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines += [f"WARC-Block-Digest: {sha1_digest(block)}", f"Content-Length: {len(block)}"]
+        record = ("\r\n".join(lines) + "\r\n\r\n").encode('utf-8') + block + b"\r\n\r\n"
+        offset = self.file.tell()
+        self.file.write(gzip.compress(record))
+        self.file.flush()
+        return record_id, offset, self.file.tell() - offset
+
+    def _add_index(self, url, when, offset, length, **fields):
+        fields = dict(url=url, offset=offset, length=length, filename=self.warc_file.name, **fields)
+        self.index.append(f"{surt(url)} {warc_timestamp(when)} {json.dumps(fields, sort_keys=True)}")
+
+    def capture(self, url, rendered_html=None):
+        """Archive url (following redirects) and, if given, the rendered DOM. Returns the final URL."""
+        when = datetime.now(timezone.utc)
+        exchanges = []
+        current = url
+        try:
+            for _ in range(MAX_REDIRECTS + 1 if self.refetch else 0):
+                response = self.session.get(current, stream=True, allow_redirects=False, timeout=FETCH_TIMEOUT)
+                try:
+                    body = response.raw.read(decode_content=False)
+                finally:
+                    response.close()
+                exchanges.append((current, response, body))
+                location = response.headers.get("Location")
+                if not (response.is_redirect and location):
+                    break
+                current = urljoin(current, location)
+        except requests.RequestException:
+            # Keep the rendered DOM even when the page cannot be fetched a second time
+            exchanges = []
+        with self.lock:
+            response_id = None
+            for exchange_url, response, body in exchanges:
+                response_id = self._write_exchange(exchange_url, response, body, when)
+            if rendered_html is not None:
+                block = rendered_html.encode('utf-8') if isinstance(rendered_html, str) else rendered_html
+                headers = {"Content-Type": "text/html; charset=utf-8", "WARC-Payload-Digest": sha1_digest(block)}
+                if response_id:
+                    headers["WARC-Refers-To"] = response_id
+                # Indexed under the URL the crawler asked for, which is what its page records list
+                _, offset, length = self._write_record("conversion", url, block, headers)
+                self._add_index(url, when, offset, length, type="conversion", mime="text/html", status="-")
+            if self.flushed_at is None or time.monotonic() - self.flushed_at >= INDEX_FLUSH_SECONDS:
+                self._write_index()
+        return current
+
+    def _write_exchange(self, url, response, body, when):
+        version = {10: "HTTP/1.0", 11: "HTTP/1.1"}.get(getattr(response.raw, "version", 11), "HTTP/1.1")
+        header_lines = [f"{name}: {value}" for name, value in response.raw.headers.items()
+                        if name.lower() != "transfer-encoding"]
+        http_head = "\r\n".join([f"{version} {response.status_code} {response.reason}"] + header_lines) + "\r\n\r\n"
+        block = http_head.encode('iso-8859-1') + body
+        response_id, offset, length = self._write_record("response", url, block, {
+            "Content-Type": "application/http;msgtype=response",
+            "WARC-Payload-Digest": sha1_digest(body)
+        })
+        mime = response.headers.get("Content-Type", "-").split(";")[0].strip() or "-"
+        self._add_index(url, when, offset, length, type="response", mime=mime, status=str(response.status_code),
+                        digest=sha1_digest(body))
+
+        parts = urlsplit(url)
+        request = response.request
+        request_headers = [f"Host: {parts.netloc}"] + [f"{name}: {value}" for name, value in request.headers.items()]
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        request_block = ("\r\n".join([f"{request.method} {target} HTTP/1.1"] + request_headers) + "\r\n\r\n").encode('iso-8859-1')
+        self._write_record("request", url, request_block, {
+            "Content-Type": "application/http;msgtype=request",
+            "WARC-Concurrent-To": response_id
+        })
+        return response_id
+
+    def _write_index(self):
+        # Merge with any index from an earlier run that appended to the same archive (or an earlier flush)
+        lines = set(self.index)
+        if self.cdx_file.exists():
+            lines.update(line for line in self.cdx_file.read_text(encoding='utf-8').splitlines() if line)
+        tmp_file = self.cdx_file.with_name(self.cdx_file.name + ".tmp")
+        tmp_file.write_text("".join(f"{line}\n" for line in sorted(lines)), encoding='utf-8')
+        # Readers see the old index or the new one, never a partial file
+        tmp_file.replace(self.cdx_file)
+        self.flushed_at = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+            self._write_index()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def cdx_lookup(cdx_file, url):
+    """All index entries for url as (timestamp, fields), by binary search over the sorted file."""
+    key = (surt(url) + " ").encode('utf-8')
+    matches = []
+    with open(cdx_file, 'rb') as f:
+        f.seek(0, io.SEEK_END)
+        lo, hi = 0, f.tell()
+        # Find the first line >= key; each probe looks at the first line starting after mid
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid)
+            if mid:
+                f.readline()
+            line = f.readline()
+            if line and line < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        f.seek(lo)
+        if lo:
+            f.readline()
+        for line in f:
+            if not line.startswith(key):
+                break
+            _, timestamp, fields = line.decode('utf-8').rstrip("\n").split(" ", 2)
+            matches.append((timestamp, json.loads(fields)))
+    return matches
+
+def find_capture(cdx_file, url, timestamp=None, record_type="response"):
+    """The index entry of the capture of url closest to timestamp (latest if None), or None."""
+    captures = [(ts, fields) for ts, fields in cdx_lookup(cdx_file, url) if fields.get("type") == record_type]
+    if not captures:
+        return None
+    if not timestamp:
+        return max(captures, key=lambda capture: capture[0])
+    target = parse_timestamp(timestamp)
+    return min(captures, key=lambda capture: abs(int(capture[0]) - target))
+
+def read_record(warc_file, offset, length):
+    """Read one record: returns (warc_headers, block)."""
+    with open(warc_file, 'rb') as f:
+        f.seek(offset)
+        record = gzip.decompress(f.read(length))
+    head, _, rest = record.partition(b"\r\n\r\n")
+    headers = {}
+    for line in head.decode('utf-8').split("\r\n")[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    return headers, rest[:int(headers.get("Content-Length", len(rest)))]
+
+def parse_http_response(block):
+    """Split an archived HTTP response into (status, headers, body), undoing any content encoding."""
+    head, _, body = block.partition(b"\r\n\r\n")
+    lines = head.decode('iso-8859-1').split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    encoding = headers.get("content-encoding", "").lower()
+    if encoding in ("gzip", "x-gzip"):
+        body = gzip.decompress(body)
+    elif encoding == "deflate":
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+    return status, headers, body
@@ -3,11 +3,14 @@
 
 import os
 import json
-import yaml
 import argparse
 import sys
 import logging
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from structured_io import (CORPUS_FILENAME, JsonLinesWriter, copy_jsonl_records, encode_record,
+                           find_structured_files, format_of, iter_records)
+from manifest import Manifest
 
 # Configure logging
 def setup_logging():
@@ -41,8 +44,63 @@ def setup_logging():
 # Initialize logging
 logger = setup_logging()
 
-def convert_yaml_to_json(input_dir, output_dir):
-    """Convert YAML files to JSON format"""
+def json_path_for(source, structured_file, input_path, output_path):
+    """Output JSON path for a record, mirroring its source's location relative to the input directory."""
+    if format_of(structured_file) == "jsonl":
+        # Corpus records carry the relative path of the page they came from
+        rel_path = Path(source)
+        if rel_path.is_absolute() or ".." in rel_path.parts:
+            rel_path = Path(rel_path.name)
+        rel_path = structured_file.parent.relative_to(input_path) / rel_path
+    else:
+        rel_path = structured_file.relative_to(input_path)
+    return output_path / rel_path.with_suffix('.json')
+
+def convert_structured_chunk(structured_files, input_dir, output_dir, corpus=False):
+    """Convert a chunk of structured files, returning (file, written_files, corpus_lines, error) for each.
+
+    In corpus mode nothing is written here; records are returned as encoded JSON lines so the parent
+    can append them to a single file. This is the unit of work sent to pool workers.
+    """
+    input_path = Path(input_dir)
+    output_path = Path(output_dir)
+    results = []
+    for structured_file in structured_files:
+        structured_file = Path(structured_file)
+        written = []
+        lines = []
+        try:
+            logger.info(f"Processing file: {structured_file}")
+            for source, content in iter_records(structured_file):
+                if corpus:
+                    # Keep where the record came from: the page for corpus records, otherwise the file itself
+                    rel_file = str(structured_file.relative_to(input_path))
+                    record_source = source if format_of(structured_file) == "jsonl" else rel_file
+                    lines.append(encode_record(record_source, content, file=rel_file))
+                    continue
+                output_file = json_path_for(source, structured_file, input_path, output_path)
+                output_file.parent.mkdir(parents=True, exist_ok=True)
+                
+                # Write the JSON file
+                with open(output_file, 'w', encoding='utf-8') as f:
+                    json.dump(content, f, indent=2, ensure_ascii=False)
+                written.append(str(output_file))
+                logger.info(f"Successfully converted and saved: {output_file}")
+            results.append((str(structured_file), written, lines, None))
+        except Exception as e:
+            logger.error(f"Error processing file {structured_file}: {str(e)}")
+            results.append((str(structured_file), written, [], f"{type(e).__name__}: {e}"))
+    return results
+
+def convert_yaml_to_json(input_dir, output_dir, force=False, workers=1, chunk_size=64, corpus=False):
+    """Convert YAML files (and the other structured formats from clean_and_strip.py) to JSON format.
+
+    Reads .yaml/.yml (with libyaml's C loader when available), .json, .msgpack and JSON Lines corpora.
+    Each record becomes its own JSON file, or with corpus=True one line of output_dir/corpus.jsonl
+    carrying its source path. workers > 1 converts chunks of files in a process pool (0 = all CPUs).
+    A manifest in output_dir lets unchanged inputs be skipped and outputs of deleted inputs be removed;
+    force converts everything. Returns a summary of converted, skipped, removed and failed files.
+    """
     try:
         logger.info(f"Starting YAML to JSON conversion from {input_dir} to {output_dir}")
         
@@ -51,35 +109,73 @@ def convert_yaml_to_json(input_dir, output_dir):
         output_path.mkdir(parents=True, exist_ok=True)
         logger.info(f"Created output directory: {output_dir}")
         
-        # Process each YAML file
+        # Find structured files, leaving out our own corpus if it lives under the input directory
         input_path = Path(input_dir)
-        yaml_files = list(input_path.glob("**/*.yaml"))
-        logger.info(f"Found {len(yaml_files)} YAML files to process")
+        corpus_path = output_path / CORPUS_FILENAME
+        structured_files = [f for f in find_structured_files(input_path)
+                            if not (corpus and f.resolve() == corpus_path.resolve())]
+        logger.info(f"Found {len(structured_files)} structured files to process")
         
-        for yaml_file in yaml_files:
-            try:
-                logger.info(f"Processing file: {yaml_file}")
-                
-                # Read the YAML file
-                with open(yaml_file, 'r', encoding='utf-8') as f:
-                    yaml_content = yaml.safe_load(f)
-                
-                # Create output file path
-                rel_path = yaml_file.relative_to(input_path)
-                output_file = output_path / rel_path.with_suffix('.json')
-                output_file.parent.mkdir(parents=True, exist_ok=True)
-                
-                # Write the JSON file
-                with open(output_file, 'w', encoding='utf-8') as f:
-                    json.dump(yaml_content, f, indent=2, ensure_ascii=False)
-                
-                logger.info(f"Successfully converted and saved: {output_file}")
-                
-            except Exception as e:
-                logger.error(f"Error processing file {yaml_file}: {str(e)}")
-                continue
+        manifest = Manifest(output_path, "convert", {"input_dir": str(input_path.resolve()), "corpus": corpus}, force)
+        if corpus and not corpus_path.exists():
+            manifest.entries = {}
+        sources = {str(structured_file.relative_to(input_path)): structured_file for structured_file in structured_files}
+        removed = manifest.prune(sources)
+        pending = [structured_file for key, structured_file in sources.items() if not manifest.is_current(key, structured_file)]
+        summary = {"total": len(structured_files), "converted": 0, "skipped": len(structured_files) - len(pending),
+                   "removed": len(removed), "failed": 0}
+        
+        writer = None
+        if corpus and (pending or removed):
+            # Rewrite the corpus: keep records of unchanged files, then append the converted ones
+            writer = JsonLinesWriter(corpus_path.with_name(CORPUS_FILENAME + ".tmp"))
+            pending_keys = {str(structured_file.relative_to(input_path)) for structured_file in pending}
+            copy_jsonl_records(corpus_path, writer, set(sources) - pending_keys, field="file")
+        
+        def collect(chunk_results):
+            for structured_file, written, lines, error in chunk_results:
+                key = str(Path(structured_file).relative_to(input_path))
+                if error:
+                    manifest.forget(key)
+                    summary["failed"] += 1
+                    continue
+                for line in lines:
+                    writer.write_line(line)
+                # A corpus that lost records leaves stale JSON files behind; remove them
+                for stale in set(manifest.outputs(key)) - set(written):
+                    if os.path.exists(stale):
+                        os.remove(stale)
+                manifest.record(key, structured_file, written)
+                summary["converted"] += 1
+        
+        if workers is not None and workers <= 0:
+            workers = os.cpu_count() or 1
+        chunk_size = max(1, chunk_size)
+        try:
+            if not workers or workers == 1 or len(pending) <= chunk_size:
+                collect(convert_structured_chunk(pending, input_path, output_path, corpus))
+            else:
+                logger.info(f"Converting in {workers} worker processes, {chunk_size} files per chunk")
+                chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    futures = {executor.submit(convert_structured_chunk, chunk, input_path, output_path, corpus): chunk
+                               for chunk in chunks}
+                    for future in as_completed(futures):
+                        try:
+                            collect(future.result())
+                        except Exception as e:
+                            # A worker died (e.g. killed by the OS); count the whole chunk as failed
+                            logger.error(f"Worker failed on a chunk of {len(futures[future])} files: {str(e)}")
+                            collect((str(f), [], [], f"{type(e).__name__}: {e}") for f in futures[future])
+        finally:
+            if writer:
+                writer.close()
+                os.replace(writer.filename, corpus_path)
+            manifest.save()
         
-        logger.info("YAML to JSON conversion completed")
+        logger.info(f"YAML to JSON conversion completed: {summary['converted']} converted, "
+                    f"{summary['skipped']} unchanged, {summary['removed']} removed, {summary['failed']} failed")
+        return summary
         
     except Exception as e:
         logger.error(f"Error in convert_yaml_to_json: {str(e)}")
@@ -90,23 +186,20 @@ def main():
     parser = argparse.ArgumentParser(description="Convert YAML files to JSON.")
     parser.add_argument("input_dir", help="Directory containing YAML files to convert")
     parser.add_argument("output_dir", help="Directory to store converted JSON files")
+    parser.add_argument("--force", action="store_true", help="Convert every file, ignoring the manifest of previous runs")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes to convert with (0 = all CPUs, default 1)")
+    parser.add_argument("--chunk_size", type=int, default=64, help="Files sent to a worker at a time")
+    parser.add_argument("--corpus", action="store_true", help=f"Write a single {CORPUS_FILENAME} with source paths instead of one JSON file per record")
     
     # Parse arguments
     args = parser.parse_args()
 
     # Call the function with the provided arguments
-    convert_yaml_to_json(args.input_dir, args.output_dir)
-
-if __name__ == "__main__":
-    if len(sys.argv) != 3:
-        logger.error("Usage: python yaml_to_json.py <input_dir> <output_dir>")
-        sys.exit(1)
-    
-    input_dir = sys.argv[1]
-    output_dir = sys.argv[2]
-    
     try:
-        convert_yaml_to_json(input_dir, output_dir)
+        convert_yaml_to_json(args.input_dir, args.output_dir, args.force, args.workers, args.chunk_size, args.corpus)
     except Exception as e:
         logger.error(f"Script failed: {str(e)}")
         sys.exit(1)
+
+if __name__ == "__main__":
+    main()